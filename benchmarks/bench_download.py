@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Download throughput benchmark.
+
+Drives `Downloader.run` against the local stand-in tile server and reports
+tiles/s, p50/p99 request latency, peak RSS and CPU time per tile:
+
+    python benchmarks/bench_download.py --tiles 2000 --workers 32 --latency-ms 30
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from tile_server import StandInTileServer, TileServerConfig  # noqa: E402
+
+from tilegrab.downloader import DownloadConfig, Downloader  # noqa: E402
+from tilegrab.sources import TileSource  # noqa: E402
+from tilegrab.tiles import TileIndex, TilesByIndex  # noqa: E402
+
+
+class BenchSource(TileSource):
+    name = "Bench"
+    description = "Stand-in tile server"
+    uid = "bench"
+
+    def __init__(self, url_template: str):
+        super().__init__()
+        self.url_template = url_template
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def peak_rss_mb(who: str = "self") -> float:
+    """Peak RSS of this process, or with `who="children"` of its largest finished child."""
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if who == "children" else resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process plus every child it has waited for (pool workers once shut down)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def tile_block(count: int, zoom: int = 16, origin: int = 1000) -> List[TileIndex]:
+    side = math.ceil(math.sqrt(count))
+    return [
+        TileIndex(x=origin + i % side, y=origin + i // side, z=zoom)
+        for i in range(count)
+    ]
+
+
+def run_once(args, url_template: str) -> dict:
+    source = BenchSource(url_template)
+    tiles = TilesByIndex(tile_block(args.tiles), tile_source=source, safe_limit=args.tiles)
+    config = DownloadConfig(
+        timeout=args.timeout,
+        decode_workers=args.decode_workers,
+        processes=args.processes,
+        retry_attempts=args.retries,
+        retry_delay=0,
+        save_images=args.save,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dl = Downloader(tile_collection=tiles, config=config, tile_dir=Path(tmp), resume=False)
+        # client-side latency of every tile request, urllib3 retries included
+        latencies: List[float] = []
+        dl.metrics.subscribe(
+            lambda result, metrics: latencies.append(result.elapsed) if result.elapsed else None)
+
+        # download and decode pools are shut down inside `run`, so their CPU time is included
+        cpu0, wall0 = cpu_seconds(), time.perf_counter()
+        result = dl.run(workers=args.workers, show_progress=False, parallel_download=args.workers != 1)
+        cpu, wall = cpu_seconds() - cpu0, time.perf_counter() - wall0
+
+    return {
+        "tiles": len(tiles),
+        "downloaded": len(result),
+        "requests": len(latencies),
+        "http_retries": dl.metrics.retries_total,
+        "seconds": round(wall, 3),
+        "tiles_per_s": round(len(result) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "cpu_ms_per_tile": round(cpu * 1000 / max(len(result), 1), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        # pool processes run side by side, each up to this size
+        "child_processes": args.processes + args.decode_workers,
+        "child_peak_rss_mb": round(peak_rss_mb("children"), 1) if args.processes or args.decode_workers else 0.0,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="tilegrab download throughput benchmark")
+    p.add_argument("--tiles", type=int, default=1000)
+    p.add_argument("--workers", type=int, default=16, help="Download threads (1 = sequential)")
+    p.add_argument("--processes", type=int, default=0, help="Download processes, each with --workers threads")
+    p.add_argument("--decode-workers", type=int, default=0)
+    p.add_argument("--retries", type=int, default=2)
+    p.add_argument("--timeout", type=float, default=15.0)
+    p.add_argument("--save", action=argparse.BooleanOptionalAction, default=True, help="Write tiles to disk")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--latency-jitter-ms", type=float, default=10.0)
+    p.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--throttle-rate", type=float, default=0.0)
+    p.add_argument("--tile-bytes", type=int, default=20_000)
+    p.add_argument("--format", choices=["png", "jpeg"], default="png")
+    p.add_argument("--json", type=Path, default=None, help="Also write the results to this file")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    server_cfg = TileServerConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        latency_dist=args.latency_dist,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        tile_bytes=args.tile_bytes,
+        format=args.format,
+    )
+
+    runs = []
+    with StandInTileServer(server_cfg) as server:
+        for i in range(args.repeat):
+            r = run_once(args, server.url_template)
+            runs.append(r)
+            rss = f"{r['peak_rss_mb']:>6} MB"
+            if r["child_processes"]:
+                rss += f" + {r['child_processes']}x{r['child_peak_rss_mb']} MB"
+            print(
+                f"run {i + 1}/{args.repeat}: {r['tiles_per_s']:>8} tiles/s  "
+                f"p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>7} ms  "
+                f"cpu {r['cpu_ms_per_tile']:>6} ms/tile  rss {rss}  "
+                f"({r['downloaded']}/{r['tiles']} tiles, {r['http_retries']} http retries)"
+            )
+
+    best = max(runs, key=lambda r: r["tiles_per_s"])
+    report = {
+        "server": asdict(server_cfg),
+        "client": {"workers": args.workers, "processes": args.processes, "decode_workers": args.decode_workers, "save": args.save},
+        "cpus": os.cpu_count(),
+        "runs": runs,
+        "best": best,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local stand-in tile server for download benchmarks.
+
+Serves synthetic PNG/JPEG tiles on /{z}/{x}/{y} with a configurable latency
+distribution, error rate, 429 throttling and payload size. Run standalone
+with `python benchmarks/tile_server.py --port 8000`, or start it in a child
+process from a benchmark with `StandInTileServer`.
+"""
+import argparse
+import logging
+import math
+import multiprocessing as mp
+import random
+import re
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import List, Optional
+
+from PIL import Image, PngImagePlugin
+
+logger = logging.getLogger(__name__)
+
+_PATH_RE = re.compile(r"^/(\d+)/(\d+)/(\d+)(?:\.\w+)?$")
+
+# JPEG comment segments are capped at 64KB
+_MAX_JPEG_PADDING = 65000
+
+
+@dataclass(frozen=True, slots=True)
+class TileServerConfig:
+    latency_ms: float = 20.0
+    latency_jitter_ms: float = 10.0
+    latency_dist: str = "lognormal"  # fixed | uniform | lognormal
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 0
+    tile_bytes: int = 20_000
+    format: str = "png"  # png | jpeg
+    variants: int = 16
+    seed: int = 0
+
+
+def synthetic_tiles(cfg: TileServerConfig) -> List[bytes]:
+    """Pre-render a few tile payloads of roughly `cfg.tile_bytes` each."""
+    rnd = random.Random(cfg.seed)
+    payloads = []
+    for _ in range(cfg.variants):
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        img = Image.new("RGB", (256, 256), color=color)
+        buf = BytesIO()
+
+        if cfg.format == "jpeg":
+            img.save(buf, format="JPEG", quality=85)
+            padding = min(max(cfg.tile_bytes - buf.tell(), 0), _MAX_JPEG_PADDING)
+            if padding:
+                buf = BytesIO()
+                img.save(buf, format="JPEG", quality=85, comment=rnd.randbytes(padding))
+        else:
+            img.save(buf, format="PNG")
+            padding = max(cfg.tile_bytes - buf.tell(), 0)
+            if padding:
+                info = PngImagePlugin.PngInfo()
+                info.add_text("pad", "".join(rnd.choices("0123456789abcdef", k=padding)))
+                buf = BytesIO()
+                img.save(buf, format="PNG", pnginfo=info)
+
+        payloads.append(buf.getvalue())
+    return payloads
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "TileHTTPServer"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        m = _PATH_RE.match(self.path)
+        if not m:
+            self._send(404, b"not found", "text/plain")
+            return
+
+        srv = self.server
+        time.sleep(srv.latency())
+
+        roll = srv.rnd.random()
+        if roll < srv.cfg.throttle_rate:
+            self._send(429, b"throttled", "text/plain", {"Retry-After": str(srv.cfg.retry_after)})
+            return
+        if roll < srv.cfg.throttle_rate + srv.cfg.error_rate:
+            self._send(503, b"unavailable", "text/plain")
+            return
+
+        z, x, y = map(int, m.groups())
+        payload = srv.payloads[hash((z, x, y)) % len(srv.payloads)]
+        self._send(200, payload, f"image/{srv.cfg.format}")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TileHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, cfg: TileServerConfig):
+        super().__init__(address, TileRequestHandler)
+        self.cfg = cfg
+        self.rnd = random.Random(cfg.seed)
+        self.payloads = synthetic_tiles(cfg)
+
+    def latency(self) -> float:
+        mean, jitter = self.cfg.latency_ms, self.cfg.latency_jitter_ms
+        if self.cfg.latency_dist == "fixed" or mean <= 0:
+            ms = mean
+        elif self.cfg.latency_dist == "uniform":
+            ms = self.rnd.uniform(mean - jitter, mean + jitter)
+        else:
+            # lognormal with the given mean and (approximate) standard deviation
+            sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+            ms = self.rnd.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return max(ms, 0) / 1000
+
+
+def _serve(cfg: TileServerConfig, port: int, ready):
+    httpd = TileHTTPServer(("127.0.0.1", port), cfg)
+    ready.send(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+class StandInTileServer:
+    """Runs `TileHTTPServer` in a child process so it does not share our GIL."""
+
+    def __init__(self, cfg: TileServerConfig, port: int = 0):
+        self.cfg = cfg
+        self.port = port
+        self._proc: Optional[mp.Process] = None
+
+    def __enter__(self) -> "StandInTileServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url_template(self) -> str:
+        return f"http://127.0.0.1:{self.port}/{{z}}/{{x}}/{{y}}.{self.cfg.format}"
+
+    def start(self):
+        parent, child = mp.Pipe()
+        self._proc = mp.Process(target=_serve, args=(self.cfg, self.port, child), daemon=True)
+        self._proc.start()
+        self.port = parent.recv()
+        logger.info(f"Stand-in tile server listening on 127.0.0.1:{self.port}")
+
+    def stop(self):
+        if self._proc:
+            self._proc.terminate()
+            self._proc.join()
+            self._proc = None
+
+
+def main():
+    p = argparse.ArgumentParser(description="Stand-in tile server for benchmarks")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--latency-jitter-ms", type=float, default=10.0)
+    p.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--throttle-rate", type=float, default=0.0)
+    p.add_argument("--tile-bytes", type=int, default=20_000)
+    p.add_argument("--format", choices=["png", "jpeg"], default="png")
+    args = p.parse_args()
+
+    cfg = TileServerConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        latency_dist=args.latency_dist,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        tile_bytes=args.tile_bytes,
+        format=args.format,
+    )
+    httpd = TileHTTPServer(("127.0.0.1", args.port), cfg)
+    print(f"Serving synthetic tiles on http://127.0.0.1:{httpd.server_address[1]}/{{z}}/{{x}}/{{y}}")
+    httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+from .base import TileCache
+from .disk import DiskTileCache
+from .memory import MemoryTileCache
+
+__all__ = ["TileCache", "DiskTileCache", "MemoryTileCache"]
@@ -0,0 +1,38 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from tilegrab.tiles import TileIndex
+
+
+class TileCache(ABC):
+    """Encoded tile bytes keyed by `TileSource.uid` + z/x/y."""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def _get(self, source_id: str, index: TileIndex) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, source_id: str, index: TileIndex, data: bytes):
+        raise NotImplementedError
+
+    def get(self, source_id: str, index: TileIndex) -> Optional[bytes]:
+        data = self._get(source_id, index)
+        with self._stats_lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        pass
@@ -0,0 +1,140 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from tilegrab.tiles import TileIndex
+
+from .base import TileCache
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    source TEXT NOT NULL,
+    z INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (source, z, x, y)
+);
+CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed);
+CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO usage (id, bytes) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS tiles_ins AFTER INSERT ON tiles
+    BEGIN UPDATE usage SET bytes = bytes + NEW.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS tiles_del AFTER DELETE ON tiles
+    BEGIN UPDATE usage SET bytes = bytes - OLD.size WHERE id = 0; END;
+"""
+
+
+class DiskTileCache(TileCache):
+    """
+    Persistent tile cache shared across jobs and AOIs, stored in one SQLite
+    database. Entries older than `ttl` seconds are treated as misses, and the
+    least recently used entries are evicted once `max_bytes` is exceeded.
+    """
+
+    _NAME = "tiles.tilegrab.sqlite"
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        super().__init__()
+        path = Path(path)
+        if path.is_dir() or path.suffix == "":
+            path.mkdir(parents=True, exist_ok=True)
+            path = path / self._NAME
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        logger.info(f"Tile cache opened at {self.path} ({self.size_bytes / 1e6:.1f} MB)")
+
+    def _get(self, source_id: str, index: TileIndex) -> Optional[bytes]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data, created FROM tiles WHERE source=? AND z=? AND x=? AND y=?",
+                (source_id, index.z, index.x, index.y),
+            ).fetchone()
+            if row is None:
+                return None
+
+            data, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM tiles WHERE source=? AND z=? AND x=? AND y=?",
+                    (source_id, index.z, index.x, index.y))
+                return None
+
+            self._conn.execute(
+                "UPDATE tiles SET accessed=? WHERE source=? AND z=? AND x=? AND y=?",
+                (now, source_id, index.z, index.x, index.y))
+            return bytes(data)
+
+    def put(self, source_id: str, index: TileIndex, data: bytes):
+        now = time.time()
+        with self._lock, self._conn:
+            # DELETE + INSERT rather than REPLACE so the usage triggers fire
+            self._conn.execute(
+                "DELETE FROM tiles WHERE source=? AND z=? AND x=? AND y=?",
+                (source_id, index.z, index.x, index.y))
+            self._conn.execute(
+                "INSERT INTO tiles (source, z, x, y, data, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_id, index.z, index.x, index.y, sqlite3.Binary(data), len(data), now, now))
+            self._evict()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        (used,) = self._conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()
+        excess = used - self.max_bytes
+        if excess <= 0:
+            return
+
+        victims = []
+        for rowid, size in self._conn.execute("SELECT rowid, size FROM tiles ORDER BY accessed"):
+            victims.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM tiles WHERE rowid = ?", victims)
+        evicted = len(victims)
+
+        if evicted:
+            logger.debug(f"Evicted {evicted} tiles from {self.path}")
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            (used,) = self._conn.execute("SELECT bytes FROM usage WHERE id = 0").fetchone()
+        return used
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()
+        return count
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats, 'bytes': self.size_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
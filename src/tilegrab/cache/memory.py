@@ -0,0 +1,149 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+from tilegrab.tiles import TileIndex
+
+from .base import TileCache
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[str, int, int, int]
+
+# modes whose pixels round-trip through a NumPy array without a palette
+_ARRAY_MODES = {"L", "RGB", "RGBA"}
+
+_shared: Optional["MemoryTileCache"] = None
+_shared_lock = threading.Lock()
+
+
+class MemoryTileCache(TileCache):
+    """
+    Byte-budgeted in-process LRU of encoded tiles and, optionally, decoded
+    pixels. With a `backing` cache (e.g. `DiskTileCache`) it reads and writes
+    through, so hot tiles are served from RAM and the rest from disk.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_image_bytes: int = 0,
+        backing: Optional[TileCache] = None,
+    ):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.max_image_bytes = max_image_bytes
+        self.backing = backing
+
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[_Key, bytes]" = OrderedDict()
+        self._images: "OrderedDict[_Key, np.ndarray]" = OrderedDict()
+        self.bytes = 0
+        self.image_bytes = 0
+        self.evictions = 0
+        self.image_hits = 0
+        self.image_misses = 0
+
+    @classmethod
+    def shared(cls, **kwargs) -> "MemoryTileCache":
+        """The process-wide instance; created with `kwargs` on first use."""
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = cls(**kwargs)
+            return _shared
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, source_id: str, index: TileIndex) -> Optional[bytes]:
+        key = (source_id, index.z, index.x, index.y)
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                return data
+
+        if self.backing is None:
+            return None
+        data = self.backing.get(source_id, index)
+        if data is not None:
+            self._put(key, data)
+        return data
+
+    def put(self, source_id: str, index: TileIndex, data: bytes):
+        self._put((source_id, index.z, index.x, index.y), data)
+        if self.backing is not None:
+            self.backing.put(source_id, index, data)
+
+    def _put(self, key: _Key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = data
+            self.bytes += len(data)
+
+            while self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_image(self, source_id: str, index: TileIndex) -> Optional[PILImage.Image]:
+        """A new image over the cached pixels; changing it never changes the cache."""
+        key = (source_id, index.z, index.x, index.y)
+        with self._lock:
+            pixels = self._images.get(key)
+            if pixels is None:
+                self.image_misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.image_hits += 1
+        return PILImage.fromarray(pixels)
+
+    def put_image(self, source_id: str, index: TileIndex, img: PILImage.Image):
+        if img.mode not in _ARRAY_MODES:
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+        if img.width * img.height * len(img.getbands()) > self.max_image_bytes:
+            return
+        # a read-only copy, so no caller can change the pixels handed to the next one
+        pixels = np.array(img)
+        pixels.flags.writeable = False
+
+        key = (source_id, index.z, index.x, index.y)
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self.image_bytes -= old.nbytes
+            self._images[key] = pixels
+            self.image_bytes += pixels.nbytes
+
+            while self.image_bytes > self.max_image_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.image_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._images.clear()
+            self.bytes = self.image_bytes = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            **super().stats,
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+            'imageHits': self.image_hits,
+            'imageMisses': self.image_misses,
+            'imageBytes': self.image_bytes,
+        }
+
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 import logging
 import argparse
+import sys
 from pathlib import Path
-from typing import List
-from tilegrab.downloader import Downloader, DownloadConfig
+from typing import List, Optional
+from tilegrab.downloader import Downloader, DownloadConfig, MetricsReporter
 from tilegrab.images import TileImageCollection, ExportType
 
 from tilegrab.logs import setup_logging
@@ -55,15 +56,27 @@ def parse_args() -> argparse.Namespace:
     tile_group.add_argument(
         "--key", type=str, default=None, help="API key where required by source"
     )
+    tile_source_group.add_argument(
+        "--scale", type=int, choices=[1, 2], default=1,
+        help="Request @2x (512px) tiles one zoom level lower, for the same resolution with 4x fewer requests; --google_sat only (default: 1)"
+    )
 
     # Create a named group for merged output format
     mosaic_out_group = p.add_argument_group(
-        title="Mosaic export formats", description="Formats for the output mosaic image"
+        title="Mosaic export formats", description="Formats for the output mosaic image; any combination can be given"
+    )
+    # any combination; the PNG, JPG and TIFF outputs are encoded concurrently from one mosaic
+    mosaic_out_group.add_argument("--jpg", action="store_true", help="JPG image; no geo-reference")
+    mosaic_out_group.add_argument("--png", action="store_true", help="PNG image; no geo-reference")
+    mosaic_out_group.add_argument("--tiff", action="store_true", help="GeoTiff image; with geo-reference")
+    mosaic_out_group.add_argument("--cog", action="store_true", help="Cloud-Optimized GeoTiff; tiled, compressed, with overviews")
+    mosaic_out_group.add_argument("--vrt", action="store_true", help="GDAL VRT referencing the saved tiles; no pixel copies")
+    mosaic_out_group.add_argument(
+        "--compress", type=str.upper, choices=["DEFLATE", "JPEG", "WEBP"], default="DEFLATE", help="COG compression (default: DEFLATE)"
+    )
+    mosaic_out_group.add_argument(
+        "--world-files", action="store_true", help="With --vrt, also write a world file (EPSG:3857) next to each tile"
     )
-    mosaic_group = mosaic_out_group.add_mutually_exclusive_group(required=False)
-    mosaic_group.add_argument("--jpg", action="store_true", help="JPG image; no geo-reference")
-    mosaic_group.add_argument("--png", action="store_true", help="PNG image; no geo-reference")
-    mosaic_group.add_argument("--tiff", action="store_true", help="GeoTiff image; with geo-reference")
     # mosaic_group.set_defaults(tiff=True)
 
     # other options
@@ -74,6 +87,14 @@ def parse_args() -> argparse.Namespace:
         default=Path.cwd() / "saved_tiles",
         help="Output directory for downloaded tiles (default: ./saved_tiles)",
     )
+    p.add_argument(
+        "--tile-store", type=str, choices=["dir", "mbtiles", "pmtiles"], default="dir",
+        help="Keep tiles as files, or in a tiles.mbtiles / tiles.pmtiles container in --tiles-out (default: dir)"
+    )
+    p.add_argument(
+        "--tile-layout", type=str, choices=["flat", "zxy", "hashed"], default="flat",
+        help="File layout of a dir tile store: z_x_y.ext, z/x/y.ext or hashed ab/cd/z_x_y.ext (default: flat)"
+    )
     p.add_argument(
         "--out",
         type=Path,
@@ -90,16 +111,69 @@ def parse_args() -> argparse.Namespace:
     #     action="store_true",
     #     help="Resume the previous download; do not overwrite",
     # )
+    p.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Download every tile again, including ones saved by an earlier run; only tiles whose content changed count as updated",
+    )
+    p.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Update an existing --tiff/--cog mosaic in place with only the tiles changed since it was written",
+    )
+    p.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Only download the tiles recorded as failed in --tiles-out by a previous run",
+    )
+    p.add_argument(
+        "--retries", type=int, default=2, help="Requeue failed tiles this many times at the end of a pass (default: 2)"
+    )
+    p.add_argument(
+        "--progress-interval", type=float, default=1.0, help="Seconds between progress commits; 0 writes every tile synchronously (default: 1)"
+    )
+    p.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="Only download shard I/N (1-based) of the tiles, into <tiles-out>/shard-I-of-N",
+    )
+    p.add_argument(
+        "--merge-shards",
+        action="store_true",
+        help="Merge the shard manifests in --tiles-out and mosaic from them; do not download",
+    )
     p.add_argument(
         "--mosaic-only",
         action="store_true",
         help="Only mosaic tiles; do not download",
     )
     p.add_argument(
-        "--group-tiles", type=str, default=None, help="Mosaic tiles but according to given WxH into ./grouped_tiles"
+        "--group-tiles", type=str, default=None, help="Mosaic tiles in groups of WxH tiles, one file per group, into <out>/groups"
+    )
+    p.add_argument(
+        "--group-overlap", action="store_true", help="Each group also takes the first tile column and row of the next group"
+    )
+    p.add_argument(
+        "--band-size", type=int, default=8, help="Tile rows held in memory at once when writing a GeoTIFF (default: 8)"
+    )
+    p.add_argument(
+        "--mosaic-workers", type=int, default=None, help="Threads decoding tiles into the mosaic (default: all CPUs)"
+    )
+    p.add_argument(
+        "--mosaic-processes", type=int, default=0,
+        help="Decode tiles into a shared-memory mosaic with N processes instead of threads (default: 0, threads)"
+    )
+    p.add_argument(
+        "--encode-profile", type=str, choices=["fast", "default", "small"], default="default",
+        help="Encoder settings for PNG/JPG/GeoTiff output: fast, default or small files (default: default)"
     )
     p.add_argument(
-        "--group-overlap", action="store_true", help="Overlap with the next consecutive tile when grouping"
+        "--encode-workers", type=int, default=None, help="Processes encoding output files concurrently (default: all CPUs)"
+    )
+    p.add_argument(
+        "--pyramid", type=int, default=None, metavar="MIN_ZOOM",
+        help="Derive lower zoom levels down to MIN_ZOOM from the downloaded tiles by 2x2 downsampling; no extra downloads"
     )
     p.add_argument(
         "--tile-limit", type=int, default=250, help="Override maximum tile limit that can download (use with caution)"
@@ -107,6 +181,12 @@ def parse_args() -> argparse.Namespace:
     p.add_argument(
         "--workers", type=int, default=None, help="Max number of threads to use when parallel downloading"
     )
+    p.add_argument(
+        "--processes", type=int, default=0, help="Spread downloads over N processes, each with its own --workers threads (default: 0, single process)"
+    )
+    p.add_argument(
+        "--decode-workers", type=int, default=0, help="Decode and validate tiles in a pool of N processes (default: 0, decode in place)"
+    )
     p.add_argument(
         "--parallel",
         action=argparse.BooleanOptionalAction,
@@ -119,15 +199,80 @@ def parse_args() -> argparse.Namespace:
         default=True, 
         help="Show/hide tile download progress bar (default: show)"
     )
+    p.add_argument(
+        "--cache-dir", type=Path, default=None, help="Shared tile cache consulted before downloading and filled afterwards"
+    )
+    p.add_argument(
+        "--cache-ttl", type=float, default=None, help="Re-download cached tiles older than this many hours"
+    )
+    p.add_argument(
+        "--cache-size", type=int, default=None, help="Evict least recently used cached tiles beyond this many MB"
+    )
+    p.add_argument(
+        "--metrics-json", type=Path, default=None, help="Periodically write download metrics as JSON to this file"
+    )
+    p.add_argument(
+        "--metrics-prom", type=Path, default=None, help="Periodically write download metrics as a Prometheus textfile"
+    )
+    p.add_argument(
+        "--metrics-interval", type=float, default=10.0, help="Seconds between metrics snapshots (default: 10)"
+    )
     p.add_argument("--quiet", action="store_true", help="Hide all prints")
     p.add_argument("--debug", action="store_true", help="Enable debug logging")
     return p.parse_args()
 
+def parse_serve_args(argv: List[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="tilegrab serve",
+        description="Serve /{source}/{z}/{x}/{y} over local HTTP, fetching upstream only on a miss"
+    )
+    p.add_argument("--tiles-out", type=Path, default=Path("./saved_tiles"), help="Tile store; tiles are kept under <tiles-out>/<source>/ (default: ./saved_tiles)")
+    p.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    p.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    p.add_argument("--key", type=str, default=None, help="API key for restricted sources")
+    p.add_argument("--max-upstream", type=int, default=8, help="Maximum concurrent upstream requests (default: 8)")
+    p.add_argument("--quiet", action="store_true", help="Hide all prints")
+    p.add_argument("--debug", action="store_true", help="Enable debug logging")
+    return p.parse_args(argv)
+
+def serve_main(argv: List[str]):
+    args = parse_serve_args(argv)
+    setup_logging(not args.quiet, True, logging.DEBUG if args.debug else logging.INFO)
+
+    from tilegrab.server import serve
+    serve(args.tiles_out, host=args.host, port=args.port, api_key=args.key, max_upstream=args.max_upstream)
+
+def update_mosaic(images: TileImageCollection, path: Path, tiles_out: Path, workers: Optional[int]) -> bool:
+    """
+    Patch the mosaic at `path` with the tiles whose content changed since it
+    was last written. Returns False when there is no mosaic to update or the
+    tiles no longer fit it, and it has to be built from scratch.
+    """
+    if not path.is_file():
+        logger.info(f"No mosaic at {path} to update; building it")
+        return False
+
+    from tilegrab.downloader import ProgressStore
+    from tilegrab.images import update_geotiff
+
+    changed = ProgressStore(tiles_out).changed_since(path.stat().st_mtime)
+    try:
+        update_geotiff([img for img in images if img.index in changed], path, workers=workers)
+    except ValueError as e:
+        logger.warning(f"Cannot update {path} in place ({e}); rebuilding it")
+        return False
+    return True
+
+
 def main():
     LOG_LEVEL = logging.INFO
     ENABLE_CLI_LOG = True
     ENABLE_FILE_LOG = True
 
+    if sys.argv[1:2] == ["serve"]:
+        serve_main(sys.argv[2:])
+        return
+
     args = parse_args()
     if args.debug:
         LOG_LEVEL = logging.DEBUG
@@ -159,25 +304,37 @@ def main():
             from tilegrab.sources import OSM
 
             logger.info("Using OpenStreetMap (OSM) as tile source")
-            source = OSM(api_key=args.key) if args.key else OSM()
+            source = OSM(api_key=args.key, scale=args.scale)
         elif args.google_sat:
             from tilegrab.sources import GoogleSat
 
             logger.info("Using Google Satellite as tile source")
-            source = GoogleSat(api_key=args.key) if args.key else GoogleSat()
+            source = GoogleSat(api_key=args.key, scale=args.scale)
         elif args.esri_sat:
             from tilegrab.sources import ESRIWorldImagery
 
             logger.info("Using ESRI World Imagery as tile source")
-            source = (
-                ESRIWorldImagery(api_key=args.key) if args.key else ESRIWorldImagery()
-            )
+            source = ESRIWorldImagery(api_key=args.key, scale=args.scale)
         else:
             logger.error("No tile source selected")
             raise SystemExit("No tile source selected")
 
         tile_collection: TileCollection
-        if args.shape:
+        if args.retry_failed:
+            from tilegrab.downloader import DeadLetterStore
+            from tilegrab.tiles import TilesByIndex
+
+            failed = DeadLetterStore(args.tiles_out).indices(source_id=source.id)
+            if not failed:
+                logger.info(f"No failed tiles recorded in {args.tiles_out}")
+                return
+            logger.info(f"Retrying {len(failed)} failed tiles from {args.tiles_out}")
+            tile_collection = TilesByIndex(failed, tile_source=source, safe_limit=args.tile_limit)
+
+            if not args.download_only:
+                logger.info("--retry-failed only downloads; run --mosaic-only to rebuild the mosaic")
+                args.download_only = True
+        elif args.shape:
             tile_collection = TilesByShape(
                 geo_dataset=dataset, 
                 tile_source=source, 
@@ -194,54 +351,161 @@ def main():
             raise SystemExit("No extent selector selected")
         
         
+        if args.shard:
+            from tilegrab.downloader import parse_shard, shard_dir
+
+            shard_index, shard_count = parse_shard(args.shard)
+            tile_collection.shard(shard_index, shard_count)
+            args.tiles_out = shard_dir(args.tiles_out, shard_index, shard_count)
+            logger.info(f"Shard {args.shard} writes to {args.tiles_out}")
+            if len(tile_collection) == 0:
+                logger.info(f"Shard {args.shard} has no tiles to download")
+                return
+
+            if not args.download_only and not args.mosaic_only:
+                logger.info("--shard only downloads; run --merge-shards to mosaic all shards")
+                args.download_only = True
+
+        store = None
+        if args.tile_store != "dir" or args.tile_layout != "flat":
+            from tilegrab.store import open_store
+            store = open_store(args.tile_store, args.tiles_out, layout=args.tile_layout)
+
         from tilegrab.images import load_images
         tile_image_collection: TileImageCollection
-        if args.mosaic_only:
-            tile_images = load_images(path=args.tiles_out, tiles=tile_collection)
+        if args.merge_shards:
+            from tilegrab.downloader import merge_shards
+            from tilegrab.images import load_images_from_progress
+
+            manifest = merge_shards(args.tiles_out)
+            tile_images = load_images_from_progress(manifest, tile_collection, layout=args.tile_layout)
+            tile_image_collection = TileImageCollection(
+                path=args.tiles_out, images=tile_images)
+
+        elif args.mosaic_only:
+            if store is not None:
+                from tilegrab.images import load_images_from_store
+                tile_images = load_images_from_store(store, tile_collection)
+            else:
+                tile_images = load_images(path=args.tiles_out, tiles=tile_collection)
             tile_image_collection = TileImageCollection(
                 path=args.tiles_out, images=tile_images)
             # logger.info(f"Load from disk result: {len(tile_image_collection)} TileImages")
         
         else:
-            dl_config = DownloadConfig()
+            cache = None
+            if args.cache_dir:
+                from tilegrab.cache import DiskTileCache
+
+                cache = DiskTileCache(
+                    args.cache_dir,
+                    ttl=args.cache_ttl * 3600 if args.cache_ttl is not None else None,
+                    max_bytes=args.cache_size * 1024 * 1024 if args.cache_size is not None else None)
+
+            dl_config = DownloadConfig(
+                decode_workers=args.decode_workers,
+                processes=args.processes,
+                retry_attempts=args.retries,
+                progress_flush_interval=args.progress_interval)
             downloader = Downloader(
                 tile_collection=tile_collection,
                 config=dl_config,
                 tile_dir=args.tiles_out,
-                resume=True) #TODO: Always resumes
+                resume=not args.refresh,
+                cache=cache,
+                store=store)
     
-            tile_image_collection = downloader.run(
-                workers=args.workers, 
-                show_progress=args.progress, 
-                parallel_download=args.parallel)
+            reporter = MetricsReporter(
+                downloader.metrics,
+                json_path=args.metrics_json,
+                prometheus_path=args.metrics_prom,
+                interval=args.metrics_interval)
+            with reporter:
+                tile_image_collection = downloader.run(
+                    workers=args.workers, 
+                    show_progress=args.progress, 
+                    parallel_download=args.parallel)
             
             logger.info(f"Download result: {tile_image_collection}")
+            if cache is not None:
+                logger.info(f"Tile cache: {cache.stats}")
+                cache.close()
 
-            
+        if args.pyramid is not None:
+            if args.shard or args.merge_shards:
+                logger.warning("--pyramid is ignored with --shard and --merge-shards")
+            else:
+                from tilegrab.downloader import ProgressStore
+                from tilegrab.images import build_pyramid
+                from tilegrab.store import DirectoryTileStore
+
+                build_pyramid(
+                    store if store is not None else DirectoryTileStore(args.tiles_out),
+                    min_zoom=args.pyramid,
+                    base=[t.index for t in tile_collection],
+                    progress_store=ProgressStore(args.tiles_out),
+                    source_id=tile_collection.source_id,
+                    workers=args.mosaic_workers)
 
-        img_col_bounds = tile_image_collection.bounds
         ex_types: List[ExportType] = []
         if not args.download_only:
+            img_col_bounds = tile_image_collection.bounds
             if args.tiff: 
                 ex_types.append(ExportType.TIFF)
             if args.png: 
                 ex_types.append(ExportType.PNG)
             if args.jpg: 
                 ex_types.append(ExportType.JPG)
+            if args.cog:
+                ex_types.append(ExportType.COG)
+            if args.vrt:
+                ex_types.append(ExportType.VRT)
+
+            if args.vrt:
+                from tilegrab.images import write_vrt
+                write_vrt(tile_image_collection, args.out / "mosaic.vrt", world_files=args.world_files)
+
+            if args.cog:
+                if not (args.incremental and update_mosaic(
+                        tile_image_collection, args.out / "mosaic.tif", args.tiles_out, args.mosaic_workers)):
+                    from tilegrab.images import write_cog
+                    write_cog(tile_image_collection, args.out / "mosaic.tif",
+                              compress=args.compress, band_size=args.band_size, workers=args.mosaic_workers)
 
-            from tilegrab.images import mosaic
-            final_img = [mosaic(tile_image_collection), ]
+            raster_types = [t for t in ex_types if t in (ExportType.PNG, ExportType.JPG, ExportType.TIFF)]
+            if args.group_tiles and not raster_types:
+                logger.warning("--group-tiles needs --png, --jpg or --tiff; ignored")
 
-            if args.group_tiles:
-                from tilegrab.images import group_image
+            elif args.group_tiles:
+                from tilegrab.images import export_groups
                 w,h = args.group_tiles.lower().split("x")
-                final_img = group_image(
-                    image=final_img[0], tile_h=256, tile_w=256, group_w=int(w), group_h=int(h))
-                
-            from tilegrab.images import export_image
-            export_image(images=final_img, output_dir=args.out, bounds=img_col_bounds, formats=ex_types)
-            
+                export_groups(
+                    tile_image_collection, args.out, group_w=int(w), group_h=int(h), formats=raster_types,
+                    overlap=args.group_overlap, workers=args.mosaic_workers,
+                    profile=args.encode_profile, processes=args.encode_workers)
+
+            else:
+                if ExportType.TIFF in raster_types and args.incremental and update_mosaic(
+                        tile_image_collection, args.out / "mosaic.tiff", args.tiles_out, args.mosaic_workers):
+                    raster_types.remove(ExportType.TIFF)
+
+                if raster_types == [ExportType.TIFF]:
+                    # stream tile rows into the GeoTIFF instead of building the full canvas
+                    from tilegrab.images import write_geotiff
+                    write_geotiff(tile_image_collection, args.out / "mosaic.tiff",
+                                  band_size=args.band_size, workers=args.mosaic_workers)
+
+                elif raster_types:
+                    from tilegrab.images import mosaic_array
+                    final_img = [mosaic_array(
+                        tile_image_collection, workers=args.mosaic_workers, processes=args.mosaic_processes), ]
+
+                    from tilegrab.images import export_image
+                    export_image(images=final_img, output_dir=args.out, bounds=img_col_bounds, formats=raster_types,
+                                 profile=args.encode_profile, processes=args.encode_workers)
             
+        if store is not None:
+            store.close()
 
         logger.info("Done")
 
@@ -1,10 +1,13 @@
 from .progress import ProgressStore, ProgressItem
+from .deadletter import DeadLetterStore, DeadLetterItem
 from .result import DownloadResult
 from .status import DownloadStatus
 from .config import DownloadConfig
+from .metrics import DownloadMetrics, MetricsReporter
 from .runner import Downloader
 from .session import create_session
 from .worker import download_tile
+from .shard import merge_shards, parse_shard, shard_dir
 
 
-__all__ = ["DownloadConfig", "Downloader", "ProgressStore", "DownloadStatus", "DownloadResult", "ProgressItem", "create_session", "download_tile"]
\ No newline at end of file
+__all__ = ["DownloadConfig", "DownloadMetrics", "MetricsReporter", "Downloader", "ProgressStore", "DownloadStatus", "DownloadResult", "ProgressItem", "DeadLetterStore", "DeadLetterItem", "create_session", "download_tile", "merge_shards", "parse_shard", "shard_dir"]
\ No newline at end of file
@@ -7,4 +7,10 @@ class DownloadConfig:
     max_retries: int = 5
     backoff_factor: float = 0.3
     overwrite: bool = True
-    save_images: bool = True
\ No newline at end of file
+    save_images: bool = True
+    decode_workers: int = 0
+    processes: int = 0
+    retry_attempts: int = 2
+    retry_delay: float = 2.0
+    progress_flush_interval: float = 1.0
+    progress_flush_count: int = 256
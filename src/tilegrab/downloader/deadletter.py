@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from tilegrab.downloader.status import DownloadStatus
+from tilegrab.tiles import TileIndex
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class DeadLetterItem:
+    tileIndex: TileIndex
+    downloadStatus: DownloadStatus
+    tileURL: str
+    tileSourceId: str
+    attempts: int
+
+    @property
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tileIndex': [self.tileIndex.x, self.tileIndex.y, self.tileIndex.z],
+            'downloadStatus': self.downloadStatus,
+            'tileURL': self.tileURL,
+            'tileSourceId': self.tileSourceId,
+            'attempts': self.attempts
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DeadLetterItem":
+        x, y, z = d['tileIndex']
+        return cls(
+            tileIndex=TileIndex(x=x, y=y, z=z),
+            downloadStatus=DownloadStatus(d['downloadStatus']),
+            tileURL=d['tileURL'],
+            tileSourceId=d['tileSourceId'],
+            attempts=d['attempts']
+        )
+
+
+class DeadLetterStore:
+    """
+    Tiles that are still failing after every runner-level retry, kept next
+    to the progress file so a later run can target only those keys.
+    """
+
+    _NAME = ".dlfail.tilegrab"
+    _SCHEMA_VERSION = 1
+
+    def __init__(self, tile_dir: Path, indent: int = 2):
+        self.path = Path(tile_dir) / self._NAME
+        self.indent = indent
+        self._items: Dict[TileIndex, DeadLetterItem] = {}
+
+        if self.path.exists():
+            try:
+                loaded = json.loads(self.path.read_text(encoding='utf-8'))
+                for d in loaded.get('failed', []):
+                    item = DeadLetterItem.from_dict(d)
+                    self._items[item.tileIndex] = item
+            except Exception as e:
+                raise RuntimeError(f"Failed to load dead-letter file: {self.path}") from e
+
+    def __iter__(self) -> Iterator[DeadLetterItem]:
+        return iter(list(self._items.values()))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, index: TileIndex) -> bool:
+        return index in self._items
+
+    def add(self, item: DeadLetterItem):
+        previous = self._items.get(item.tileIndex)
+        if previous:
+            item = DeadLetterItem(
+                tileIndex=item.tileIndex,
+                downloadStatus=item.downloadStatus,
+                tileURL=item.tileURL,
+                tileSourceId=item.tileSourceId,
+                attempts=previous.attempts + item.attempts)
+        self._items[item.tileIndex] = item
+
+    def discard(self, index: TileIndex):
+        self._items.pop(index, None)
+
+    def indices(self, source_id: Optional[str] = None) -> List[TileIndex]:
+        return [
+            i.tileIndex for i in self._items.values()
+            if source_id is None or i.tileSourceId == source_id
+        ]
+
+    def save(self):
+        if not self._items:
+            if self.path.exists():
+                self.path.unlink()
+                logger.debug(f"Dead-letter list cleared: {self.path}")
+            return
+
+        payload = json.dumps(
+            {
+                'schemaVersion': self._SCHEMA_VERSION,
+                'failed': [i.to_dict for i in self._items.values()],
+            },
+            indent=self.indent,
+            ensure_ascii=False,
+        )
+
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        tmp.write_text(payload, encoding='utf-8')
+        tmp.replace(self.path)
+        logger.debug(f"Dead-letter list saved: {len(self)} tiles in {self.path}")
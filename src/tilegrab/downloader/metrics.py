@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .result import DownloadResult
+from .status import DownloadStatus
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+MetricsCallback = Callable[[DownloadResult, "DownloadMetrics"], None]
+
+
+class LatencyHistogram:
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, le in enumerate(self.buckets):
+            if seconds <= le:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += seconds
+        self.count += 1
+
+    @property
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative, total = {}, 0
+        for le, c in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += c
+            cumulative[le] = total
+        return {'buckets': cumulative, 'sum': round(self.sum, 6), 'count': self.count}
+
+
+class DownloadMetrics:
+    """
+    Thread-safe download counters. Results are recorded by `Downloader` on
+    the main process, so the numbers cover every download mode.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[MetricsCallback] = []
+        self.started_at = time.time()
+        self.bytes_total = 0
+        self.retries_total = 0
+        self.requeues_total = 0
+        self.cache_hits_total = 0
+        self.status_counts: Dict[DownloadStatus, int] = {s: 0 for s in DownloadStatus}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def subscribe(self, callback: MetricsCallback):
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback: MetricsCallback):
+        self._callbacks.remove(callback)
+
+    def request_started(self, count: int = 1):
+        with self._lock:
+            self.in_flight += count
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, count: int = 1):
+        with self._lock:
+            self.in_flight -= count
+
+    def requeued(self, count: int):
+        with self._lock:
+            self.requeues_total += count
+
+    def record(self, result: DownloadResult):
+        with self._lock:
+            self.status_counts[result.status] += 1
+            self.retries_total += result.retries
+            if result.cached:
+                self.cache_hits_total += 1
+            else:
+                self.bytes_total += result.size
+            if result.elapsed > 0:
+                host = urlparse(result.url).netloc
+                self.latency.setdefault(host, LatencyHistogram()).observe(result.elapsed)
+
+        for callback in self._callbacks:
+            try:
+                callback(result, self)
+            except Exception:
+                logger.exception("Metrics callback failed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            done = self.status_counts[DownloadStatus.SUCCESS]
+            return {
+                'timestamp': time.time(),
+                'elapsedSeconds': round(elapsed, 3),
+                'bytesTotal': self.bytes_total,
+                'retriesTotal': self.retries_total,
+                'requeuesTotal': self.requeues_total,
+                'cacheHitsTotal': self.cache_hits_total,
+                'tilesPerSecond': round(done / elapsed, 3) if elapsed > 0 else 0.0,
+                'inFlight': self.in_flight,
+                'maxInFlight': self.max_in_flight,
+                'status': {s.name: c for s, c in self.status_counts.items()},
+                'latencySeconds': {h: hist.to_dict for h, hist in self.latency.items()},
+            }
+
+    def to_prometheus(self, prefix: str = "tilegrab_download") -> str:
+        snap = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_bytes_total Bytes of tile data received from the network.",
+            f"# TYPE {prefix}_bytes_total counter",
+            f"{prefix}_bytes_total {snap['bytesTotal']}",
+            f"# HELP {prefix}_tiles_total Tiles processed, by download status.",
+            f"# TYPE {prefix}_tiles_total counter",
+            *[f'{prefix}_tiles_total{{status="{s}"}} {c}' for s, c in snap['status'].items()],
+            f"# HELP {prefix}_retries_total HTTP retries made by the session.",
+            f"# TYPE {prefix}_retries_total counter",
+            f"{prefix}_retries_total {snap['retriesTotal']}",
+            f"# HELP {prefix}_requeues_total Tiles requeued by the runner after a pass.",
+            f"# TYPE {prefix}_requeues_total counter",
+            f"{prefix}_requeues_total {snap['requeuesTotal']}",
+            f"# HELP {prefix}_cache_hits_total Tiles served from the tile cache.",
+            f"# TYPE {prefix}_cache_hits_total counter",
+            f"{prefix}_cache_hits_total {snap['cacheHitsTotal']}",
+            f"# HELP {prefix}_in_flight Tile requests currently in flight.",
+            f"# TYPE {prefix}_in_flight gauge",
+            f"{prefix}_in_flight {snap['inFlight']}",
+            f"# HELP {prefix}_latency_seconds Tile request latency, by host.",
+            f"# TYPE {prefix}_latency_seconds histogram",
+        ]
+        for host, hist in snap['latencySeconds'].items():
+            for le, c in hist['buckets'].items():
+                lines.append(f'{prefix}_latency_seconds_bucket{{host="{host}",le="{le}"}} {c}')
+            lines.append(f'{prefix}_latency_seconds_sum{{host="{host}"}} {hist["sum"]}')
+            lines.append(f'{prefix}_latency_seconds_count{{host="{host}"}} {hist["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Path):
+        _atomic_write(Path(path), json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus(self, path: Path):
+        _atomic_write(Path(path), self.to_prometheus())
+
+
+class MetricsReporter:
+    """Writes JSON and/or Prometheus textfile snapshots every `interval` seconds."""
+
+    def __init__(
+        self,
+        metrics: DownloadMetrics,
+        json_path: Optional[Path] = None,
+        prometheus_path: Optional[Path] = None,
+        interval: float = 10.0,
+    ):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "MetricsReporter":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if not (self.json_path or self.prometheus_path):
+            return
+        self._thread = threading.Thread(target=self._loop, name="tilegrab-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.write()
+
+    def write(self):
+        try:
+            if self.json_path:
+                self.metrics.write_json(self.json_path)
+            if self.prometheus_path:
+                self.metrics.write_prometheus(self.prometheus_path)
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+def _atomic_write(path: Path, payload: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_text(payload, encoding='utf-8')
+    tmp.replace(path)
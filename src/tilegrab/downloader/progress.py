@@ -1,14 +1,21 @@
 from __future__ import annotations
 
 import json
+import logging
+import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Optional, Iterator, Union
+from typing import Any, Dict, List, Optional, Iterator, Set, Tuple, Union
 
 from tilegrab.downloader.status import DownloadStatus
 from tilegrab.tiles import TileIndex
 from tilegrab.tiles import Tile
 
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[int, int, int]
+
 
 @dataclass(frozen=True, slots=True)
 class ProgressItem:
@@ -18,6 +25,9 @@ class ProgressItem:
     tileImagePath: Path
     tileSourceId: str
     saved: bool
+    # when the saved tile content last changed (seconds since the epoch) and a digest of it
+    updatedAt: float = 0.0
+    checksum: str = ""
 
     @property
     def to_dict(self) -> Dict[str, Any]:
@@ -27,7 +37,9 @@ class ProgressItem:
             'tileURL': self.tileURL,
             'tileImagePath': str(self.tileImagePath),
             'tileSourceId': self.tileSourceId,
-            'saved': self.saved
+            'saved': self.saved,
+            'updatedAt': self.updatedAt,
+            'checksum': self.checksum,
         }
 
     @classmethod
@@ -39,10 +51,21 @@ class ProgressItem:
             tileURL=d['tileURL'],
             tileImagePath=Path(d['tileImagePath']),
             tileSourceId=d['tileSourceId'],
-            saved=d['saved']
+            saved=d['saved'],
+            updatedAt=d.get('updatedAt', 0.0),
+            checksum=d.get('checksum', ''),
         )
 
 class ProgressStore:
+    """
+    Download progress keyed by tile index. Changes are appended to a JSON-lines
+    journal next to the snapshot and folded back into it once the journal
+    outgrows the snapshot, so each update costs O(1) amortized.
+
+    With `start_writer` running, updates are only queued in memory and a
+    background thread commits them in batches (group commit), every
+    `interval` seconds or `max_pending` updates, whichever comes first.
+    """
 
     _REQUIRED_KEYS = {
         'tileIndex',
@@ -53,7 +76,9 @@ class ProgressStore:
     }
 
     _NAME = ".dlprog.tilegrab"
+    _JOURNAL_SUFFIX = ".journal"
     _SCHEMA_VERSION = 1
+    _MIN_COMPACT = 1024
 
     def __init__(
         self,
@@ -62,8 +87,17 @@ class ProgressStore:
         indent: int = 2,
     ):
         self.path = Path(tile_dir) / self._NAME
+        self.journal_path = self.path.with_suffix(self.path.suffix + self._JOURNAL_SUFFIX)
         self.indent = indent
         self._suspend_flush = False
+        self._pending: List[str] = []
+        self._journal_lines = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._max_pending = 0
 
         self._state: Dict[str, Any] = initial or {
             'schemaVersion': self._SCHEMA_VERSION,
@@ -80,101 +114,222 @@ class ProgressStore:
             except Exception as e:
                 raise RuntimeError(f"Failed to load progress file: {self.path}") from e
 
-        self._last_serial = self._serialize()
+        self._progress: List[Dict[str, Any]] = self._state.setdefault('progress', [])
+        self._reindex()
+        self._replay_journal()
 
     def __iter__(self) -> Iterator[ProgressItem]:
-        for p in self._state.get('progress', []):
+        for p in self._progress:
             yield ProgressItem.from_dict(p)
 
     def __getitem__(self, index: int) -> ProgressItem:
-        return ProgressItem.from_dict(self._state['progress'][index])
+        return ProgressItem.from_dict(self._progress[index])
 
     def __len__(self) -> int:
-        return len(self._state.get('progress', []))
+        return len(self._progress)
 
+    @staticmethod
+    def _key(tile_index: List[int]) -> _Key:
+        x, y, z = tile_index
+        return (x, y, z)
+
+    def _reindex(self):
+        self._index: Dict[_Key, int] = {
+            self._key(p['tileIndex']): i for i, p in enumerate(self._progress)}
+
+    def _replay_journal(self):
+        if not self.journal_path.exists():
+            return
 
-    def _serialize(self) -> str:
-        
-        return json.dumps(self._state, sort_keys=True)
+        good = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn write from an interrupted run; later appends must not extend it
+                    logger.warning(f"Dropping incomplete tail of {self.journal_path}")
+                    break
+                good += len(line)
+                self._journal_lines += 1
+                if 'deleted' in entry:
+                    self._delete(self._key(entry['deleted']))
+                else:
+                    self._put(entry)
+
+        if good != self.journal_path.stat().st_size:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good)
 
     def _validate_item(self, item: Dict[str, Any]):
         missing = self._REQUIRED_KEYS - item.keys()
         if missing:
             raise ValueError(f"Invalid progress item, missing: {missing}")
 
-    def _flush_if_changed(self):
+    def _put(self, d: Dict[str, Any]):
+        key = self._key(d['tileIndex'])
+        with self._lock:
+            i = self._index.get(key)
+            if i is None:
+                self._index[key] = len(self._progress)
+                self._progress.append(d)
+            else:
+                self._progress[i] = d
+
+    def _delete(self, key: _Key):
+        with self._lock:
+            i = self._index.get(key)
+            if i is None:
+                return
+            del self._progress[i]
+            self._reindex()
+
+    def _log(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._pending.append(line)
+            pending = len(self._pending)
+
+        if self._writer is None:
+            self.flush()
+        elif pending >= self._max_pending:
+            self._wake.set()
+
+    def flush(self):
+        """Append pending changes to the journal, compacting it when it gets large."""
         if self._suspend_flush:
             return
 
-        serial = self._serialize()
-        if serial == self._last_serial:
-            return
+        with self._io_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                compact = self._journal_lines + len(batch) > max(self._MIN_COMPACT, len(self._progress))
+                state = self._snapshot() if compact else None
+
+            if state is not None:
+                self._write_snapshot(state)
+                return
 
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(batch) + '\n')
+                if self._writer is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._journal_lines += len(batch)
+
+    def compact(self):
+        """Rewrite the snapshot from memory and drop the journal."""
+        with self._io_lock:
+            with self._lock:
+                self._pending.clear()
+                state = self._snapshot()
+            self._write_snapshot(state)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # entries are replaced, never mutated, so a shallow copy is consistent
+        return {**self._state, 'progress': list(self._progress)}
+
+    def _write_snapshot(self, state: Dict[str, Any]):
         payload = json.dumps(
-            self._state,
+            state,
             indent=self.indent,
             ensure_ascii=False,
         )
 
+        self.path.parent.mkdir(parents=True, exist_ok=True)
         tmp = self.path.with_suffix(self.path.suffix + '.tmp')
         tmp.write_text(payload, encoding='utf-8')
         tmp.replace(self.path)
+        self.journal_path.unlink(missing_ok=True)
+        self._journal_lines = 0
 
-        self._last_serial = serial
-
+    def start_writer(self, interval: float = 1.0, max_pending: int = 256):
+        """Commit updates from a background thread instead of on every call."""
+        if self._writer is not None:
+            return
+        self._max_pending = max(1, max_pending)
+        self._stop.clear()
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(interval,), name="tilegrab-progress", daemon=True)
+        self._writer.start()
+
+    def stop_writer(self):
+        """Stop the background writer and commit everything still queued."""
+        if self._writer is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._writer.join()
+        self._writer = None
+        self.flush()
+
+    def _write_loop(self, interval: float):
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                logger.exception(f"Failed to write progress to {self.journal_path}")
 
     def append(self, item: ProgressItem):
         d = item.to_dict
         self._validate_item(d)
-        self._state.setdefault('progress', []).append(d)
-        self._flush_if_changed()
+        self._put(d)
+        self._log(d)
 
     def update(self, index: int, item: ProgressItem):
-        prog = self._state.setdefault('progress', [])
-        if not (0 <= index < len(prog)):
+        if not (0 <= index < len(self._progress)):
             raise IndexError(f"Progress index out of range: {index}")
 
         d = item.to_dict
         self._validate_item(d)
-        prog[index] = d
-        self._flush_if_changed()
+        old = self._progress[index]['tileIndex']
+        if old != d['tileIndex']:
+            self._delete(self._key(old))
+            self._log({'deleted': old})
+        self._put(d)
+        self._log(d)
 
     def remove(self, index: int):
-        prog = self._state.setdefault('progress', [])
-        if not (0 <= index < len(prog)):
+        if not (0 <= index < len(self._progress)):
             raise IndexError(f"Progress index out of range: {index}")
 
-        del prog[index]
-        self._flush_if_changed()
+        ti = self._progress[index]['tileIndex']
+        self._delete(self._key(ti))
+        self._log({'deleted': ti})
 
     def upsert_by_tile_index(self, item: ProgressItem):
         d = item.to_dict
         self._validate_item(d)
-
-        ti = d['tileIndex']
-        prog = self._state.setdefault('progress', [])
-
-        for i, p in enumerate(prog):
-            if p['tileIndex'] == ti:
-                prog[i] = d
-                self._flush_if_changed()
-                return
-
-        prog.append(d)
-        self._flush_if_changed()
-
-    def progress_by_tile(self, item: Tile) -> Union[ProgressItem, None]:
-
-        prog = self._state.setdefault('progress', [])
-
-        for i, p in enumerate(prog):
-            if p['tileIndex'] == item:
-                return ProgressItem.from_dict(p)
+        self._put(d)
+        self._log(d)
+
+    def progress_by_tile(self, item: Union[Tile, TileIndex]) -> Union[ProgressItem, None]:
+        index = item.index if isinstance(item, Tile) else item
+        i = self._index.get((index.x, index.y, index.z))
+        if i is None:
+            return None
+        return ProgressItem.from_dict(self._progress[i])
+
+    def changed_since(self, since: float) -> Set[TileIndex]:
+        """Tiles saved with new content after `since` (seconds since the epoch)."""
+        with self._lock:
+            progress = list(self._progress)
+        return {
+            TileIndex(x=p['tileIndex'][0], y=p['tileIndex'][1], z=p['tileIndex'][2])
+            for p in progress
+            if p.get('updatedAt', 0.0) > since
+            and p['downloadStatus'] in (DownloadStatus.SUCCESS, DownloadStatus.SKIP_AND_EXISTS)}
 
     def suspend_flush(self):
         self._suspend_flush = True
 
     def resume_flush(self):
         self._suspend_flush = False
-        self._flush_if_changed()
-
+        self.flush()
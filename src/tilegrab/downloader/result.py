@@ -13,3 +13,7 @@ class DownloadResult:
     status: DownloadStatus
     result: Union[TileImage, None]
     url: str
+    size: int = 0
+    elapsed: float = 0.0
+    retries: int = 0
+    cached: bool = False
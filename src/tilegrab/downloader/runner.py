@@ -1,15 +1,30 @@
+import hashlib
 import logging
+import math
+import multiprocessing
+import queue
 import tempfile
+import time
+from concurrent.futures import Future, wait
+from dataclasses import replace
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
+import requests
+
+from tilegrab.cache import MemoryTileCache, TileCache
+from tilegrab.store import TileStore
 from tilegrab.images.image import TileImage
-from tilegrab.images.loader import load_images
-from tilegrab.tiles import TileCollection
+from tilegrab.images.loader import index_tiles, read_image
+from tilegrab.tiles import Tile, TileCollection, TileIndex
 from tilegrab.images import TileImageCollection
+from tilegrab.images.decoder import DecodePool
 
 from .result import DownloadResult
 from .progress import ProgressItem, ProgressStore
+from .deadletter import DeadLetterItem, DeadLetterStore
+from .metrics import DownloadMetrics
 from .status import DownloadStatus
 import tilegrab.downloader.worker as worker
 from .config import DownloadConfig
@@ -17,6 +32,49 @@ from .session import create_session
 
 logger = logging.getLogger(__name__)
 
+# Results that are requeued at the end of a pass and dead-lettered once attempts run out
+_RETRY_STATUSES = (DownloadStatus.UNDEFINED, DownloadStatus.FAILED)
+_DONE_STATUSES = (DownloadStatus.SUCCESS, DownloadStatus.SKIP_AND_EXISTS)
+
+
+# Process-mode chunks stay small so a pass does not end on a few long chunks
+_MAX_CHUNK_TILES = 64
+# Put on the events queue when a download process starts a request; the result follows
+_REQUEST_STARTED = "started"
+
+# Set in each download process by `_init_download_process`
+_events: "multiprocessing.Queue | None" = None
+_session: requests.Session | None = None
+
+
+def _init_download_process(events: "multiprocessing.Queue", config: DownloadConfig):
+    global _events, _session
+    _events = events
+    _session = create_session(config)
+
+
+def _download_chunk(
+    tiles: List[Tile],
+    config: DownloadConfig,
+    workers: int | None,
+    decode: bool,
+) -> int:
+    """
+    Runs in a download process: fetches one chunk on a thread pool and sends
+    each request start and result to the parent as it happens, so results
+    stream back per tile. Returns the number of tiles.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    assert _events is not None and _session is not None
+
+    def fetch(tile: Tile):
+        _events.put(_REQUEST_STARTED)
+        _events.put(worker.download_tile(tile, _session, config.timeout, decode))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, tiles))
+    return len(tiles)
+
 
 class Downloader:
 
@@ -25,7 +83,10 @@ class Downloader:
         tile_collection: TileCollection,
         config: DownloadConfig,
         tile_dir: Path | None = None,
-        resume: bool = True
+        resume: bool = True,
+        metrics: DownloadMetrics | None = None,
+        cache: TileCache | None = None,
+        store: TileStore | None = None,
     ):
         self.tile_col = tile_collection
         self.config = config
@@ -34,33 +95,69 @@ class Downloader:
         self.progress_store = ProgressStore(self.tile_dir)
         self.resume = resume
         self.images:List[TileImage] = []
+        self.dead_letters = DeadLetterStore(self.tile_dir)
+        self.attempts: Dict[TileIndex, int] = {}
+        self.metrics = metrics or DownloadMetrics()
+        self.cache = cache
+        self.store = store
+        self._listings: Dict[Path, Dict[TileIndex, Path]] = {}
 
         assert len(tile_collection) > 0
         assert any([1 if i.need_download else 0 for i in tile_collection]), [1 if i.need_download else 0 for i in tile_collection]
 
-    def process_results(self, download_result: DownloadResult):
+    def process_results(self, download_result: DownloadResult) -> DownloadResult:
 
+        previous = self.progress_store.progress_by_tile(download_result.tile.index)
         if download_result.status == DownloadStatus.SUCCESS and download_result.result:
             download_result.result.path = self.tile_dir
             self.images.append(download_result.result)
+            if self.cache is not None and not download_result.cached:
+                self.cache.put(self.tile_col.source_id, download_result.tile.index, download_result.result.data)
+            if self.store is not None and self.config.save_images:
+                self.store.put(download_result.tile.index, download_result.result.data)
+            if isinstance(self.cache, MemoryTileCache) and self.cache.max_image_bytes > 0:
+                # tiles are usually decoded later (decode pool, mosaic); cache the pixels then
+                put = partial(self.cache.put_image, self.tile_col.source_id, download_result.tile.index)
+                if not download_result.result.decoded:
+                    download_result.result.on_decode = put
+                elif not download_result.cached:
+                    put(download_result.result.image)
             
         elif download_result.status == DownloadStatus.SKIP:
-            tile_image = load_images(self.tile_dir, [download_result.tile,])
-            if len(tile_image) == 1:
-                self.images.append(tile_image[0])
-                download_result = DownloadResult(
-                    download_result.tile,
-                    DownloadStatus.SKIP_AND_EXISTS,
-                    download_result.result,
-                    download_result.url
-                )
+            if self.store is not None:
+                tile_image = self.store.load(download_result.tile)
+            else:
+                saved = self._saved_tiles(self.tile_dir).get(download_result.tile.index)
+                tile_image = None if saved is None else read_image(download_result.tile, saved)
+            if tile_image is not None:
+                self.images.append(tile_image)
+                download_result = replace(
+                    download_result, status=DownloadStatus.SKIP_AND_EXISTS)
+            elif previous is not None and previous.downloadStatus == DownloadStatus.CLIENT_ERROR:
+                # refused in an earlier run; keep it so later resumes skip it too
+                download_result = replace(
+                    download_result, status=DownloadStatus.CLIENT_ERROR)
 
         elif download_result.status == DownloadStatus.EMPTY:
             logger.warning("downloader.runner returned EMPTY DownloadStatus")
 
+        elif download_result.status == DownloadStatus.CLIENT_ERROR:
+            logger.warning("downloader.runner returned CLIENT_ERROR DownloadStatus")
+
+        elif download_result.status == DownloadStatus.FAILED:
+            logger.error("downloader.runner returned FAILED DownloadStatus")
+
         elif download_result.status == DownloadStatus.UNDEFINED:
             logger.error("downloader.runner returned UNDEFINED DownloadStatus")
         
+        # only new content moves the timestamp, so an unchanged re-download is not a change
+        updated_at = previous.updatedAt if previous else 0.0
+        checksum = previous.checksum if previous else ""
+        if download_result.status == DownloadStatus.SUCCESS and download_result.result:
+            digest = hashlib.blake2b(download_result.result.data, digest_size=8).hexdigest()
+            if digest != checksum:
+                updated_at, checksum = time.time(), digest
+
         # progress update
         progress_item = ProgressItem(
             tileIndex=download_result.tile.index,
@@ -68,77 +165,266 @@ class Downloader:
             tileURL=download_result.url,
             tileImagePath=self.tile_dir,
             tileSourceId=self.tile_col.source_id,
-            saved=self.config.save_images)
+            saved=self.config.save_images,
+            updatedAt=updated_at,
+            checksum=checksum)
 
         self.progress_store.upsert_by_tile_index(progress_item)
 
-    def run(
+        if download_result.status not in _RETRY_STATUSES:
+            self.dead_letters.discard(download_result.tile.index)
+
+        self.metrics.record(download_result)
+        return download_result
+
+    def create_session(self) -> requests.Session:
+        s = create_session(self.config)
+        required_headers = ['referer', 'accept', 'user-agent', 'accept-encoding', 'accept-language']
+        assert all([1 if i in s.headers.keys() else 0 for i in  required_headers])
+        return s
+
+    def _fetch(self, tile: Tile, session: requests.Session, decode: bool) -> DownloadResult:
+        self.metrics.request_started()
+        try:
+            return worker.download_tile(tile, session, self.config.timeout, decode)
+        finally:
+            self.metrics.request_finished()
+
+    def _from_cache(self, tile: Tile, decode: bool) -> DownloadResult | None:
+        assert self.cache is not None
+        data = self.cache.get(self.tile_col.source_id, tile.index)
+        if data is None:
+            return None
+        decoded = None
+        if isinstance(self.cache, MemoryTileCache):
+            decoded = self.cache.get_image(self.tile_col.source_id, tile.index)
+        try:
+            image = TileImage(tile=tile, image=data, lazy=decoded is not None or not decode)
+        except RuntimeError:
+            logger.warning(f"Ignoring unreadable cached tile {tile.index}")
+            return None
+        if decoded is not None:
+            image.set_decoded(decoded)
+        return DownloadResult(
+            tile=tile, status=DownloadStatus.SUCCESS, result=image, url=tile.url,
+            size=len(data), cached=True)
+
+    def _download_pass(
         self,
-        workers: int | None = None,
-        parallel_download: bool = True,
-        show_progress: bool = True,
-    ) -> TileImageCollection:
-        
+        tiles: List[Tile],
+        session: requests.Session,
+        workers: int | None,
+        parallel_download: bool,
+        decode_pool: DecodePool | None,
+        pbar,
+    ) -> List[DownloadResult]:
 
-        def session_factory():
-            s = create_session(self.config)
-            required_headers = ['referer', 'accept', 'user-agent', 'accept-encoding', 'accept-language']
-            assert all([1 if i in s.headers.keys() else 0 for i in  required_headers])
-            return s
-        
-        for idx, tile in enumerate(self.tile_col):
-            logger.debug(f"Preparing Tile {idx} {tile.index}")
-            progress_item = self.progress_store.progress_by_tile(tile)
-            if progress_item:
-                if progress_item.downloadStatus == DownloadStatus.SUCCESS and self.resume:
-                    # skip this tile
-                    self.tile_col[idx].need_download = False
-                    logger.debug(f"Excluded from download")
-                
-                if progress_item.downloadStatus == DownloadStatus.SKIP_AND_EXISTS and self.resume:
-                    # skip this tile
-                    self.tile_col[idx].need_download = False
-                    logger.debug(f"Excluded from download")
-        
-        logger.debug(f"Total TileImages to be download: {sum([1 for i in self.tile_col if i.need_download])}")
+        failed: List[DownloadResult] = []
+        decoding: Dict[Future, DownloadResult] = {}
 
-        if show_progress:
-            from tqdm import tqdm
-            pbar = tqdm(total=len(self.tile_col),
-                        desc="       Downloading", unit="tile")
-        else:
-            pbar = None
+        def finish(dl_result: DownloadResult):
+            dl_result = self.process_results(download_result=dl_result)
+            if dl_result.status in _RETRY_STATUSES:
+                failed.append(dl_result)
+            if pbar:
+                pbar.update(1)
+
+        def handle_result(dl_result: DownloadResult):
+            if (decode_pool and dl_result.status == DownloadStatus.SUCCESS
+                    and dl_result.result and not dl_result.result.decoded):
+                decoding[decode_pool.submit(dl_result.result)] = dl_result
+            else:
+                finish(dl_result)
 
-        session = session_factory()
-        if parallel_download:
+            drain_decoded(block=False)
+
+        def drain_decoded(block: bool):
+            if not decode_pool or not decoding:
+                return
+
+            done = wait(decoding).done if block else [f for f in decoding if f.done()]
+            for future in done:
+                dl_result = decoding.pop(future)
+                assert dl_result.result
+                if not decode_pool.attach(future, dl_result.result):
+                    dl_result = replace(
+                        dl_result, status=DownloadStatus.FAILED, result=None)
+                finish(dl_result)
+
+        if self.cache is not None:
+            misses = []
+            for tile in tiles:
+                cached = self._from_cache(tile, decode=decode_pool is None) if tile.need_download else None
+                if cached:
+                    handle_result(cached)
+                else:
+                    misses.append(tile)
+            logger.debug(f"Tile cache: {len(tiles) - len(misses)} hits, {len(misses)} misses")
+            tiles = misses
+
+        if parallel_download and self.config.processes > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            chunk = max(1, min(_MAX_CHUNK_TILES, math.ceil(len(tiles) / (self.config.processes * 4))))
+            # spawned, not forked: the progress writer, metrics reporter and
+            # tqdm threads may hold locks that a forked child would inherit
+            ctx = multiprocessing.get_context("spawn")
+            events = ctx.Queue()
+            with ProcessPoolExecutor(
+                    max_workers=self.config.processes,
+                    mp_context=ctx,
+                    initializer=_init_download_process,
+                    initargs=(events, self.config)) as executor:
+                futures = [
+                    executor.submit(
+                        _download_chunk,
+                        tiles[i:i + chunk],
+                        self.config,
+                        workers,
+                        decode_pool is None,
+                    )
+                    for i in range(0, len(tiles), chunk)
+                ]
+
+                remaining = len(tiles)
+                while remaining:
+                    try:
+                        event = events.get(timeout=1.0)
+                    except queue.Empty:
+                        # a chunk that failed sends nothing more; raise its error
+                        for future in futures:
+                            if future.done():
+                                future.result()
+                        continue
+                    if event == _REQUEST_STARTED:
+                        self.metrics.request_started()
+                    else:
+                        self.metrics.request_finished()
+                        remaining -= 1
+                        handle_result(event)
+            events.close()
+        elif parallel_download:
             from concurrent.futures import ThreadPoolExecutor, as_completed
             with ThreadPoolExecutor(max_workers=workers) as executor:
                 futures = [
                     executor.submit(
-                        worker.download_tile,
+                        self._fetch,
                         tile,
                         session,
-                        self.config.timeout,
+                        decode_pool is None,
                     )
-                    for tile in self.tile_col
+                    for tile in tiles
                 ]
 
                 for future in as_completed(futures):
-                    dl_result = future.result()
-                    self.process_results(download_result=dl_result)
+                    handle_result(future.result())
+        else:
+            for tile in tiles:
+
+                dl_result = self._fetch(tile, session, decode=decode_pool is None)
+
+                handle_result(dl_result)
+
+        drain_decoded(block=True)
+        return failed
+
+    def record_dead_letters(self, failed: List[DownloadResult]):
+        for dl_result in failed:
+            self.dead_letters.add(DeadLetterItem(
+                tileIndex=dl_result.tile.index,
+                downloadStatus=dl_result.status,
+                tileURL=dl_result.url,
+                tileSourceId=self.tile_col.source_id,
+                attempts=self.attempts.get(dl_result.tile.index, 1)))
+
+        if failed:
+            logger.warning(
+                f"{len(failed)} tiles failed after {self.config.retry_attempts + 1} attempts; "
+                f"recorded in {self.dead_letters.path}")
+        self.dead_letters.save()
+
+    def _saved_tiles(self, folder: Path) -> Dict[TileIndex, Path]:
+        if folder not in self._listings:
+            self._listings[folder] = index_tiles(folder)
+        return self._listings[folder]
+
+    def plan_resume(self, scan_dir: bool = True) -> int:
+        """
+        Mark tiles already downloaded, or refused with a 4xx, in an earlier run
+        as not needing a download, in one pass over the collection. With
+        `scan_dir`, a downloaded tile is only skipped if its image is still on
+        disk. Returns the skipped count.
+        """
+        skipped = 0
+        for tile in self.tile_col:
+            item = self.progress_store.progress_by_tile(tile.index)
+            if item is None or item.downloadStatus not in _DONE_STATUSES + (DownloadStatus.CLIENT_ERROR,):
+                continue
 
-                    if pbar:
-                        pbar.update(1)
+            # a refused tile has no image to check; only --refresh asks for it again
+            if scan_dir and item.downloadStatus != DownloadStatus.CLIENT_ERROR:
+                if self.store is not None:
+                    if tile.index not in self.store:
+                        continue
+                elif tile.index not in self._saved_tiles(Path(item.tileImagePath)):
+                    continue
+
+            tile.need_download = False
+            skipped += 1
+
+        logger.info(f"Resume: skipping {skipped} of {len(self.tile_col)} tiles already downloaded")
+        return skipped
+
+    def run(
+        self,
+        workers: int | None = None,
+        parallel_download: bool = True,
+        show_progress: bool = True,
+    ) -> TileImageCollection:
+
+        if self.resume:
+            self.plan_resume()
+
+        if show_progress:
+            from tqdm import tqdm
+            pbar = tqdm(total=len(self.tile_col),
+                        desc="       Downloading", unit="tile")
         else:
-            for tile in self.tile_col:
+            pbar = None
 
-                dl_result = worker.download_tile(
-                    tile=tile, session=session, timeout=self.config.timeout)
+        decode_pool = DecodePool(self.config.decode_workers) if self.config.decode_workers > 0 else None
+        session = self.create_session()
+        if self.config.progress_flush_interval > 0:
+            self.progress_store.start_writer(
+                self.config.progress_flush_interval, self.config.progress_flush_count)
+        try:
+            tiles = self.tile_col.to_list
+            attempt = 0
+            while True:
+                attempt += 1
+                failed = self._download_pass(
+                    tiles, session, workers, parallel_download, decode_pool, pbar)
+                for dl_result in failed:
+                    self.attempts[dl_result.tile.index] = attempt
 
-                self.process_results(download_result=dl_result)
+                if not failed or attempt > self.config.retry_attempts:
+                    break
 
+                delay = self.config.retry_delay * attempt
+                logger.info(f"Requeue {len(failed)} failed tiles in {delay:.1f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+
+                tiles = [r.tile for r in failed]
+                self.metrics.requeued(len(tiles))
                 if pbar:
-                    pbar.update(1)
+                    pbar.total += len(tiles)
+                    pbar.refresh()
+        finally:
+            if decode_pool:
+                decode_pool.shutdown()
+            self.progress_store.stop_writer()
+
+        self.record_dead_letters(failed)
+        self.progress_store.compact()
 
         if pbar:
             pbar.close()
@@ -154,6 +440,9 @@ class Downloader:
             path=self.tile_dir
             )
         if self.config.save_images:
-            img_col.save()
+            if self.store is not None:
+                self.store.flush()
+            else:
+                img_col.save()
         
         return img_col
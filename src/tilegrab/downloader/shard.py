@@ -0,0 +1,75 @@
+import logging
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+from .deadletter import DeadLetterStore
+from .progress import ProgressStore
+
+logger = logging.getLogger(__name__)
+
+_SHARD_RE = re.compile(r"^shard-(\d+)-of-(\d+)$")
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a 1-based `I/N` shard spec into a 0-based (index, count) pair."""
+    try:
+        i, n = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {value!r}, expected I/N") from None
+    if not (1 <= i <= n):
+        raise ValueError(f"Invalid shard spec {value!r}, expected 1 <= I <= N")
+    return i - 1, n
+
+
+def shard_dir(tile_dir: Path, index: int, count: int) -> Path:
+    return Path(tile_dir) / f"shard-{index + 1}-of-{count}"
+
+
+def find_shard_dirs(tile_dir: Path) -> List[Path]:
+    dirs = []
+    for p in sorted(Path(tile_dir).iterdir()):
+        m = _SHARD_RE.match(p.name)
+        if m and p.is_dir():
+            dirs.append((int(m.group(2)), int(m.group(1)), p))
+
+    counts = {n for n, _, _ in dirs}
+    if len(counts) > 1:
+        raise RuntimeError(f"Mixed shard counts in {tile_dir}: {sorted(counts)}")
+    if dirs:
+        n = dirs[0][0]
+        missing = set(range(1, n + 1)) - {i for _, i, _ in dirs}
+        if missing:
+            logger.warning(f"Shards missing from {tile_dir}: {sorted(missing)} of {n}")
+
+    return [p for _, _, p in sorted(dirs)]
+
+
+def merge_shards(tile_dir: Path) -> ProgressStore:
+    """
+    Merge the progress and dead-letter files of every `shard-I-of-N`
+    directory into a single manifest in `tile_dir`. Progress items keep
+    pointing at the shard directory that holds the tile image.
+    """
+    tile_dir = Path(tile_dir)
+    shards = find_shard_dirs(tile_dir)
+    if not shards:
+        raise RuntimeError(f"No shard directories found in {tile_dir}")
+
+    manifest = ProgressStore(tile_dir)
+    dead_letters = DeadLetterStore(tile_dir)
+
+    manifest.suspend_flush()
+    for d in shards:
+        for item in ProgressStore(d):
+            manifest.upsert_by_tile_index(item)
+            dead_letters.discard(item.tileIndex)
+        for item in DeadLetterStore(d):
+            dead_letters.add(item)
+        logger.info(f"Merged shard {d.name}")
+    manifest.resume_flush()
+    manifest.compact()
+    dead_letters.save()
+
+    logger.info(f"Merged {len(shards)} shards into {manifest.path}: {len(manifest)} tiles")
+    return manifest
@@ -8,4 +8,6 @@ class DownloadStatus(IntEnum):
     ALREADY_EXISTS = 500
     FAILED = 401
     EMPTY = 400
+    # the server refused the tile (4xx other than 408/429); not retried
+    CLIENT_ERROR = 404
 
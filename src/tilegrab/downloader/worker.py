@@ -1,4 +1,5 @@
 import logging
+import time
 import requests
 
 from tilegrab.downloader.runner import DownloadResult
@@ -8,12 +9,15 @@ from tilegrab.images import TileImage
 
 logger = logging.getLogger(__name__)
 
+# client errors that may succeed on a later attempt
+_RETRYABLE_CLIENT_ERRORS = (408, 429)
 
 
 def download_tile(
     tile: Tile,
     session: requests.Session,
     timeout: float,
+    decode: bool = True,
 ) -> DownloadResult:
     
     x, y, z = tile.index.x, tile.index.y, tile.index.z
@@ -27,8 +31,11 @@ def download_tile(
     
     logger.debug(f"Downloading tile: x={x}, y={y}, z={z}")
     
+    start = time.perf_counter()
     try:
         resp = session.get(url, timeout=timeout)
+        elapsed = time.perf_counter() - start
+        retries = _retry_count(resp)
         resp.raise_for_status()
 
         content_type = resp.headers.get("content-type", "")
@@ -37,14 +44,24 @@ def download_tile(
 
         if not resp.content:
             return DownloadResult(
-                tile=tile, status=DownloadStatus.EMPTY, result=None, url=url)
+                tile=tile, status=DownloadStatus.EMPTY, result=None, url=url,
+                elapsed=elapsed, retries=retries)
 
         return DownloadResult(
             tile=tile, 
             status=DownloadStatus.SUCCESS, 
             result=TileImage(
-                tile=tile, image=resp.content), url=url)
+                tile=tile, image=resp.content, lazy=not decode), url=url,
+            size=len(resp.content), elapsed=elapsed, retries=retries)
 
+    except requests.HTTPError as e:
+        code = e.response.status_code if e.response is not None else 0
+        if 400 <= code < 500 and code not in _RETRYABLE_CLIENT_ERRORS:
+            logger.warning("Tile %s/%s/%s refused: HTTP %s", z, x, y, code)
+            return DownloadResult(
+                tile=tile, status=DownloadStatus.CLIENT_ERROR, result=None, url=url,
+                elapsed=elapsed, retries=retries)
+        logger.warning("Request failed %s/%s/%s: %s", z, x, y, e)
     except requests.Timeout:
         logger.warning("Timeout fetching tile %s/%s/%s", z, x, y)
     except requests.RequestException as e:
@@ -52,4 +69,12 @@ def download_tile(
     except Exception:
         logger.exception("Unexpected error %s/%s/%s", z, x, y)
 
-    return DownloadResult(tile=tile, status=DownloadStatus.UNDEFINED, result=None, url=url)
\ No newline at end of file
+    return DownloadResult(
+        tile=tile, status=DownloadStatus.UNDEFINED, result=None, url=url,
+        elapsed=time.perf_counter() - start)
+
+
+def _retry_count(resp: requests.Response) -> int:
+    # urllib3 keeps the retry history of the final response on resp.raw.retries
+    history = getattr(getattr(resp.raw, "retries", None), "history", None)
+    return len(history) if isinstance(history, tuple) else 0
\ No newline at end of file
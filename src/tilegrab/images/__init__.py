@@ -1,9 +1,13 @@
 from .image import TileImage
 from .collection import TileImageCollection
 from .formats import ExportType
-from .loader import load_images
-from .grouping import group_image
-from .mosaic import mosaic
+from .loader import index_tiles, load_images, load_images_from_progress, load_images_from_store
+from .grouping import export_groups, group_image, plan_groups
+from .mosaic import mosaic, mosaic_array
 from .exporter import export_image
+from .geotiff import update_geotiff, write_cog, write_geotiff
+from .vrt import write_vrt
+from .pyramid import build_pyramid
+from .decoder import DecodePool
 
-__all__ = ["TileImage", "TileImageCollection", "ExportType", "load_images", "group_image", "mosaic", "export_image"]
\ No newline at end of file
+__all__ = ["TileImage", "TileImageCollection", "ExportType", "index_tiles", "load_images", "load_images_from_progress", "load_images_from_store", "export_groups", "group_image", "plan_groups", "mosaic", "mosaic_array", "export_image", "update_geotiff", "write_cog", "write_geotiff", "write_vrt", "build_pyramid", "DecodePool"]
\ No newline at end of file
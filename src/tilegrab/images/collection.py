@@ -12,6 +12,20 @@ logger = logging.getLogger(__name__)
 WEB_MERCATOR_EXTENT = 20037508.342789244
 EPSG = 3857
 
+def tile_bounds(zoom: int, minx: int, miny: int, maxx: int, maxy: int) -> Coordinate:
+    """EPSG:3857 bounds of the inclusive tile range `minx..maxx`, `miny..maxy`."""
+    n = 2**zoom
+    tile_size_m = 2 * WEB_MERCATOR_EXTENT / n
+
+    xmin = (WEB_MERCATOR_EXTENT * -1) + minx * tile_size_m
+    xmax = (WEB_MERCATOR_EXTENT * -1) + (maxx + 1) * tile_size_m
+
+    ymax = WEB_MERCATOR_EXTENT - miny * tile_size_m
+    ymin = WEB_MERCATOR_EXTENT - (maxy + 1) * tile_size_m
+
+    return Coordinate(xmin, ymin, xmax, ymax)
+
+
 class TileImageCollection:
     
     def __init__(
@@ -62,7 +76,7 @@ class TileImageCollection:
 
     def update_collection_dim(self):
         
-        if len(self.images) > 0:
+        if len(self.images) == 0:
             logger.warning("Attempting to update collection dimensions with no images")
             return
 
@@ -85,16 +99,7 @@ class TileImageCollection:
 
     @property
     def bounds(self) -> Coordinate:
-        n = 2**self.zoom
-        tile_size_m = 2 * WEB_MERCATOR_EXTENT / n
-
-        xmin = (WEB_MERCATOR_EXTENT * -1) + self.minx * tile_size_m
-        xmax = (WEB_MERCATOR_EXTENT * -1) + (self.maxx + 1) * tile_size_m
-
-        ymax = WEB_MERCATOR_EXTENT - self.miny * tile_size_m
-        ymin = WEB_MERCATOR_EXTENT - (self.maxy + 1) * tile_size_m
-
-        return Coordinate(xmin, ymin, xmax, ymax)
+        return tile_bounds(self.zoom, self.minx, self.miny, self.maxx, self.maxy)
 
     def save(self):
         for idx, img in enumerate(self):
@@ -0,0 +1,102 @@
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+from PIL import Image as PILImage
+from tilegrab.images.image import TileImage
+
+logger = logging.getLogger(__name__)
+
+# Modes whose raw buffer round-trips through `tobytes`/`frombytes` without a palette
+_SHAREABLE_MODES = {"L", "RGB", "RGBA"}
+_MAX_BANDS = 4
+
+
+def decode_to_shared_memory(data: bytes, name: str) -> Tuple[str, Tuple[int, int]]:
+    """
+    Validate and decode encoded tile bytes into the shared memory block
+    `name`, created by the parent. Runs inside a pool process.
+    """
+    with PILImage.open(BytesIO(data)) as img:
+        img.verify()
+
+    img = PILImage.open(BytesIO(data))
+    img.load()
+    if img.mode not in _SHAREABLE_MODES:
+        has_alpha = "transparency" in img.info or img.mode in ("LA", "PA")
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    raw = img.tobytes()
+    # the parent owns the block and unlinks it; pool processes share its resource tracker
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        shm.buf[:len(raw)] = raw
+    finally:
+        shm.close()
+    return img.mode, img.size
+
+
+def attach_shared_memory(shm: shared_memory.SharedMemory, mode: str, size: Tuple[int, int]) -> PILImage.Image:
+    """Copy decoded pixels out of `shm` into a new image."""
+    nbytes = size[0] * size[1] * PILImage.getmodebands(mode)
+    return PILImage.frombytes(mode, size, bytes(shm.buf[:nbytes]))
+
+
+def _free(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+class DecodePool:
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._blocks: Dict[Future, shared_memory.SharedMemory] = {}
+        logger.info(f"Decode pool started with {self._executor._max_workers} processes")
+
+    def __enter__(self) -> "DecodePool":
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def submit(self, image: TileImage) -> Future:
+        data = image.data
+        try:
+            with PILImage.open(BytesIO(data)) as img:
+                width, height = img.size
+        except Exception as e:
+            future: Future = Future()
+            future.set_exception(e)
+            return future
+
+        # the parent creates and keeps the block until `attach`, so it outlives the
+        # child's handle (on Windows a block is gone once its last handle closes)
+        shm = shared_memory.SharedMemory(create=True, size=max(width * height * _MAX_BANDS, 1))
+        future = self._executor.submit(decode_to_shared_memory, data, shm.name)
+        self._blocks[future] = shm
+        return future
+
+    def attach(self, future: Future, image: TileImage) -> bool:
+        index = image.index
+        shm = self._blocks.pop(future, None)
+        try:
+            mode, size = future.result()
+            assert shm is not None
+            image.set_decoded(attach_shared_memory(shm, mode, size))
+        except Exception as e:
+            logger.warning(f"Tile failed validation z={index.z},x={index.x},y={index.y}: {e}")
+            return False
+        finally:
+            if shm is not None:
+                _free(shm)
+        return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        # blocks of futures that were never attached, e.g. after an error mid-pass
+        for shm in self._blocks.values():
+            _free(shm)
+        self._blocks.clear()
@@ -0,0 +1,252 @@
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from tilegrab.dataset import Coordinate
+from tilegrab.images.formats import ExportType
+
+logger = logging.getLogger(__name__)
+
+EPSG = 3857
+
+Raster = Union[Image.Image, np.ndarray]
+
+# Encoder options per format: "default" matches the PIL/GDAL defaults,
+# "fast" trades output size for throughput, "small" the other way round.
+ENCODER_PROFILES: Dict[str, Dict[ExportType, Dict[str, Any]]] = {
+    "fast": {
+        ExportType.PNG: {"compress_level": 1},
+        ExportType.JPG: {"quality": 85},
+        ExportType.TIFF: {},
+    },
+    "default": {
+        ExportType.PNG: {},
+        ExportType.JPG: {},
+        ExportType.TIFF: {},
+    },
+    "small": {
+        ExportType.PNG: {"compress_level": 9, "optimize": True},
+        ExportType.JPG: {"quality": 80, "optimize": True, "progressive": True},
+        ExportType.TIFF: {"compress": "DEFLATE", "predictor": 2, "zlevel": 9, "tiled": True},
+    },
+}
+
+EXTENSIONS = {ExportType.PNG: "png", ExportType.JPG: "jpg", ExportType.TIFF: "tiff"}
+
+# raster copies and encoder working memory queued at once, in bytes
+MAX_PENDING_BYTES = 1 << 30
+
+# rows interleaved at a time when a band-first raster becomes a PIL image
+_STRIP_ROWS = 256
+
+# id of a canvas -> name of the shared memory block that is its whole buffer
+_SHARED_CANVASES: Dict[int, str] = {}
+
+
+def register_shared(canvas: np.ndarray, name: str):
+    """Record that `canvas` lives in shared memory block `name`, so encoders attach to it instead of copying."""
+    _SHARED_CANVASES[id(canvas)] = name
+    weakref.finalize(canvas, _SHARED_CANVASES.pop, id(canvas), None)
+
+
+def shared_name(img: Raster) -> Optional[str]:
+    return _SHARED_CANVASES.get(id(img)) if isinstance(img, np.ndarray) else None
+
+
+def as_pil(img: Raster) -> Image.Image:
+    if isinstance(img, Image.Image):
+        return img
+    if img.shape[0] == 1:
+        return Image.fromarray(img[0])
+    # a strip at a time, so the only full-size copy is PIL's own
+    out = None
+    for y in range(0, img.shape[1], _STRIP_ROWS):
+        strip = Image.fromarray(np.ascontiguousarray(img[:, y:y + _STRIP_ROWS].transpose(1, 2, 0)))
+        if out is None:
+            out = Image.new(strip.mode, (img.shape[2], img.shape[1]))
+        out.paste(strip, (0, y))
+    return out
+
+
+def as_bands(img: Raster) -> np.ndarray:
+    """`(bands, H, W)` pixels; a mosaic canvas is already in that order and is used as is."""
+    if isinstance(img, np.ndarray):
+        return img
+    return np.asarray(img).transpose(2, 0, 1)
+
+
+def encode(img: Raster, output_path: Path, fmt: ExportType, bounds: Coordinate, options: Dict[str, Any]) -> Path:
+    """Write one raster in one format. Runs in the caller or inside a pool process."""
+    if fmt == ExportType.TIFF:
+        import rasterio
+        from rasterio.transform import from_bounds
+
+        data = as_bands(img)
+        height_px, width_px = data.shape[1:]
+        transform = from_bounds(bounds.minx, bounds.miny, bounds.maxx, bounds.maxy, width_px, height_px)
+
+        with rasterio.open(
+            output_path,
+            "w",
+            driver="GTiff",
+            height=height_px,
+            width=width_px,
+            count=data.shape[0],
+            dtype=data.dtype,
+            crs=f"EPSG:{EPSG}",
+            transform=transform,
+            **options,
+        ) as dst:
+            dst.write(data)
+    else:
+        as_pil(img).save(output_path, format="JPEG" if fmt == ExportType.JPG else "PNG", **options)
+    return output_path
+
+
+def _encode_shared(name: str, shape: Tuple[int, ...], output_path: Path, fmt: ExportType,
+                   bounds: Coordinate, options: Dict[str, Any]) -> Path:
+    """Encode the `(bands, H, W)` raster in shared memory block `name`. Runs inside a pool process."""
+    # the parent owns the block and unlinks it; pool processes share its resource tracker
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        try:
+            return encode(img, output_path, fmt, bounds, options)
+        finally:
+            del img
+    finally:
+        shm.close()
+
+
+def _working_bytes(shape: Tuple[int, ...], fmt: ExportType) -> int:
+    """Memory one encode task allocates: PIL holds a PNG/JPG image at 4 bytes a pixel, GeoTIFFs are written from the bands."""
+    return 0 if fmt == ExportType.TIFF else shape[1] * shape[2] * 4
+
+
+class _PendingRaster:
+    """
+    One submitted raster in shared memory, read by all of its format tasks.
+    A canvas already in shared memory is used in place; anything else is
+    copied once and the copy freed after the last task.
+    """
+
+    def __init__(self, img: Raster, tasks: int):
+        self.name = shared_name(img)
+        self.img: Optional[Raster] = None
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        if self.name is not None:
+            # kept alive, and with it the block, until the last task is done
+            self.img = img
+            self.shape = img.shape
+            self.nbytes = 0
+        else:
+            data = as_bands(img)
+            self.shape = data.shape
+            self.nbytes = max(data.nbytes, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=self.nbytes)
+            np.ndarray(data.shape, dtype=np.uint8, buffer=self.shm.buf)[:] = data
+            self.name = self.shm.name
+        self.tasks = tasks
+
+    def free(self):
+        self.img = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+
+class ExportPipeline:
+    """
+    Encodes rasters to files, every (raster, format) pair as its own task in
+    a pool of `processes` (inline when 1 or less). Each raster is copied once
+    into shared memory that all of its format tasks read, unless it is a
+    `mosaic_array` canvas already there. `submit` blocks while more than
+    `max_pending_bytes` of raster copies and encoder working memory are
+    queued, so memory stays bounded while the caller produces more.
+    """
+
+    def __init__(
+        self,
+        formats: List[ExportType],
+        profile: str = "default",
+        processes: Optional[int] = None,
+        max_pending_bytes: Optional[int] = None,
+    ):
+        if profile not in ENCODER_PROFILES:
+            raise ValueError(f"Unknown encoder profile {profile}; use one of {tuple(ENCODER_PROFILES)}")
+        self.formats = [f for f in formats if f in EXTENSIONS]
+        self.options = ENCODER_PROFILES[profile]
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.max_pending_bytes = max_pending_bytes or MAX_PENDING_BYTES
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._futures: List[Future] = []
+        self._pending_bytes = 0
+        self._space = threading.Condition()
+        if self.processes > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes)
+
+    def __enter__(self) -> "ExportPipeline":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, img: Raster, output_dir: Path, name: str, bounds: Coordinate):
+        if not self.formats:
+            return
+
+        if self._executor is None:
+            for fmt in self.formats:
+                output_path = Path(output_dir) / f"{name}.{EXTENSIONS[fmt]}"
+                encode(img, output_path, fmt, bounds, self.options[fmt])
+                logger.info(f"Mosaic saved to {output_path}")
+            return
+
+        raster_bytes = 0 if shared_name(img) is not None else as_bands(img).nbytes
+        shape = as_bands(img).shape
+        task_bytes = {fmt: _working_bytes(shape, fmt) for fmt in self.formats}
+        nbytes = raster_bytes + sum(task_bytes.values())
+        with self._space:
+            # a raster larger than the budget still goes through once nothing else is queued
+            self._space.wait_for(
+                lambda: self._pending_bytes == 0 or self._pending_bytes + nbytes <= self.max_pending_bytes)
+            self._pending_bytes += nbytes
+
+        raster = _PendingRaster(img, len(self.formats))
+        for fmt in self.formats:
+            output_path = Path(output_dir) / f"{name}.{EXTENSIONS[fmt]}"
+            future = self._executor.submit(
+                _encode_shared, raster.name, raster.shape, output_path, fmt, bounds, self.options[fmt])
+            future.add_done_callback(
+                lambda f, raster=raster, fmt=fmt: self._done(f, raster, task_bytes[fmt], raster_bytes))
+            self._futures.append(future)
+
+    def _done(self, future: Future, raster: _PendingRaster, task_bytes: int, raster_bytes: int):
+        with self._space:
+            raster.tasks -= 1
+            self._pending_bytes -= task_bytes
+            if raster.tasks == 0:
+                raster.free()
+                self._pending_bytes -= raster_bytes
+            self._space.notify_all()
+        if future.exception() is None:
+            logger.info(f"Mosaic saved to {future.result()}")
+
+    def close(self):
+        """Wait for every queued encode; re-raises the first failure."""
+        if self._executor is None:
+            return
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._futures.clear()
@@ -1,76 +1,37 @@
 import logging
 from pathlib import Path
-import types
-from typing import Generator, Iterator, List, Union
-from PIL import Image
+from typing import List, Optional
 from tilegrab.dataset import Coordinate
 from tilegrab.images import ExportType
+from tilegrab.images.encoder import ExportPipeline, Raster
 
 logger = logging.getLogger(__name__)
-WEB_MERCATOR_EXTENT = 20037508.342789244
-EPSG = 3857
 
 
 def export_image(
-    images: Union[List[Image.Image], Iterator[Image.Image]],
+    images: List[Raster],
     output_dir: Path,
     bounds: Coordinate,
     formats: list[ExportType],
+    name: str = "mosaic",
+    profile: str = "default",
+    processes: Optional[int] = None,
 ):
-    
-    index = ""
-    if isinstance(images, types.GeneratorType):
-        output_dir = output_dir / "groups"
-        output_dir.mkdir(parents=True, exist_ok=True)
+    """
+    Write every image, all covering `bounds`, in each of `formats`; several
+    images are numbered `1_<name>`, `2_<name>`, ... Images and formats are
+    encoded concurrently by an `ExportPipeline` with `processes` workers and
+    the given encoder `profile`; a single image in a single format is
+    encoded in place. Tile groups, each with its own bounds, are written by
+    `export_groups`.
+    """
+    if len(images) * len(formats) <= 1:
+        processes = 0
 
-        if ExportType.TIFF in formats:
-            raise NotImplementedError("Export grouped tiffs currently not supported")
-        
     output_dir.mkdir(parents=True, exist_ok=True)
     logger.info(f"Saving outputs into {output_dir}")
 
-    idx = 1
-    for img in images:
-        if isinstance(images, types.GeneratorType):
-            index = f"{idx}_"
-
-        if ExportType.PNG in formats:
-            output_path = output_dir / f"{index}mosaic.png"
-            img.save(output_path)
-            logger.info(f"Mosaic saved to {output_path}")
-
-        if ExportType.JPG in formats:
-            output_path = output_dir / f"{index}mosaic.jpg"
-            img.save(output_path)
-            logger.info(f"Mosaic saved to {output_path}")
-
-        if ExportType.TIFF in formats:
-            output_path = output_dir / f"{index}mosaic.tiff"
-
-            import numpy as np
-            from rasterio.transform import from_bounds
-            import rasterio
-
-            data = np.array(img)
-            data = data.transpose(2, 0, 1)
-
-            width_px, height_px = img.size
-
-            transform = from_bounds(bounds.minx, bounds.miny, bounds.maxx, bounds.maxy, width_px, height_px)
-
-            with rasterio.open(
-                output_path,
-                "w",
-                driver="GTiff",
-                height=height_px,
-                width=width_px,
-                count=data.shape[0],
-                dtype=data.dtype,
-                crs=f"EPSG:{EPSG}",
-                transform=transform,
-            ) as dst:
-                dst.write(data)
-
-            logger.info(f"Mosaic saved to {output_path}")
-        
-        idx += 1
\ No newline at end of file
+    with ExportPipeline(formats, profile=profile, processes=processes) as pipeline:
+        for idx, img in enumerate(images, start=1):
+            index = f"{idx}_" if len(images) > 1 else ""
+            pipeline.submit(img, output_dir, f"{index}{name}", bounds)
@@ -3,4 +3,6 @@ from enum import IntEnum
 class ExportType(IntEnum):
     PNG = 1
     JPG = 2
-    TIFF = 3
\ No newline at end of file
+    TIFF = 3
+    COG = 4
+    VRT = 5
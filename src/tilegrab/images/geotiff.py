@@ -0,0 +1,239 @@
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from tilegrab.images.collection import EPSG, TileImageCollection, tile_bounds
+from tilegrab.images.image import TileImage
+
+logger = logging.getLogger(__name__)
+
+
+def write_geotiff(
+    images: TileImageCollection,
+    output_path: Path,
+    band_size: int = 8,
+    workers: Optional[int] = None,
+    **creation_options,
+) -> Path:
+    """
+    Mosaic `images` straight into a tiled GeoTIFF, `band_size` tile rows at a
+    time. Each band is decoded over `workers` threads, written into its
+    window and released, so peak memory is one band rather than the whole
+    output. `creation_options` are passed through to the GTiff driver
+    (e.g. `compress="DEFLATE"`).
+    """
+    from tilegrab.images.mosaic import paste_tiles
+    import rasterio
+    from rasterio.transform import from_bounds
+    from rasterio.windows import Window
+
+    if not images:
+        raise ValueError("No images to mosaic")
+    band_size = max(1, band_size)
+
+    tile_w, tile_h = images[0].width, images[0].height
+    width, height = images.width, images.height
+    bounds = images.bounds
+
+    rows: Dict[int, List[TileImage]] = {}
+    for img in images:
+        rows.setdefault(img.index.y, []).append(img)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    profile = dict(
+        driver="GTiff",
+        height=height,
+        width=width,
+        count=3,
+        dtype="uint8",
+        crs=f"EPSG:{EPSG}",
+        transform=from_bounds(bounds.minx, bounds.miny, bounds.maxx, bounds.maxy, width, height),
+        tiled=True,
+        blockxsize=tile_w,
+        blockysize=tile_h,
+        BIGTIFF="IF_SAFER",
+    )
+    profile.update(creation_options)
+
+    with rasterio.open(output_path, "w", **profile) as dst:
+        for first in range(images.miny, images.maxy + 1, band_size):
+            last = min(first + band_size, images.maxy + 1)
+            band = np.zeros((3, (last - first) * tile_h, width), dtype=np.uint8)
+            paste_tiles(band, [
+                (img, (y - first) * tile_h, (img.index.x - images.minx) * tile_w)
+                for y in range(first, last) for img in rows.get(y, [])], workers)
+
+            row_off = (first - images.miny) * tile_h
+            dst.write(band, window=Window(0, row_off, width, band.shape[1]))
+            logger.debug(f"Wrote tile rows {first}-{last - 1} to {output_path}")
+
+    logger.info(f"Mosaic saved to {output_path}")
+    return output_path
+
+
+COG_COMPRESSION = ("DEFLATE", "JPEG", "WEBP")
+
+
+def write_cog(
+    images: TileImageCollection,
+    output_path: Path,
+    compress: str = "DEFLATE",
+    quality: int = 85,
+    band_size: int = 8,
+    workers: Optional[int] = None,
+) -> Path:
+    """
+    Write a Cloud-Optimized GeoTIFF: internally tiled, compressed, with
+    averaged internal overviews. The mosaic is streamed into a temporary
+    GeoTIFF first, then GDAL's COG driver builds the overviews and lays out
+    the final file. Decoding and GDAL both use `workers` threads (all CPUs
+    by default).
+    """
+    import rasterio
+    import rasterio.shutil
+
+    compress = compress.upper()
+    if compress not in COG_COMPRESSION:
+        raise ValueError(f"Unsupported COG compression {compress}; use one of {COG_COMPRESSION}")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tile_w = images[0].width if images else 256
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as tmp:
+        staging = write_geotiff(
+            images, Path(tmp) / "staging.tif", band_size=band_size, workers=workers,
+            compress="DEFLATE", zlevel=1)
+
+        options = dict(
+            driver="COG",
+            compress=compress,
+            blocksize=tile_w,
+            overview_resampling="AVERAGE",
+            num_threads=str(workers) if workers else "ALL_CPUS",
+            bigtiff="IF_SAFER",
+        )
+        if compress in ("JPEG", "WEBP"):
+            options["quality"] = quality
+        else:
+            options["predictor"] = 2
+
+        with rasterio.Env(GDAL_NUM_THREADS=options["num_threads"]):
+            rasterio.shutil.copy(staging, output_path, **options)
+
+    logger.info(f"COG saved to {output_path} ({compress})")
+    return output_path
+
+
+# (row_start, col_start, row_stop, col_stop) in pixels of one raster level
+_Box = Tuple[int, int, int, int]
+
+
+def _average(data: np.ndarray, ratio: int, shape: Tuple[int, int]) -> np.ndarray:
+    """Average `ratio`x`ratio` blocks of `data` into `shape`, ignoring pixels past its edge."""
+    bands, h, w = data.shape
+    out_h, out_w = shape
+    sums = np.zeros((bands, out_h * ratio, out_w * ratio), dtype=np.float32)
+    sums[:, :h, :w] = data
+    counts = np.zeros((out_h * ratio, out_w * ratio), dtype=np.float32)
+    counts[:h, :w] = 1
+    sums = sums.reshape(bands, out_h, ratio, out_w, ratio).sum(axis=(2, 4))
+    counts = counts.reshape(out_h, ratio, out_w, ratio).sum(axis=(1, 3))
+    return np.rint(sums / np.maximum(counts, 1)).astype(np.uint8)
+
+
+def _refresh_overviews(path: Path, boxes: Set[_Box]):
+    """
+    Recompute the overview pixels covering `boxes` (full resolution), each
+    level averaged from the one above as GDAL's AVERAGE resampling does.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import Window
+
+    with rasterio.open(path) as src:
+        factors = [1] + src.overviews(1)
+
+    for level in range(1, len(factors)):
+        ratio, rest = divmod(factors[level], factors[level - 1])
+        if rest:
+            logger.info(f"Overview factors {factors[1:]} are not nested; rebuilding all overviews")
+            with rasterio.open(path, "r+", IGNORE_COG_LAYOUT_BREAK="YES") as dst:
+                dst.build_overviews(factors[1:], Resampling.average)
+            return
+
+        above = {} if level == 1 else {"overview_level": level - 2}
+        boxes = {(r0 // ratio, c0 // ratio, -(-r1 // ratio), -(-c1 // ratio)) for r0, c0, r1, c1 in boxes}
+        with rasterio.open(path, **above) as src:
+            blocks = []
+            for box in boxes:
+                r0, c0, r1, c1 = (v * ratio for v in box)
+                r1, c1 = min(r1, src.height), min(c1, src.width)
+                blocks.append((box, src.read(window=Window(c0, r0, c1 - c0, r1 - r0))))
+
+        with rasterio.open(path, "r+", overview_level=level - 1, IGNORE_COG_LAYOUT_BREAK="YES") as dst:
+            for (r0, c0, r1, c1), data in blocks:
+                pixels = _average(data, ratio, (r1 - r0, c1 - c0))
+                r1, c1 = min(r1, dst.height), min(c1, dst.width)
+                dst.write(pixels[:, :r1 - r0, :c1 - c0], window=Window(c0, r0, c1 - c0, r1 - r0))
+        logger.debug(f"Refreshed {len(blocks)} windows of overview x{factors[level]}")
+
+
+def update_geotiff(
+    images: Sequence[TileImage],
+    output_path: Path,
+    workers: Optional[int] = None,
+) -> Path:
+    """
+    Rewrite only the windows of `images` in an existing GeoTIFF or COG
+    mosaic, in place, then refresh just the overview pixels they cover, so
+    the cost follows the number of changed tiles rather than the mosaic
+    area. A COG stays a valid tiled GeoTIFF but loses its optimized byte
+    layout. Raises ValueError if a tile is off the mosaic's grid; the mosaic
+    then has to be rebuilt.
+    """
+    import rasterio
+    from rasterio.windows import Window
+    from tilegrab.images.mosaic import _rgb_bands
+
+    output_path = Path(output_path)
+    if not images:
+        logger.info(f"No changed tiles; {output_path} is up to date")
+        return output_path
+
+    boxes: Set[_Box] = set()
+    with rasterio.open(output_path, "r+", IGNORE_COG_LAYOUT_BREAK="YES") as dst:
+        if dst.count != 3:
+            raise ValueError(f"{output_path} has {dst.count} bands, expected an RGB mosaic")
+
+        res_x, res_y = dst.res
+        windows = []
+        for img in images:
+            b = tile_bounds(img.index.z, img.index.x, img.index.y, img.index.x, img.index.y)
+            if abs((b.maxx - b.minx) / img.width - res_x) > res_x * 1e-6:
+                raise ValueError(f"Tile {img.index} does not match the resolution of {output_path}")
+            row, col = dst.index(b.minx + res_x / 2, b.maxy - res_y / 2)
+            if row < 0 or col < 0 or row + img.height > dst.height or col + img.width > dst.width:
+                raise ValueError(f"Tile {img.index} is outside of {output_path}")
+            windows.append(Window(col, row, img.width, img.height))
+
+        def decode(img: TileImage) -> np.ndarray:
+            bands = _rgb_bands(img.image)
+            img.release()
+            return bands
+
+        # decode in parallel; the dataset itself is written from this thread only
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for window, bands in zip(windows, executor.map(decode, images)):
+                dst.write(bands, window=window)
+                boxes.add((window.row_off, window.col_off,
+                           window.row_off + window.height, window.col_off + window.width))
+
+    _refresh_overviews(output_path, boxes)
+    logger.info(f"Updated {len(images)} tiles in {output_path}")
+    return output_path
@@ -1,18 +1,29 @@
 import logging
-from typing import Iterator
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import numpy as np
 from PIL import Image as PILImage
 from numpy.lib.stride_tricks import sliding_window_view
+from tilegrab.dataset import Coordinate
+from tilegrab.images.collection import TileImageCollection, tile_bounds
+from tilegrab.images.formats import ExportType
+from tilegrab.images.image import TileImage
 
 logger = logging.getLogger(__name__)
 
 def group_image(
-    image: PILImage.Image,
+    image: Union[PILImage.Image, np.ndarray],
     tile_w: int,
     tile_h: int,
     group_w: int,
     group_h: int,
 ) -> Iterator:
+    if isinstance(image, np.ndarray):
+        yield from _group_bands(image, tile_h * group_h, tile_w * group_w)
+        return
+
     arr = np.asarray(image)
     kh, kw = tile_h * group_h, tile_w * group_w
 
@@ -27,3 +38,113 @@ def group_image(
                 yield PILImage.fromarray(patch)
             else:
                 logger.debug(f"Skip no-data group {i}{j}")
+
+
+def _group_bands(canvas: np.ndarray, kh: int, kw: int) -> Iterator[np.ndarray]:
+    """Views of a `(bands, H, W)` mosaic canvas, one per non-empty group."""
+    for i in range(0, canvas.shape[1], kh):
+        for j in range(0, canvas.shape[2], kw):
+            patch = canvas[:, i:i + kh, j:j + kw]
+            if patch.shape[1:] == (kh, kw) and patch.any():
+                yield patch
+            else:
+                logger.debug(f"Skip no-data group {i}{j}")
+
+
+@dataclass
+class TileGroup:
+    """A `group_w` x `group_h` block of tiles (inclusive tile range) and the tiles that fall in it."""
+    minx: int
+    miny: int
+    maxx: int
+    maxy: int
+    images: List[TileImage] = field(default_factory=list)
+
+    def bounds(self, zoom: int) -> Coordinate:
+        return tile_bounds(zoom, self.minx, self.miny, self.maxx, self.maxy)
+
+
+def plan_groups(
+    images: TileImageCollection,
+    group_w: int,
+    group_h: int,
+    overlap: bool = False,
+) -> List[TileGroup]:
+    """
+    Assign every tile to its group(s) on a grid anchored at the collection's
+    top-left tile, in row-major order. Only groups holding at least one tile
+    are created. With `overlap`, each group also takes the first tile
+    column and row of the next group. Groups at the right and bottom edges
+    are clipped to the collection.
+    """
+    if group_w < 1 or group_h < 1:
+        raise ValueError(f"Invalid group size {group_w}x{group_h}")
+
+    groups: Dict[Tuple[int, int], TileGroup] = {}
+    extra = 1 if overlap else 0
+
+    for img in images:
+        rx, ry = img.index.x - images.minx, img.index.y - images.miny
+        gxs = {rx // group_w}
+        gys = {ry // group_h}
+        if overlap and rx and rx % group_w == 0:
+            gxs.add(rx // group_w - 1)
+        if overlap and ry and ry % group_h == 0:
+            gys.add(ry // group_h - 1)
+
+        for gy in gys:
+            for gx in gxs:
+                group = groups.get((gy, gx))
+                if group is None:
+                    minx, miny = images.minx + gx * group_w, images.miny + gy * group_h
+                    group = groups[(gy, gx)] = TileGroup(
+                        minx, miny,
+                        min(minx + group_w - 1 + extra, images.maxx),
+                        min(miny + group_h - 1 + extra, images.maxy))
+                group.images.append(img)
+
+    return [groups[key] for key in sorted(groups)]
+
+
+def export_groups(
+    images: TileImageCollection,
+    output_dir: Path,
+    group_w: int,
+    group_h: int,
+    formats: List[ExportType],
+    overlap: bool = False,
+    workers: Optional[int] = None,
+    profile: str = "default",
+    processes: Optional[int] = None,
+) -> int:
+    """
+    Write each non-empty group as `groups/<n>_mosaic.<ext>`, assembling its
+    canvas straight from its member tiles (decoded in parallel) rather than
+    cutting it out of a full mosaic. GeoTIFFs get the group's own bounds.
+    Encoding runs in an `ExportPipeline` while the next groups are
+    assembled. Returns the number of groups written.
+    """
+    from tilegrab.images.encoder import ExportPipeline
+    from tilegrab.images.mosaic import paste_tiles
+
+    if not images:
+        raise ValueError("No images to mosaic")
+
+    tile_w, tile_h = images[0].width, images[0].height
+    groups = plan_groups(images, group_w, group_h, overlap)
+    cols = math.ceil((images.maxx - images.minx + 1) / group_w)
+    rows = math.ceil((images.maxy - images.miny + 1) / group_h)
+    logger.info(f"Writing {len(groups)} groups of {group_w}x{group_h} tiles ({cols * rows - len(groups)} empty groups skipped)")
+
+    output_dir = Path(output_dir) / "groups"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with ExportPipeline(formats, profile=profile, processes=processes) as pipeline:
+        for n, group in enumerate(groups, start=1):
+            canvas = np.zeros(
+                (3, (group.maxy - group.miny + 1) * tile_h, (group.maxx - group.minx + 1) * tile_w), dtype=np.uint8)
+            paste_tiles(canvas, [
+                (img, (img.index.y - group.miny) * tile_h, (img.index.x - group.minx) * tile_w)
+                for img in group.images], workers)
+            pipeline.submit(canvas, output_dir, f"{n}_mosaic", group.bounds(images.zoom))
+
+    return len(groups)
@@ -2,7 +2,7 @@ import io
 import logging
 from dataclasses import dataclass
 from pathlib import Path, PosixPath, WindowsPath
-from typing import Any, Union
+from typing import Any, Callable, Optional, Tuple, Union
 from PIL import Image as PILImage
 from tilegrab.dataset import Coordinate
 from tilegrab.tiles import Tile, TileIndex
@@ -10,23 +10,112 @@ from tilegrab.tiles import Tile, TileIndex
 logger = logging.getLogger(__name__)
 
 
+class _FileRange(io.RawIOBase):
+    """
+    Read-only file object over `length` bytes at `offset` of a file, so PIL
+    reads a tile in place (just the header for `.size`) without copying it.
+    """
+
+    def __init__(self, file: Path, offset: int, length: int):
+        super().__init__()
+        self._fp = open(file, "rb", buffering=0)
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        base = (0, self._pos, self._length)[whence]
+        self._pos = max(0, base + pos)
+        return self._pos
+
+    def readinto(self, b) -> int:
+        n = min(len(b), self._length - self._pos)
+        if n <= 0:
+            return 0
+        self._fp.seek(self._offset + self._pos)
+        read = self._fp.readinto(memoryview(b)[:n]) or 0
+        self._pos += read
+        return read
+
+    def close(self):
+        self._fp.close()
+        super().close()
+
 
 @dataclass
 class TileImage:
-    width: int = 256
-    height: int = 256
     format:str = "png"
 
     def __init__(self, 
             tile: Tile, 
-            image: Union[bytes, bytearray]) -> None:
-        from io import BytesIO
+            image: Union[bytes, bytearray],
+            lazy: bool = False) -> None:
 
-        assert tile.index.z and tile.index.y and tile.index.x
+        assert tile.index.z >= 0 and tile.index.y >= 0 and tile.index.x >= 0
         self._tile = tile
+        self._data: Union[bytes, None] = bytes(image)
+        self._source: Union[Tuple[Path, int, int], None] = None
+        self._fp: Union[io.BufferedReader, None] = None
+        self._img: Union[PILImage.Image, None] = None
+        self._decoded = False
+        self._path: Union[Path, None] = None
+        self._size: Union[Tuple[int, int], None] = None
+        # called with the pixels each time this tile is decoded (e.g. to cache them)
+        self.on_decode: Optional[Callable[[PILImage.Image], None]] = None
+
+        if not lazy:
+            self._open()
+
+    @classmethod
+    def from_file(
+            cls,
+            tile: Tile,
+            file: Path,
+            offset: int = 0,
+            length: Union[int, None] = None) -> "TileImage":
+        """
+        A tile backed by `file` (or `length` bytes at `offset` of a pack
+        file). Nothing is read until the bytes or pixels are accessed.
+        """
+        file = Path(file)
+        if length is None:
+            length = file.stat().st_size - offset
+
+        img = cls.__new__(cls)
+        img._tile = tile
+        img._data = None
+        img._source = (file, offset, length)
+        img._fp = None
+        img._img = None
+        img._decoded = False
+        img._path = None
+        img._size = None
+        img.on_decode = None
+        return img
+
+    def _reader(self) -> io.BufferedIOBase:
+        if self._data is not None:
+            # shares the bytes, no copy
+            return io.BytesIO(self._data)
+        assert self._source is not None
+        return io.BufferedReader(_FileRange(*self._source))
+
+    def _open(self) -> PILImage.Image:
+        tile = self._tile
         try:
-            self._img = PILImage.open(BytesIO(image))
-            # self._img.load()
+            self._close()
+            # PIL reads from the file as it decodes; closed once decoded or released
+            self._fp = self._reader()
+            self._img = PILImage.open(self._fp)
             logger.debug(
                 f"TileImage created for z={tile.index.z},x={tile.index.x},y={tile.index.y}")
         except Exception as e:
@@ -37,7 +126,30 @@ class TileImage:
             logger.error(e)
             raise RuntimeError
 
-        self._path: Union[Path, None] = None
+        return self._img
+
+    def release(self):
+        """Drop decoded pixels and close the backing file; they are reloaded on access."""
+        self._img = None
+        self._decoded = False
+        self._close()
+
+    def _close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __getstate__(self):
+        # ship the encoded bytes only; pixels are decoded again on access
+        state = self.__dict__.copy()
+        state["_img"] = None
+        state["_decoded"] = False
+        state["_fp"] = None
+        state["on_decode"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def __repr__(self) -> str:
         return f"TileImage; name={self.name}; path={self.path}; url={self.url}; position={self.index}"
@@ -45,7 +157,11 @@ class TileImage:
     def save(self):
         try:
             img_location = self.path / self.name
-            self._img.save(fp=img_location, format=self.format)
+            if self._source is not None and self._source[0] == img_location:
+                logger.debug(f"Image already saved at {img_location}")
+                return
+            img = self._img or self._open()
+            img.save(fp=img_location, format=self.format)
             logger.debug(f"Image saved to {self.path}")
         except Exception as e:
             logger.error(f"Failed to save image to {self.path}", exc_info=True)
@@ -55,6 +171,25 @@ class TileImage:
     def name(self) -> str:
         return f"{self._tile.index.z}_{self._tile.index.x}_{self._tile.index.y}.{self.format}"
 
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Pixel size, read from the image header on first access; nothing is decoded."""
+        if self._size is None:
+            if self._img is not None:
+                self._size = self._img.size
+            else:
+                with self._reader() as fp, PILImage.open(fp) as img:
+                    self._size = img.size
+        return self._size
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
     @property
     def tile(self) -> Tile:
         return self._tile
@@ -65,8 +200,47 @@ class TileImage:
 
     @property
     def image(self) -> PILImage.Image:
-        self._img.load()
-        return self._img
+        img = self._img or self._open()
+        if not self._decoded:
+            img.load()
+            self._close()
+            self._decoded = True
+            if self.on_decode is not None:
+                self.on_decode(img)
+        return img
+
+    @property
+    def data(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        assert self._source is not None
+        file, offset, length = self._source
+        with open(file, "rb") as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    @property
+    def file(self) -> Union[Path, None]:
+        """The file holding exactly this tile's bytes, if it is file-backed."""
+        if self._source is None:
+            return None
+        file, offset, length = self._source
+        return file if offset == 0 and length == file.stat().st_size else None
+
+    @property
+    def source(self) -> Union[Tuple[Path, int, int], None]:
+        """`(file, offset, length)` of a file-backed tile, so a worker process can read the bytes itself."""
+        return self._source
+
+    @property
+    def decoded(self) -> bool:
+        return self._decoded
+
+    def set_decoded(self, img: PILImage.Image):
+        self._img = img
+        self._decoded = True
+        if self.on_decode is not None:
+            self.on_decode(img)
 
     @property
     def path(self) -> Path:
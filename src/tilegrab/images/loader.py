@@ -1,38 +1,75 @@
-import re
 import logging
 from pathlib import Path
-from typing import List, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 from tilegrab.images.image import TileImage
+from tilegrab.store.layout import get_layout
 from tilegrab.tiles import TileCollection
-from tilegrab.tiles.tile import Tile
+from tilegrab.tiles.tile import Tile, TileIndex
+
+if TYPE_CHECKING:
+    from tilegrab.downloader.progress import ProgressStore
+    from tilegrab.store import TileStore
 
 logger = logging.getLogger(__name__)
 
 
-_TILE_RE = re.compile(r"^(\d+)_(\d+)_(\d+)\.\w+$")
+def index_tiles(path: Path, layout: str = "flat") -> Dict[TileIndex, Path]:
+    """Map every tile file saved under `path` in the given layout to its tile index, in one walk."""
+    return get_layout(layout).index(Path(path))
+
+
+def read_image(tile: Tile, file: Path) -> TileImage:
+    """A saved tile, memory-mapped and decoded on first access."""
+    img = TileImage.from_file(tile, file)
+    img.path = file.parent
+    return img
 
 
 def load_images(
     path: Path,
     tiles: Union[TileCollection, List[Tile]],
+    index: Optional[Dict[TileIndex, Path]] = None,
+    layout: str = "flat",
 ) -> list[TileImage]:
-    images: list[TileImage] = []
-    files = [p for p in path.glob("*") if p.is_file()]
+    """Saved tiles in collection order; files are only read when an image is first used."""
+    if index is None:
+        index = index_tiles(Path(path), layout)
 
-    for tile in tiles:
-        for f in files:
-            m = _TILE_RE.match(f.name)
-            if not m:
-                continue
-
-            z, x, y = map(int, m.groups())
-            if (x, y, z) == (tile.index.x, tile.index.y, tile.index.z):
-                with open(f, "rb") as fp:
-                    img = TileImage(tile, fp.read())
-                    img.path = f
-                    img.tile = tile
-                    images.append(img)
-                break
+    images = [read_image(tile, index[tile.index]) for tile in tiles if tile.index in index]
 
     logger.info(f"Loaded {len(images)} images from {path}")
-    return images
\ No newline at end of file
+    return images
+
+
+def load_images_from_progress(
+    progress_store: "ProgressStore",
+    tiles: Union[TileCollection, List[Tile]],
+    layout: str = "flat",
+) -> list[TileImage]:
+    """Load tiles from wherever a (merged) progress manifest says they were saved."""
+    from tilegrab.downloader.status import DownloadStatus
+
+    saved = {}
+    for item in progress_store:
+        if item.downloadStatus in (DownloadStatus.SUCCESS, DownloadStatus.SKIP_AND_EXISTS):
+            saved[item.tileIndex] = item.tileImagePath
+
+    by_dir: Dict[Path, List[Tile]] = {}
+    for tile in tiles:
+        if tile.index in saved:
+            by_dir.setdefault(saved[tile.index], []).append(tile)
+
+    images: list[TileImage] = []
+    for d, dir_tiles in by_dir.items():
+        images.extend(load_images(d, dir_tiles, layout=layout))
+    return images
+
+
+def load_images_from_store(
+    store: "TileStore",
+    tiles: Union[TileCollection, List[Tile]],
+) -> list[TileImage]:
+    """Load the given tiles from an MBTiles/PMTiles/directory tile store."""
+    images = [img for img in (store.load(tile) for tile in tiles) if img is not None]
+    logger.info(f"Loaded {len(images)} images from {store.__class__.__name__}")
+    return images
@@ -1,6 +1,17 @@
 import logging
+import os
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from io import BytesIO
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 from PIL import Image
 from tilegrab.images import TileImageCollection
+from tilegrab.images.encoder import register_shared
+from tilegrab.images.image import TileImage
 
 logger = logging.getLogger(__name__)
 
@@ -23,5 +34,125 @@ def mosaic(images: TileImageCollection) -> Image.Image:
         px = (img.index.x - minx) * tile_w
         py = (img.index.y - miny) * tile_h
         out.paste(img.image, (px, py))
+        img.release()
+
+    return out
+
+
+def _rgb_bands(img: Image.Image) -> np.ndarray:
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img).transpose(2, 0, 1)
+
+
+def paste_tiles(
+    canvas: np.ndarray,
+    placements: Sequence[Tuple[TileImage, int, int]],
+    workers: Optional[int] = None,
+):
+    """
+    Decode each `(image, py, px)` straight into its slice of a `(3, H, W)`
+    canvas over `workers` threads, releasing every tile once it is written.
+    PIL decoders and NumPy copies both drop the GIL, so this scales with cores.
+    """
+    def paste(placement: Tuple[TileImage, int, int]):
+        img, py, px = placement
+        bands = _rgb_bands(img.image)
+        canvas[:, py:py + bands.shape[1], px:px + bands.shape[2]] = bands
+        img.release()
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(placements) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in executor.map(paste, placements):
+                pass
+    else:
+        for placement in placements:
+            paste(placement)
+
+
+def _decode_into_shared(
+        name: str,
+        shape: Tuple[int, int, int],
+        data: Union[bytes, Tuple[Path, int, int]],
+        py: int,
+        px: int):
+    """
+    Decode one tile, given as bytes or as the `(file, offset, length)` it is
+    stored at, into the shared canvas `name`. Runs inside a pool process.
+    """
+    if not isinstance(data, bytes):
+        file, offset, length = data
+        with open(file, "rb") as fp:
+            fp.seek(offset)
+            data = fp.read(length)
+    # the parent owns the block and unlinks it; pool processes share its resource tracker
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        canvas = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        with Image.open(BytesIO(data)) as img:
+            bands = _rgb_bands(img)
+        canvas[:, py:py + bands.shape[1], px:px + bands.shape[2]] = bands
+        del canvas
+    finally:
+        shm.close()
+
+
+def _free_shared(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+def mosaic_array(
+    images: TileImageCollection,
+    workers: Optional[int] = None,
+    processes: int = 0,
+) -> np.ndarray:
+    """
+    Mosaic `images` into one preallocated `(3, H, W)` uint8 canvas, band
+    first as rasterio writes it. Tiles are decoded in parallel directly into
+    their canvas slices, on `workers` threads or, with `processes`, in a
+    process pool writing into a shared-memory canvas.
+    """
+    if not images:
+        raise ValueError("No images to mosaic")
+
+    xs = [i.index.x for i in images]
+    ys = [i.index.y for i in images]
+    minx, miny = min(xs), min(ys)
+    tile_w, tile_h = images[0].width, images[0].height
+    shape = (3, (max(ys) - miny + 1) * tile_h, (max(xs) - minx + 1) * tile_w)
+
+    placements: List[Tuple[TileImage, int, int]] = [
+        (img, (img.index.y - miny) * tile_h, (img.index.x - minx) * tile_w) for img in images]
+
+    if processes <= 0:
+        canvas = np.zeros(shape, dtype=np.uint8)
+        paste_tiles(canvas, placements, workers)
+        return canvas
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    canvas = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    canvas.fill(0)
+    # the block lives exactly as long as the canvas and any views of it
+    weakref.finalize(canvas, _free_shared, shm)
+    register_shared(canvas, shm.name)
+
+    # a bounded window of submissions: the executor holds every queued call's arguments
+    window = processes * 4
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = set()
+        for img, py, px in placements:
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            # file-backed tiles are read by the worker, not copied through the parent
+            pending.add(executor.submit(
+                _decode_into_shared, shm.name, shape, img.source or img.data, py, px))
+            img.release()
+        for future in pending:
+            future.result()
 
-    return out
\ No newline at end of file
+    logger.debug(f"Decoded {len(placements)} tiles over {processes} processes")
+    return canvas
@@ -0,0 +1,115 @@
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Set
+
+from PIL import Image as PILImage
+from tilegrab.downloader.progress import ProgressItem, ProgressStore
+from tilegrab.downloader.status import DownloadStatus
+from tilegrab.store import TileStore, detect_format
+from tilegrab.tiles import TileIndex
+
+logger = logging.getLogger(__name__)
+
+_SAVE_FORMATS = {"png": ("PNG", {}), "jpg": ("JPEG", {"quality": 90}), "webp": ("WEBP", {"quality": 90})}
+
+
+def children(index: TileIndex) -> List[TileIndex]:
+    """The four tiles one zoom level down that `index` covers, in row-major order."""
+    x, y, z = 2 * index.x, 2 * index.y, index.z + 1
+    return [TileIndex(x=x + dx, y=y + dy, z=z) for dy in (0, 1) for dx in (0, 1)]
+
+
+def downsample(store: TileStore, index: TileIndex) -> Optional[bytes]:
+    """
+    Encode tile `index` from its (up to four) children in `store`, averaging
+    each 2x2 block of pixels. Missing children stay transparent in PNG and
+    WebP tiles and black in JPEG ones. Returns None when no child exists.
+    """
+    found = [(i, store.get(child)) for i, child in enumerate(children(index))]
+    found = [(i, data) for i, data in found if data is not None]
+    if not found:
+        return None
+
+    fmt = detect_format(found[0][1])
+    tiles = [(i, PILImage.open(io.BytesIO(data))) for i, data in found]
+    size = tiles[0][1].width
+    alpha = fmt != "jpg" and (len(tiles) < 4 or any("A" in t.mode or "transparency" in t.info for _, t in tiles))
+    mode = "RGBA" if alpha else "RGB"
+
+    canvas = PILImage.new(mode, (2 * size, 2 * size))
+    for i, tile in tiles:
+        canvas.paste(tile.convert(mode), ((i % 2) * size, (i // 2) * size))
+        tile.close()
+
+    out = io.BytesIO()
+    save_format, options = _SAVE_FORMATS[fmt]
+    canvas.resize((size, size), PILImage.Resampling.BOX).save(out, format=save_format, **options)
+    return out.getvalue()
+
+
+def build_pyramid(
+    store: TileStore,
+    min_zoom: int,
+    base: Optional[Iterable[TileIndex]] = None,
+    progress_store: Optional[ProgressStore] = None,
+    source_id: str = "",
+    workers: Optional[int] = None,
+    overwrite: bool = False,
+) -> int:
+    """
+    Derive every zoom level from just below the `base` tiles (all tiles at
+    the store's highest zoom by default) down to `min_zoom` by 2x2
+    downsampling, with no network access. Parent tiles of one level are
+    built in parallel and written into `store`; with `progress_store` each
+    is also recorded in the progress manifest. Parents already in the store
+    are kept unless `overwrite`. Returns the number of tiles built.
+    """
+    level: Set[TileIndex] = set(store.indices() if base is None else base)
+    if not level:
+        logger.warning("No tiles to build a pyramid from")
+        return 0
+
+    top = max(i.z for i in level)
+    level = {i for i in level if i.z == top}
+    if not 0 <= min_zoom < top:
+        raise ValueError(f"Pyramid min zoom must be between 0 and {top - 1}, got {min_zoom}")
+
+    def build(index: TileIndex) -> bool:
+        data = downsample(store, index)
+        if data is None:
+            return False
+        store.put(index, data)
+        if progress_store is not None:
+            progress_store.upsert_by_tile_index(ProgressItem(
+                tileIndex=index,
+                downloadStatus=DownloadStatus.SUCCESS,
+                tileURL="",
+                tileImagePath=progress_store.path.parent,
+                tileSourceId=source_id,
+                saved=True,
+                updatedAt=time.time()))
+        return True
+
+    if progress_store is not None:
+        progress_store.start_writer()
+
+    built = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for z in range(top - 1, min_zoom - 1, -1):
+                parents = sorted({TileIndex(x=i.x // 2, y=i.y // 2, z=z) for i in level},
+                                 key=lambda i: (i.y, i.x))
+                todo = parents if overwrite else [p for p in parents if p not in store]
+                done = [p for p, ok in zip(todo, executor.map(build, todo)) if ok]
+                built += len(done)
+                logger.info(f"Pyramid zoom {z}: built {len(done)} tiles, kept {len(parents) - len(todo)}")
+                # the next level is built from whatever now exists at this one
+                level = set(done).union(set(parents).difference(todo))
+    finally:
+        if progress_store is not None:
+            progress_store.stop_writer()
+
+    store.flush()
+    return built
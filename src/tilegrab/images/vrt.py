@@ -0,0 +1,132 @@
+import logging
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from tilegrab.images.collection import EPSG, WEB_MERCATOR_EXTENT, TileImageCollection
+from tilegrab.images.image import TileImage
+
+logger = logging.getLogger(__name__)
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_COLORS = ("Red", "Green", "Blue")
+
+# source band (or palette component) feeding each RGB band, by tile layout
+_LAYOUTS = {
+    "RGB": (1, 2, 3),
+    "L": (1, 1, 1),
+    "P": (1, 2, 3),
+}
+
+
+def _layout(file: Path) -> str:
+    """RGB, L or P (palette), read from the PNG header or, for other formats, by PIL."""
+    with open(file, "rb") as f:
+        head = f.read(26)
+    if head[:8] == _PNG_SIGNATURE:
+        color_type = head[25]
+        return {0: "L", 3: "P", 4: "L"}.get(color_type, "RGB")
+
+    from PIL import Image as PILImage
+    with PILImage.open(file) as img:
+        return "P" if img.mode == "P" else "L" if img.mode in ("L", "LA") else "RGB"
+
+
+def _tile_file(img: TileImage) -> Optional[Path]:
+    if img.file is not None:
+        return img.file
+    try:
+        file = img.path / img.name
+    except RuntimeError:
+        return None
+    return file if file.is_file() else None
+
+
+def write_world_file(file: Path, pixel_size: float, xmin: float, ymax: float) -> Path:
+    """Write a `.pgw`/`.jgw` style world file (EPSG:3857) next to a tile."""
+    suffix = file.suffix.lower()
+    world = file.with_suffix(f".{suffix[1]}{suffix[-1]}w" if len(suffix) > 2 else ".wld")
+    world.write_text(
+        f"{pixel_size:.10f}\n0.0\n0.0\n{-pixel_size:.10f}\n"
+        f"{xmin + pixel_size / 2:.10f}\n{ymax - pixel_size / 2:.10f}\n")
+    return world
+
+
+def write_vrt(
+    images: TileImageCollection,
+    output_path: Path,
+    world_files: bool = False,
+) -> Path:
+    """
+    Write a GDAL VRT mosaic that references the saved tile files in place.
+    No pixels are decoded or copied; only each PNG header is peeked to map
+    palette and greyscale tiles onto RGB bands. With `world_files`, each tile
+    also gets a world file so it can be opened on its own.
+    """
+    if not images:
+        raise ValueError("No images to mosaic")
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    vrt_dir = output_path.parent.resolve()
+
+    tile_w, tile_h = images[0].width, images[0].height
+    bounds = images.bounds
+    tile_size_m = 2 * WEB_MERCATOR_EXTENT / 2 ** images.zoom
+    pixel_size = tile_size_m / tile_w
+
+    sources: Tuple[List[str], ...] = ([], [], [])
+    missing = 0
+    for img in images:
+        file = _tile_file(img)
+        if file is None:
+            missing += 1
+            continue
+
+        layout = _layout(file)
+        try:
+            name, relative = os.path.relpath(file.resolve(), vrt_dir), 1
+        except ValueError:
+            # different drive on Windows
+            name, relative = str(file.resolve()), 0
+        name = escape(Path(name).as_posix())
+        px = (img.index.x - images.minx) * tile_w
+        py = (img.index.y - images.miny) * tile_h
+
+        for b, src_band in enumerate(_LAYOUTS[layout]):
+            if layout == "P":
+                kind, band_xml = "ComplexSource", f"<SourceBand>1</SourceBand><ColorTableComponent>{src_band}</ColorTableComponent>"
+            else:
+                kind, band_xml = "SimpleSource", f"<SourceBand>{src_band}</SourceBand>"
+            sources[b].append(
+                f'    <{kind}><SourceFilename relativeToVRT="{relative}">{name}</SourceFilename>{band_xml}'
+                f'<SrcRect xOff="0" yOff="0" xSize="{tile_w}" ySize="{tile_h}"/>'
+                f'<DstRect xOff="{px}" yOff="{py}" xSize="{tile_w}" ySize="{tile_h}"/></{kind}>')
+
+        if world_files:
+            xmin = -WEB_MERCATOR_EXTENT + img.index.x * tile_size_m
+            ymax = WEB_MERCATOR_EXTENT - img.index.y * tile_size_m
+            write_world_file(file, pixel_size, xmin, ymax)
+
+    if missing:
+        logger.warning(f"{missing} tiles have no saved file and are left out of {output_path}")
+
+    lines = [
+        f'<VRTDataset rasterXSize="{images.width}" rasterYSize="{images.height}">',
+        f"  <SRS>EPSG:{EPSG}</SRS>",
+        f"  <GeoTransform>{bounds.minx!r}, {pixel_size!r}, 0.0, {bounds.maxy!r}, 0.0, {-pixel_size!r}</GeoTransform>",
+    ]
+    for b, color in enumerate(_COLORS):
+        lines.append(f'  <VRTRasterBand dataType="Byte" band="{b + 1}">')
+        lines.append(f"    <ColorInterp>{color}</ColorInterp>")
+        lines.extend(sources[b])
+        lines.append("  </VRTRasterBand>")
+    lines.append("</VRTDataset>")
+
+    tmp = output_path.with_suffix(output_path.suffix + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    tmp.replace(output_path)
+
+    logger.info(f"VRT saved to {output_path} ({len(images) - missing} tiles)")
+    return output_path
@@ -0,0 +1,191 @@
+import logging
+import re
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Optional, Tuple, Type, TypeVar
+
+from tilegrab.downloader import DownloadConfig, DownloadMetrics, DownloadStatus, create_session, download_tile
+from tilegrab.sources import ESRIWorldImagery, GoogleSat, Nearmap, OSM, TileSource
+from tilegrab.store import DirectoryTileStore, detect_format
+from tilegrab.tiles import Tile, TileIndex
+
+logger = logging.getLogger(__name__)
+
+SOURCES: Dict[str, Type[TileSource]] = {
+    cls.uid: cls for cls in (OSM, ESRIWorldImagery, GoogleSat, Nearmap)
+}
+
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp"}
+
+_PATH_RE = re.compile(r"^/(\w+)/(\d+)/(\d+)/(\d+)(?:\.\w+)?$")
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """Return `fn()` and whether the result was shared with another caller."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        assert future is not None
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class TileProxy:
+    """
+    Serves tiles from `tile_dir/<source uid>/` and fetches upstream on a miss,
+    through one shared session and at most `max_upstream` concurrent requests.
+    """
+
+    def __init__(
+        self,
+        tile_dir: Path,
+        config: Optional[DownloadConfig] = None,
+        api_key: Optional[str] = None,
+        max_upstream: int = 8,
+    ):
+        self.tile_dir = Path(tile_dir)
+        self.config = config or DownloadConfig()
+        self.session = create_session(self.config)
+        self.sources: Dict[str, TileSource] = {
+            uid: cls(api_key=api_key) for uid, cls in SOURCES.items()
+        }
+        self.stores: Dict[str, DirectoryTileStore] = {
+            uid: DirectoryTileStore(self.tile_dir / uid) for uid in self.sources
+        }
+        self.metrics = DownloadMetrics()
+        self._flight = SingleFlight()
+        self._upstream = threading.BoundedSemaphore(max_upstream)
+
+    def get(self, source_id: str, z: int, x: int, y: int) -> Tuple[Optional[bytes], str]:
+        """Return the tile bytes (None if upstream failed) and HIT, MISS or COALESCED."""
+        data = self.stores[source_id].get(TileIndex(x=x, y=y, z=z))
+        if data is not None:
+            return data, "HIT"
+
+        data, shared = self._flight.do(
+            (source_id, z, x, y), lambda: self._fetch(source_id, z, x, y))
+        return data, "COALESCED" if shared else "MISS"
+
+    def _fetch(self, source_id: str, z: int, x: int, y: int) -> Optional[bytes]:
+        store = self.stores[source_id]
+        data = store.get(TileIndex(x=x, y=y, z=z))
+        if data is not None:
+            # stored by a flight that finished while we were queued
+            return data
+
+        tile = Tile(x, y, z, self.sources[source_id])
+        with self._upstream:
+            result = download_tile(tile, self.session, self.config.timeout, decode=False)
+        self.metrics.record(result)
+
+        if result.status != DownloadStatus.SUCCESS or result.result is None:
+            return None
+
+        # kept exactly as served upstream, under the extension of its format
+        data = result.result.data
+        store.put(tile.index, data)
+        return data
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "TileProxyServer"
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, self.server.proxy.metrics.to_prometheus().encode(), "text/plain; version=0.0.4")
+            return
+
+        m = _PATH_RE.match(self.path)
+        if not m:
+            self._send(404, b"not found", "text/plain")
+            return
+
+        source_id = m.group(1)
+        z, x, y = map(int, m.groups()[1:])
+        if source_id not in self.server.proxy.sources:
+            self._send(404, f"unknown source {source_id}".encode(), "text/plain")
+            return
+        if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            self._send(400, b"tile out of range", "text/plain")
+            return
+
+        try:
+            data, state = self.server.proxy.get(source_id, z, x, y)
+        except Exception:
+            logger.exception(f"Failed to serve {self.path}")
+            self._send(500, b"internal error", "text/plain")
+            return
+
+        if data is None:
+            self._send(502, b"upstream fetch failed", "text/plain", {"X-Tilegrab-Cache": state})
+            return
+        self._send(200, data, CONTENT_TYPES[detect_format(data)], {
+            "X-Tilegrab-Cache": state,
+            "Cache-Control": "public, max-age=86400",
+        })
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TileProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], proxy: TileProxy):
+        super().__init__(address, TileRequestHandler)
+        self.proxy = proxy
+
+
+def serve(
+    tile_dir: Path,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    api_key: Optional[str] = None,
+    max_upstream: int = 8,
+):
+    proxy = TileProxy(tile_dir, api_key=api_key, max_upstream=max_upstream)
+    httpd = TileProxyServer((host, port), proxy)
+    logger.info(f"Serving /{{source}}/{{z}}/{{x}}/{{y}} on http://{host}:{httpd.server_address[1]}")
+    logger.info(f"Sources: {', '.join(proxy.sources)}; tile store: {tile_dir}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        httpd.server_close()
@@ -1,4 +1,5 @@
 import logging
+import math
 from typing import Dict, Optional
 
 
@@ -9,22 +10,48 @@ class TileSource:
     name = None
     api_key = None
     uid = ""
+    # edge length in pixels of a scale 1 tile, and the largest scale the provider serves
+    tile_size = 256
+    max_scale = 1
 
     def __init__(
         self, 
         api_key: Optional[str] = None, 
-        headers: Optional[Dict[str, str]] = None) -> None:
+        headers: Optional[Dict[str, str]] = None,
+        scale: int = 1) -> None:
         
+        if not 1 <= scale <= self.max_scale:
+            raise ValueError(f"{self.name} serves tiles at scale 1 to {self.max_scale}, not {scale}")
         self._headers = headers
         self.api_key = api_key
-        logger.debug(f"Initializing TileSource: {self.name}, has_api_key={api_key is not None}")
+        self.scale = scale
+        logger.debug(f"Initializing TileSource: {self.name}, has_api_key={api_key is not None}, scale={scale}")
 
     def get_url(self, z: int, x: int, y: int) -> str:
-        url = self.url_template.format(x=x, y=y, z=z)
+        # `{scale}` and `{r}` ("" or "@2x") are available to high-DPI templates
+        url = self.url_template.format(x=x, y=y, z=z, scale=self.scale, r=self.retina_suffix)
         logger.debug(f"Generated URL for {self.name}: z={z}, x={x}, y={y}")
         return url
 
+    @property
+    def retina_suffix(self) -> str:
+        return "" if self.scale == 1 else f"@{self.scale}x"
+
+    @property
+    def tile_pixels(self) -> int:
+        """Edge length in pixels of the tiles actually served."""
+        return self.tile_size * self.scale
+
+    @property
+    def zoom_offset(self) -> int:
+        """
+        Zoom levels to step down so tiles larger than 256px give the ground
+        resolution of 256px tiles at the requested zoom: a 512px tile at z-1
+        covers four 256px tiles at z, for a quarter of the requests.
+        """
+        return int(math.log2(self.tile_pixels // 256)) if self.tile_pixels > 256 else 0
+
     @property
     def id(self) -> str:
         assert self.uid != "", "invalid source UID"
-        return self.uid
+        return self.uid if self.scale == 1 else f"{self.uid}{self.retina_suffix}"
@@ -8,7 +8,8 @@ class GoogleSat(TileSource):
     name = "GoogleSat"
     description = "Google satellite imageries"
     output_dir = "ggl_sat"
-    url_template = "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}"
+    url_template = "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}&scale={scale}"
+    max_scale = 2
     message = (
         "Warning: This tile source violates Google Maps TOS "
         "Section 3.2.4a"
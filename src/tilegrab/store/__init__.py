@@ -0,0 +1,26 @@
+from .base import TileStore, detect_format
+from .directory import DirectoryTileStore
+from .layout import LAYOUTS, TileLayout, get_layout
+from .mbtiles import MBTilesStore
+from .pmtiles import PMTilesStore, tileid_to_zxy, zxy_to_tileid
+
+__all__ = ["TileStore", "DirectoryTileStore", "MBTilesStore", "PMTilesStore", "TileLayout", "detect_format", "get_layout", "open_store", "tileid_to_zxy", "zxy_to_tileid"]
+
+STORE_TYPES = ("dir", "mbtiles", "pmtiles")
+
+
+def open_store(kind: str, tile_dir, name: str = "tiles", layout: str = "flat") -> TileStore:
+    """
+    Open the `kind` store ("dir", "mbtiles" or "pmtiles") for a job's
+    `tile_dir`. `layout` picks the file layout of a "dir" store.
+    """
+    from pathlib import Path
+
+    tile_dir = Path(tile_dir)
+    if kind == "dir":
+        return DirectoryTileStore(tile_dir, layout)
+    if kind == "mbtiles":
+        return MBTilesStore(tile_dir / f"{name}.mbtiles")
+    if kind == "pmtiles":
+        return PMTilesStore(tile_dir / f"{name}.pmtiles")
+    raise ValueError(f"Unknown tile store {kind}; use one of {STORE_TYPES}")
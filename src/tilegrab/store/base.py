@@ -0,0 +1,56 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from tilegrab.tiles import Tile, TileIndex
+
+if TYPE_CHECKING:
+    from tilegrab.images.image import TileImage
+
+
+def detect_format(data: bytes) -> str:
+    """Image format of encoded tile bytes, from their magic number."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+
+class TileStore(ABC):
+    """Where a job keeps its encoded tiles: a directory of files or a single-file container."""
+
+    @abstractmethod
+    def put(self, index: TileIndex, data: bytes):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, index: TileIndex) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def indices(self) -> Iterator[TileIndex]:
+        raise NotImplementedError
+
+    def __contains__(self, index: TileIndex) -> bool:
+        return self.get(index) is not None
+
+    def load(self, tile: Tile) -> Optional["TileImage"]:
+        """The stored tile as a lazily decoded `TileImage`, or None."""
+        from tilegrab.images.image import TileImage
+
+        data = self.get(tile.index)
+        return None if data is None else TileImage(tile, data, lazy=True)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
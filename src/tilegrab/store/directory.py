@@ -0,0 +1,74 @@
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Union
+
+from tilegrab.tiles import Tile, TileIndex
+
+from .base import TileStore, detect_format
+from .layout import TileLayout, get_layout
+
+if TYPE_CHECKING:
+    from tilegrab.images.image import TileImage
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryTileStore(TileStore):
+    """
+    One file per tile, written as received (no re-encoding), in a `flat`
+    (`z_x_y.ext`), `zxy` (`z/x/y.ext`) or `hashed` (`ab/cd/z_x_y.ext`) layout.
+    """
+
+    def __init__(self, path: Union[Path, str], layout: Union[str, TileLayout] = "flat"):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.layout = get_layout(layout) if isinstance(layout, str) else layout
+        self._lock = threading.Lock()
+        self._files: Optional[Dict[TileIndex, Path]] = None
+        self._dirs = {self.path}
+
+    def _index(self) -> Dict[TileIndex, Path]:
+        if self._files is None:
+            self._files = self.layout.index(self.path)
+        return self._files
+
+    def put(self, index: TileIndex, data: bytes):
+        file = self.path / self.layout.relpath(index, detect_format(data))
+        if file.parent not in self._dirs:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(file.parent)
+        tmp = file.with_name(file.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(file)
+
+        with self._lock:
+            old = self._index().get(index)
+            self._index()[index] = file
+        if old is not None and old != file:
+            old.unlink(missing_ok=True)
+
+    def get(self, index: TileIndex) -> Optional[bytes]:
+        file = self._index().get(index)
+        if file is None:
+            return None
+        try:
+            return file.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, index: TileIndex) -> bool:
+        return index in self._index()
+
+    def indices(self) -> Iterator[TileIndex]:
+        return iter(list(self._index()))
+
+    def load(self, tile: Tile) -> Optional["TileImage"]:
+        from tilegrab.images.image import TileImage
+
+        file = self._index().get(tile.index)
+        if file is None:
+            return None
+        img = TileImage.from_file(tile, file)
+        img.path = file.parent
+        return img
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from tilegrab.tiles import TileIndex
+
+logger = logging.getLogger(__name__)
+
+# only image files are tiles; world files (.pgw/.jgw) and the like sit next to them
+_IMAGE_EXT = r"\.(?:png|jpe?g|webp)$"
+_FLAT_RE = re.compile(r"^(\d+)_(\d+)_(\d+)" + _IMAGE_EXT, re.IGNORECASE)
+_Y_RE = re.compile(r"^(\d+)" + _IMAGE_EXT, re.IGNORECASE)
+_HEX_RE = re.compile(r"^[0-9a-f]{2}$")
+
+
+def _subdirs(path: str, pattern: re.Pattern) -> List[os.DirEntry]:
+    try:
+        with os.scandir(path) as it:
+            return [e for e in it if pattern.match(e.name) and e.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
+def _files(path: str, pattern: re.Pattern) -> List[Tuple[re.Match, str]]:
+    found = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                m = pattern.match(entry.name)
+                if m and entry.is_file():
+                    found.append((m, entry.path))
+    except FileNotFoundError:
+        pass
+    return found
+
+
+class TileLayout(ABC):
+    """Where each tile file lives below a tile directory."""
+
+    name: str
+    depth: int
+    file_pattern: re.Pattern = _FLAT_RE
+    dir_pattern: re.Pattern = re.compile(r"^\d+$")
+
+    @abstractmethod
+    def relpath(self, index: TileIndex, ext: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def parse(self, match: re.Match, parents: Tuple[str, ...]) -> TileIndex:
+        raise NotImplementedError
+
+    def index(self, root: Path, workers: int = 8) -> Dict[TileIndex, Path]:
+        """
+        Map every tile file below `root` to its tile index in a single walk.
+        Only directories the layout can contain are entered, and the leaf
+        directories are listed over `workers` threads, which matters most on
+        network filesystems where each listing is a round trip.
+        """
+        root = Path(root)
+        if not root.is_dir():
+            logger.warning(f"Tile directory not found: {root}")
+            return {}
+
+        leaves: List[Tuple[str, Tuple[str, ...]]] = [(str(root), ())]
+        for _ in range(self.depth):
+            leaves = [(e.path, parents + (e.name,))
+                      for path, parents in leaves
+                      for e in _subdirs(path, self.dir_pattern)]
+
+        def scan(leaf: Tuple[str, Tuple[str, ...]]) -> List[Tuple[TileIndex, Path]]:
+            path, parents = leaf
+            return [(self.parse(m, parents), Path(file)) for m, file in _files(path, self.file_pattern)]
+
+        index: Dict[TileIndex, Path] = {}
+        if workers > 1 and len(leaves) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for found in executor.map(scan, leaves):
+                    index.update(found)
+        else:
+            for leaf in leaves:
+                index.update(scan(leaf))
+        return index
+
+
+class FlatLayout(TileLayout):
+    """`z_x_y.ext` files side by side in one directory (the original layout)."""
+
+    name = "flat"
+    depth = 0
+
+    def relpath(self, index: TileIndex, ext: str) -> str:
+        return f"{index.z}_{index.x}_{index.y}.{ext}"
+
+    def parse(self, match: re.Match, parents: Tuple[str, ...]) -> TileIndex:
+        z, x, y = map(int, match.groups())
+        return TileIndex(x=x, y=y, z=z)
+
+
+class ZXYLayout(TileLayout):
+    """`z/x/y.ext`, the layout static XYZ tile servers read directly."""
+
+    name = "zxy"
+    depth = 2
+    file_pattern = _Y_RE
+
+    def relpath(self, index: TileIndex, ext: str) -> str:
+        return f"{index.z}/{index.x}/{index.y}.{ext}"
+
+    def parse(self, match: re.Match, parents: Tuple[str, ...]) -> TileIndex:
+        return TileIndex(x=int(parents[1]), y=int(match.group(1)), z=int(parents[0]))
+
+
+class HashedLayout(TileLayout):
+    """
+    `ab/cd/z_x_y.ext`, with two levels of 256 prefix directories taken from
+    a hash of the tile index, so tiles spread evenly whatever the extent.
+    """
+
+    name = "hashed"
+    depth = 2
+    dir_pattern = _HEX_RE
+
+    @staticmethod
+    def prefix(index: TileIndex) -> str:
+        digest = hashlib.md5(f"{index.z}/{index.x}/{index.y}".encode(), usedforsecurity=False).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+
+    def relpath(self, index: TileIndex, ext: str) -> str:
+        return f"{self.prefix(index)}/{index.z}_{index.x}_{index.y}.{ext}"
+
+    def parse(self, match: re.Match, parents: Tuple[str, ...]) -> TileIndex:
+        z, x, y = map(int, match.groups())
+        return TileIndex(x=x, y=y, z=z)
+
+
+LAYOUTS: Dict[str, TileLayout] = {layout.name: layout for layout in (FlatLayout(), ZXYLayout(), HashedLayout())}
+
+
+def get_layout(name: str) -> TileLayout:
+    try:
+        return LAYOUTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown tile layout {name}; use one of {tuple(LAYOUTS)}") from None
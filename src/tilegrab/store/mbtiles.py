@@ -0,0 +1,132 @@
+import logging
+import math
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from tilegrab.tiles import TileIndex
+
+from .base import TileStore, detect_format
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);
+CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+"""
+
+
+def _flip(z: int, y: int) -> int:
+    # MBTiles rows follow TMS: y counts up from the south
+    return (1 << z) - 1 - y
+
+
+class MBTilesStore(TileStore):
+    """
+    MBTiles 1.3 container. Tiles are buffered and inserted `batch_size` at a
+    time in one transaction; metadata (format, zooms, bounds) is written on
+    `close`.
+    """
+
+    def __init__(self, path: Union[Path, str], batch_size: int = 512, name: Optional[str] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.name = name or self.path.stem
+
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[int, int, int, sqlite3.Binary]] = []
+        self._format: Optional[str] = None
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        row = self._conn.execute("SELECT value FROM metadata WHERE name='format'").fetchone()
+        if row:
+            self._format = row[0]
+
+    def put(self, index: TileIndex, data: bytes):
+        with self._lock:
+            if self._format is None:
+                self._format = detect_format(data)
+            self._pending.append(
+                (index.z, index.x, _flip(index.z, index.y), sqlite3.Binary(data)))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                self._pending)
+        logger.debug(f"Inserted {len(self._pending)} tiles into {self.path}")
+        self._pending.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def get(self, index: TileIndex) -> Optional[bytes]:
+        with self._lock:
+            self._flush()
+            row = self._conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (index.z, index.x, _flip(index.z, index.y))).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def __contains__(self, index: TileIndex) -> bool:
+        with self._lock:
+            self._flush()
+            row = self._conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (index.z, index.x, _flip(index.z, index.y))).fetchone()
+        return row is not None
+
+    def indices(self) -> Iterator[TileIndex]:
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute("SELECT zoom_level, tile_column, tile_row FROM tiles").fetchall()
+        return (TileIndex(x=x, y=_flip(z, row), z=z) for z, x, row in rows)
+
+    def metadata(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    def _write_metadata(self):
+        stats = self._conn.execute(
+            "SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+        if stats[0] is None:
+            return
+        minzoom, maxzoom = stats
+        minx, maxx, minrow, maxrow = self._conn.execute(
+            "SELECT MIN(tile_column), MAX(tile_column), MIN(tile_row), MAX(tile_row) "
+            "FROM tiles WHERE zoom_level=?", (maxzoom,)).fetchone()
+
+        n = 1 << maxzoom
+        west, east = minx / n * 360 - 180, (maxx + 1) / n * 360 - 180
+        # TMS rows: minrow is the southern edge
+        south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (n - minrow) / n))))
+        north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (n - 1 - maxrow) / n))))
+
+        metadata = {
+            'name': self.name,
+            'format': self._format or 'png',
+            'type': 'baselayer',
+            'version': '1.1',
+            'minzoom': str(minzoom),
+            'maxzoom': str(maxzoom),
+            'bounds': f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}",
+        }
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._write_metadata()
+            self._conn.close()
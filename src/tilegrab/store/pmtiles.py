@@ -0,0 +1,374 @@
+import gzip
+import hashlib
+import json
+import logging
+import math
+import struct
+import threading
+from bisect import bisect_right
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from tilegrab.tiles import Tile, TileIndex
+
+from .base import TileStore, detect_format
+
+if TYPE_CHECKING:
+    from tilegrab.images.image import TileImage
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 127
+ROOT_MAX_BYTES = 16384 - HEADER_SIZE
+
+_MAGIC = b"PMTiles\x03"
+_HEADER = struct.Struct("<8s11QBBBBBBiiiiBii")
+_COMPRESSION_NONE, _COMPRESSION_GZIP = 1, 2
+_TILE_TYPES = {"png": 2, "jpg": 3, "webp": 4}
+
+
+class Entry(NamedTuple):
+    tile_id: int
+    offset: int
+    length: int
+    run_length: int
+
+
+def _rotate(n: int, x: int, y: int, rx: int, ry: int) -> Tuple[int, int]:
+    if ry == 0:
+        if rx == 1:
+            x, y = n - 1 - x, n - 1 - y
+        x, y = y, x
+    return x, y
+
+
+def zxy_to_tileid(z: int, x: int, y: int) -> int:
+    """PMTiles tile id: tiles of all lower zooms, then the Hilbert index of (x, y)."""
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} out of range")
+
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += s * s * ((3 * rx) ^ ry)
+        x, y = _rotate(n, x, y, rx, ry)
+        s >>= 1
+    return tile_id
+
+
+def tileid_to_zxy(tile_id: int) -> Tuple[int, int, int]:
+    z, acc = 0, 0
+    while acc + (1 << (2 * z)) <= tile_id:
+        acc += 1 << (2 * z)
+        z += 1
+
+    n = 1 << z
+    d = tile_id - acc
+    x = y = 0
+    s = 1
+    while s < n:
+        rx = 1 & (d // 2)
+        ry = 1 & (d ^ rx)
+        x, y = _rotate(s, x, y, rx, ry)
+        x += s * rx
+        y += s * ry
+        d //= 4
+        s <<= 1
+    return z, x, y
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def serialize_directory(entries: List[Entry]) -> bytes:
+    out = bytearray()
+    _write_varint(out, len(entries))
+    last = 0
+    for e in entries:
+        _write_varint(out, e.tile_id - last)
+        last = e.tile_id
+    for e in entries:
+        _write_varint(out, e.run_length)
+    for e in entries:
+        _write_varint(out, e.length)
+    for i, e in enumerate(entries):
+        prev = entries[i - 1] if i else None
+        if prev is not None and e.offset == prev.offset + prev.length:
+            _write_varint(out, 0)
+        else:
+            _write_varint(out, e.offset + 1)
+    return gzip.compress(bytes(out), compresslevel=6, mtime=0)
+
+
+def deserialize_directory(data: bytes) -> List[Entry]:
+    buf = gzip.decompress(data)
+    n, pos = _read_varint(buf, 0)
+
+    tile_ids, last = [], 0
+    for _ in range(n):
+        delta, pos = _read_varint(buf, pos)
+        last += delta
+        tile_ids.append(last)
+    runs = []
+    for _ in range(n):
+        v, pos = _read_varint(buf, pos)
+        runs.append(v)
+    lengths = []
+    for _ in range(n):
+        v, pos = _read_varint(buf, pos)
+        lengths.append(v)
+
+    entries: List[Entry] = []
+    for i in range(n):
+        v, pos = _read_varint(buf, pos)
+        if v == 0 and i > 0:
+            offset = entries[i - 1].offset + entries[i - 1].length
+        else:
+            offset = v - 1
+        entries.append(Entry(tile_ids[i], offset, lengths[i], runs[i]))
+    return entries
+
+
+def _lon_lat(z: int, x: float, y: float) -> Tuple[float, float]:
+    n = 1 << z
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+
+class PMTilesStore(TileStore):
+    """
+    PMTiles v3 single-file archive. Tiles are spooled to `<path>.spool` as
+    they arrive; `close` writes a clustered archive with tile data in
+    Hilbert (tile id) order, identical tiles stored once, and leaf
+    directories once the root no longer fits in the first 16 KiB.
+    Opening an existing archive keeps its tiles.
+    """
+
+    def __init__(self, path: Union[Path, str], name: Optional[str] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.spool_path = self.path.with_name(self.path.name + ".spool")
+        self.name = name or self.path.stem
+
+        self._lock = threading.Lock()
+        self._format: Optional[str] = None
+        # tile id -> (in spool?, absolute offset, length)
+        self._tiles: Dict[int, Tuple[bool, int, int]] = {}
+        self._spool: Optional[BinaryIO] = None
+        self._spool_size = 0
+        self._dirty = False
+
+        if self.path.exists():
+            self._read_archive()
+
+    def _read_archive(self):
+        with open(self.path, "rb") as f:
+            header = _HEADER.unpack(f.read(HEADER_SIZE))
+            if header[0] != _MAGIC:
+                raise RuntimeError(f"Not a PMTiles v3 archive: {self.path}")
+            (root_off, root_len, _, _, leaf_off, _, data_off) = header[1:8]
+            self._format = {v: k for k, v in _TILE_TYPES.items()}.get(header[15])
+
+            def walk(offset: int, length: int):
+                f.seek(offset)
+                for e in deserialize_directory(f.read(length)):
+                    if e.run_length == 0:
+                        walk(leaf_off + e.offset, e.length)
+                        continue
+                    for tile_id in range(e.tile_id, e.tile_id + e.run_length):
+                        self._tiles[tile_id] = (False, data_off + e.offset, e.length)
+
+            walk(root_off, root_len)
+        logger.info(f"Opened {self.path} with {len(self._tiles)} tiles")
+
+    def put(self, index: TileIndex, data: bytes):
+        tile_id = zxy_to_tileid(index.z, index.x, index.y)
+        with self._lock:
+            if self._format is None:
+                self._format = detect_format(data)
+            if self._spool is None:
+                self._spool = open(self.spool_path, "w+b")
+            self._spool.seek(self._spool_size)
+            self._spool.write(data)
+            self._tiles[tile_id] = (True, self._spool_size, len(data))
+            self._spool_size += len(data)
+            self._dirty = True
+
+    def _read(self, location: Tuple[bool, int, int], archive: Optional[BinaryIO] = None) -> bytes:
+        spooled, offset, length = location
+        if spooled:
+            assert self._spool is not None
+            self._spool.flush()
+            self._spool.seek(offset)
+            return self._spool.read(length)
+        if archive is not None:
+            archive.seek(offset)
+            return archive.read(length)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get(self, index: TileIndex) -> Optional[bytes]:
+        tile_id = zxy_to_tileid(index.z, index.x, index.y)
+        with self._lock:
+            location = self._tiles.get(tile_id)
+            return None if location is None else self._read(location)
+
+    def __contains__(self, index: TileIndex) -> bool:
+        return zxy_to_tileid(index.z, index.x, index.y) in self._tiles
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def indices(self) -> Iterator[TileIndex]:
+        for tile_id in sorted(self._tiles):
+            z, x, y = tileid_to_zxy(tile_id)
+            yield TileIndex(x=x, y=y, z=z)
+
+    def load(self, tile: Tile) -> Optional["TileImage"]:
+        from tilegrab.images.image import TileImage
+
+        location = self._tiles.get(zxy_to_tileid(tile.index.z, tile.index.x, tile.index.y))
+        if location is None:
+            return None
+        spooled, offset, length = location
+        if spooled or self._dirty:
+            # the archive is rewritten on close, so its offsets are not stable
+            return super().load(tile)
+        # a slice of the archive, memory-mapped on access
+        return TileImage.from_file(tile, self.path, offset=offset, length=length)
+
+    def flush(self):
+        if self._spool is not None:
+            with self._lock:
+                self._spool.flush()
+
+    def close(self):
+        with self._lock:
+            if self._dirty:
+                self._write_archive()
+                self._dirty = False
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+                self.spool_path.unlink(missing_ok=True)
+
+    def _write_archive(self):
+        archive = open(self.path, "rb") if self.path.exists() else None
+        try:
+            self._write_archive_from(archive)
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def _write_archive_from(self, archive: Optional[BinaryIO]):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tile_ids = sorted(self._tiles)
+
+        # lay out tile data in tile id order, storing identical contents once
+        entries: List[Entry] = []
+        placed: Dict[bytes, Tuple[int, int]] = {}
+        order: List[Tuple[bool, int, int]] = []
+        data_size = 0
+        for tile_id in tile_ids:
+            location = self._tiles[tile_id]
+            data = self._read(location, archive)
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if digest in placed:
+                offset, length = placed[digest]
+            else:
+                offset, length = data_size, len(data)
+                placed[digest] = (offset, length)
+                order.append(location)
+                data_size += length
+
+            last = entries[-1] if entries else None
+            if last and last.offset == offset and last.tile_id + last.run_length == tile_id:
+                entries[-1] = last._replace(run_length=last.run_length + 1)
+            else:
+                entries.append(Entry(tile_id, offset, length, 1))
+
+        root, leaves = self._build_directories(entries)
+        metadata = gzip.compress(json.dumps({
+            "name": self.name,
+            "format": self._format or "png",
+            "generator": "tilegrab",
+        }).encode(), mtime=0)
+
+        root_off = HEADER_SIZE
+        meta_off = root_off + len(root)
+        leaf_off = meta_off + len(metadata)
+        data_off = leaf_off + len(leaves)
+
+        min_zoom, z = tileid_to_zxy(tile_ids[0])[0], tileid_to_zxy(tile_ids[-1])[0]
+        first = ((1 << (2 * z)) - 1) // 3
+        top = [tileid_to_zxy(t) for t in tile_ids[bisect_right(tile_ids, first - 1):]]
+        west, north = _lon_lat(z, min(t[1] for t in top), min(t[2] for t in top))
+        east, south = _lon_lat(z, max(t[1] for t in top) + 1, max(t[2] for t in top) + 1)
+
+        header = _HEADER.pack(
+            _MAGIC,
+            root_off, len(root),
+            meta_off, len(metadata),
+            leaf_off, len(leaves),
+            data_off, data_size,
+            len(tile_ids), len(entries), len(placed),
+            1,  # clustered
+            _COMPRESSION_GZIP,
+            _COMPRESSION_NONE,
+            _TILE_TYPES.get(self._format or "png", 0),
+            min_zoom, z,
+            round(west * 1e7), round(south * 1e7), round(east * 1e7), round(north * 1e7),
+            z, round((west + east) / 2 * 1e7), round((south + north) / 2 * 1e7),
+        )
+
+        with open(tmp, "wb") as out:
+            out.write(header)
+            out.write(root)
+            out.write(metadata)
+            out.write(leaves)
+            for location in order:
+                out.write(self._read(location, archive))
+        tmp.replace(self.path)
+
+        logger.info(
+            f"Wrote {self.path}: {len(tile_ids)} tiles, {len(placed)} unique, {data_size / 1e6:.1f} MB")
+
+    @staticmethod
+    def _build_directories(entries: List[Entry]) -> Tuple[bytes, bytes]:
+        root = serialize_directory(entries)
+        if len(root) <= ROOT_MAX_BYTES:
+            return root, b""
+
+        leaf_size = 4096
+        while True:
+            leaves = bytearray()
+            root_entries: List[Entry] = []
+            for i in range(0, len(entries), leaf_size):
+                chunk = entries[i:i + leaf_size]
+                leaf = serialize_directory(chunk)
+                root_entries.append(Entry(chunk[0].tile_id, len(leaves), len(leaf), 0))
+                leaves += leaf
+            root = serialize_directory(root_entries)
+            if len(root) <= ROOT_MAX_BYTES:
+                return root, bytes(leaves)
+            leaf_size *= 2
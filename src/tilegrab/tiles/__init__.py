@@ -1,5 +1,5 @@
 from .tile import Tile, TileIndex
 from .collection import TileCollection
-from .selectors import TilesByBBox, TilesByShape
+from .selectors import TilesByBBox, TilesByShape, TilesByIndex
 
-__all__ = ["TilesByBBox", "TilesByShape", "TileCollection", "TileIndex", "Tile"]
\ No newline at end of file
+__all__ = ["TilesByBBox", "TilesByShape", "TilesByIndex", "TileCollection", "TileIndex", "Tile"]
\ No newline at end of file
@@ -1,11 +1,12 @@
 import logging
 import math
+import hashlib
 from typing import Iterator, List
 from abc import ABC, abstractmethod
 
 from tilegrab.dataset import GeoDataset
 from tilegrab.sources.base import TileSource
-from tilegrab.tiles import Tile
+from tilegrab.tiles import Tile, TileIndex
 from box import Box
 
 logger = logging.getLogger(__name__)
@@ -14,6 +15,12 @@ EPSILON = 1e-14
 LL_EPSILON = 1e-11
 
 
+def shard_of(index: TileIndex, count: int) -> int:
+    """Stable shard number of a tile; identical on every machine and Python run."""
+    digest = hashlib.blake2b(f"{index.z}/{index.x}/{index.y}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % count
+
+
 class TileCollection(ABC):
 
     MIN_X: float = 0
@@ -38,7 +45,7 @@ class TileCollection(ABC):
             self, geo_dataset: GeoDataset, tile_source:TileSource , zoom: int, safe_limit: int = 250, invert_selection:bool = False):
         
         self._tile_count = 0
-        self.zoom = zoom
+        self.zoom = zoom - tile_source.zoom_offset
         self.safe_limit = safe_limit
         self.geo_dataset = geo_dataset
         self.tile_source = tile_source
@@ -47,6 +54,10 @@ class TileCollection(ABC):
         logger.info(
             f"Initializing TileCollection: zoom={zoom}, safe_limit={safe_limit}"
         )
+        if self.zoom < 0:
+            raise ValueError(f"Zoom {zoom} is below the lowest zoom of {tile_source.tile_pixels}px tiles")
+        if self.zoom != zoom:
+            logger.info(f"Using {tile_source.tile_pixels}px tiles at zoom {self.zoom} for the resolution of zoom {zoom}")
 
         # assert feature.bbox.minx < feature.bbox.maxx
         # assert feature.bbox.miny < feature.bbox.maxy
@@ -151,6 +162,15 @@ class TileCollection(ABC):
                 self._tile_count += 1
                 yield t
 
+    def shard(self, index: int, count: int):
+        if not (0 <= index < count):
+            raise ValueError(f"Invalid shard {index} of {count}")
+
+        total = len(self)
+        self._cache = [t for t in self._cache if shard_of(t.index, count) == index]
+        self._tile_count = len(self._cache)
+        logger.info(f"Shard {index + 1}/{count}: {len(self)} of {total} tiles")
+
     def pop(self, index:int) -> Tile:
         assert self._tile_count >= index, "Invalid index"
         return self._cache.pop(index)
\ No newline at end of file
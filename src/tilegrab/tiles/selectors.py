@@ -1,7 +1,8 @@
 import logging
-from typing import List
+from typing import Iterable, List
 
-from tilegrab.tiles import Tile
+from tilegrab.sources.base import TileSource
+from tilegrab.tiles import Tile, TileIndex
 from tilegrab.tiles.collection import TileCollection
 
 
@@ -34,3 +35,29 @@ class TilesByShape(TileCollection):
         self._cache = list(self.tiles_in_bound(clip_to_shape=True))
         logger.info(f"Generated {len(self)} tiles from shape intersection")
         return self._cache
+
+class TilesByIndex(TileCollection):
+    """
+    Tiles given directly by their index, e.g. from a dead-letter list.
+    No extent is walked, so no GeoDataset is required.
+    """
+
+    def __init__(
+            self, indices: Iterable[TileIndex], tile_source: TileSource, safe_limit: int = 250):
+        self._indices = list(indices)
+        assert len(self._indices) > 0, "No tile indices given"
+        super().__init__(
+            geo_dataset=None,  # type: ignore[arg-type]
+            tile_source=tile_source,
+            # the indices are already at the tile zoom
+            zoom=self._indices[0].z + tile_source.zoom_offset,
+            safe_limit=safe_limit)
+
+    def __repr__(self) -> str:
+        return f"TileCollection; len={len(self)}; indices={len(self._indices)}"
+
+    def build_tile_cache(self) -> List[Tile]:
+        logger.info(f"Building tiles from {len(self._indices)} tile indices")
+        self._cache = [Tile(i.x, i.y, i.z, self.tile_source) for i in self._indices]
+        self._tile_count = len(self._cache)
+        return self._cache
@@ -0,0 +1,167 @@
+from pathlib import Path
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from tempfile import TemporaryDirectory
+from PIL import Image
+from io import BytesIO
+
+from requests import Session
+
+from tilegrab.cache import DiskTileCache, MemoryTileCache
+from tilegrab.downloader import Downloader, DownloadConfig
+from tilegrab.sources import OSM
+from tilegrab.tiles import TileIndex, TilesByIndex
+
+
+class DiskTileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.cache_dir = Path(self._tmp.name) / "cache"
+
+    def test_put_get(self):
+        cache = DiskTileCache(self.cache_dir)
+        index = TileIndex(x=1, y=2, z=10)
+        assert cache.get("osm", index) is None
+
+        cache.put("osm", index, b"tile")
+        assert cache.get("osm", index) == b"tile"
+        assert cache.get("gsat", index) is None
+        assert cache.stats["hits"] == 1
+        assert cache.stats["misses"] == 2
+        assert cache.size_bytes == 4
+        cache.close()
+
+        # shared across instances / jobs
+        other = DiskTileCache(self.cache_dir)
+        self.addCleanup(other.close)
+        assert other.get("osm", index) == b"tile"
+
+    def test_ttl_expiry(self):
+        cache = DiskTileCache(self.cache_dir, ttl=0.01)
+        self.addCleanup(cache.close)
+        index = TileIndex(x=1, y=2, z=10)
+        cache.put("osm", index, b"tile")
+        time.sleep(0.05)
+        assert cache.get("osm", index) is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        cache = DiskTileCache(self.cache_dir, max_bytes=250)
+        self.addCleanup(cache.close)
+        for x in range(1, 4):
+            cache.put("osm", TileIndex(x=x, y=1, z=10), bytes(100))
+            time.sleep(0.01)
+
+        assert len(cache) == 2
+        assert cache.size_bytes == 200
+        assert cache.get("osm", TileIndex(x=1, y=1, z=10)) is None
+
+
+class MemoryTileCacheTest(unittest.TestCase):
+
+    def test_lru_budget(self):
+        cache = MemoryTileCache(max_bytes=250)
+        for x in range(1, 4):
+            cache.put("osm", TileIndex(x=x, y=1, z=10), bytes(100))
+        cache.get("osm", TileIndex(x=2, y=1, z=10))
+        cache.put("osm", TileIndex(x=4, y=1, z=10), bytes(100))
+
+        assert cache.get("osm", TileIndex(x=2, y=1, z=10)) is not None
+        assert cache.get("osm", TileIndex(x=3, y=1, z=10)) is None
+        assert cache.stats["bytes"] == 200
+        assert cache.stats["evictions"] == 2
+
+    def test_read_through_backing(self):
+        with TemporaryDirectory() as tmp:
+            disk = DiskTileCache(Path(tmp))
+            index = TileIndex(x=1, y=2, z=10)
+            disk.put("osm", index, b"tile")
+
+            cache = MemoryTileCache(backing=disk)
+            assert cache.get("osm", index) == b"tile"
+            assert cache.get("osm", index) == b"tile"
+            assert disk.stats["hits"] == 1
+            disk.close()
+
+    def test_decoded_images(self):
+        cache = MemoryTileCache(max_image_bytes=256 * 256 * 3)
+        index = TileIndex(x=1, y=2, z=10)
+        img = Image.new("RGB", (256, 256), color="red")
+        cache.put_image("osm", index, img)
+        cached = cache.get_image("osm", index)
+        assert cached is not img and cached.getpixel((0, 0)) == (255, 0, 0)
+        # callers get their own image; changing it leaves the cached pixels alone
+        cached.paste((0, 0, 255), (0, 0, 256, 256))
+        assert cache.get_image("osm", index).getpixel((0, 0)) == (255, 0, 0)
+
+        cache.put_image("osm", TileIndex(x=1, y=3, z=10), img.copy())
+        assert cache.get_image("osm", index) is None
+
+    def test_shared_instance(self):
+        assert MemoryTileCache.shared() is MemoryTileCache.shared()
+
+
+class DownloaderCacheTest(unittest.TestCase):
+
+    def test_second_job_served_from_cache(self):
+        buf = BytesIO()
+        Image.new("RGB", (256, 256), color="red").save(buf, format="PNG")
+        response = MagicMock()
+        response.headers = {"content-type": "image/png"}
+        response.content = buf.getvalue()
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)]
+        with TemporaryDirectory() as tmp, patch.object(Session, "get", return_value=response) as get:
+            cache = DiskTileCache(Path(tmp) / "cache")
+
+            for job in ("a", "b"):
+                dl = Downloader(
+                    tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                    config=DownloadConfig(),
+                    tile_dir=Path(tmp) / job,
+                    cache=cache)
+                assert len(dl.run(parallel_download=False, show_progress=False)) == 2
+
+            assert get.call_count == 2
+            assert dl.metrics.cache_hits_total == 2
+            assert (Path(tmp) / "b" / "10_1_3.png").is_file()
+            cache.close()
+
+    def test_decoded_pixels_cached_when_tiles_are_decoded(self):
+        from PIL import ImageFile
+
+        buf = BytesIO()
+        Image.new("RGB", (256, 256), color="red").save(buf, format="PNG")
+        response = MagicMock()
+        response.headers = {"content-type": "image/png"}
+        response.content = buf.getvalue()
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)]
+        cache = MemoryTileCache(max_image_bytes=4 * 256 * 256 * 3)
+        with TemporaryDirectory() as tmp, patch.object(Session, "get", return_value=response) as get:
+            images = []
+            for job in ("a", "b"):
+                dl = Downloader(
+                    tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                    config=DownloadConfig(),
+                    tile_dir=Path(tmp) / job,
+                    cache=cache)
+                images.append(dl.run(parallel_download=False, show_progress=False))
+                if job == "a":
+                    # downloaded tiles are lazy; decoding them (as the mosaic does) fills the cache
+                    assert not any(img.decoded for img in images[0])
+                    assert [img.image.getpixel((0, 0)) for img in images[0]] == [(255, 0, 0)] * 2
+                    assert cache.image_bytes == 2 * 256 * 256 * 3
+
+            assert get.call_count == 2
+            assert cache.image_hits == 2
+            with patch.object(ImageFile.ImageFile, "load") as load:
+                assert [img.image.getpixel((0, 0)) for img in images[1]] == [(255, 0, 0)] * 2
+            load.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
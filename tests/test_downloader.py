@@ -1,4 +1,8 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+import pickle
+from queue import Queue
+import threading
 import unittest
 from unittest.mock import Mock, MagicMock, patch
 from tempfile import TemporaryDirectory
@@ -6,7 +10,8 @@ from PIL import Image
 from io import BytesIO
 
 from tilegrab.dataset import Coordinate, GeoDataset
-from tilegrab.downloader.runner import Downloader
+from tilegrab.downloader.runner import Downloader, _download_chunk
+import tilegrab.downloader.runner as runner
 import tilegrab.downloader.worker as worker
 
 from tilegrab.downloader.config import DownloadConfig
@@ -16,8 +21,13 @@ from tilegrab.downloader.worker import download_tile
 from tilegrab.images.collection import TileImageCollection
 from tilegrab.images.image import TileImage
 from tilegrab.sources import OSM
-from tilegrab.tiles import TilesByBBox, Tile, TileCollection
-from requests import Session
+from tilegrab.tiles import TilesByBBox, TilesByIndex, Tile, TileCollection
+from tilegrab.downloader.deadletter import DeadLetterStore
+from tilegrab.downloader.metrics import DownloadMetrics
+from tilegrab.downloader.progress import ProgressItem, ProgressStore
+from tilegrab.downloader.shard import merge_shards, shard_dir
+from tilegrab.images.loader import load_images_from_progress
+from requests import HTTPError, RequestException, Session
 
 from tilegrab.tiles.tile import TileIndex
 
@@ -235,6 +245,298 @@ class DownloaderTest(unittest.TestCase):
             
             assert count == 2
 
+    def test_downloader_requeues_failed_tiles(self):
+
+        self.setup_mock_response()
+        self.mock_get.side_effect = [RequestException("boom"), self.response]
+
+        tiles = TilesByIndex([TileIndex(x=1, y=2, z=10)], tile_source=OSM())
+        cfg = DownloadConfig(retry_attempts=1, retry_delay=0)
+        with TemporaryDirectory() as tmp:
+            dl = Downloader(tile_collection=tiles, config=cfg, tile_dir=Path(tmp))
+            tileImageCol = dl.run(parallel_download=False, show_progress=False)
+
+            assert len(tileImageCol) == 1
+            assert self.mock_get.call_count == 2
+            assert len(DeadLetterStore(Path(tmp))) == 0
+
+    def test_downloader_dead_letters_exhausted_tiles(self):
+
+        self.setup_mock_response()
+        self.mock_get.side_effect = RequestException("boom")
+
+        tiles = TilesByIndex(
+            [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)], tile_source=OSM())
+        cfg = DownloadConfig(retry_attempts=2, retry_delay=0)
+        with TemporaryDirectory() as tmp:
+            dl = Downloader(tile_collection=tiles, config=cfg, tile_dir=Path(tmp))
+            dl.run(parallel_download=False, show_progress=False)
+
+            assert self.mock_get.call_count == 6
+            dead_letters = DeadLetterStore(Path(tmp))
+            assert len(dead_letters) == 2
+            assert all(i.attempts == 3 for i in dead_letters)
+            assert TileIndex(x=1, y=3, z=10) in dead_letters.indices(source_id="osm")
+
+    def test_downloader_client_errors_are_terminal(self):
+
+        self.setup_mock_response()
+
+        def refused(code):
+            resp = MagicMock()
+            resp.status_code = code
+            resp.raise_for_status.side_effect = HTTPError(f"{code}", response=resp)
+            return resp
+
+        def get(url, **kwargs):
+            return refused(404) if "/10/1/2." in url else refused(429)
+
+        self.mock_get.side_effect = get
+
+        tiles = TilesByIndex(
+            [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)], tile_source=OSM())
+        cfg = DownloadConfig(retry_attempts=1, retry_delay=0)
+        with TemporaryDirectory() as tmp:
+            dl = Downloader(tile_collection=tiles, config=cfg, tile_dir=Path(tmp))
+            dl.run(parallel_download=False, show_progress=False)
+
+            # the 404 is asked for once, the 429 is requeued and dead-lettered
+            assert self.mock_get.call_count == 3
+            assert dl.progress_store.progress_by_tile(
+                TileIndex(x=1, y=2, z=10)).downloadStatus == DownloadStatus.CLIENT_ERROR
+            assert set(DeadLetterStore(Path(tmp)).indices(source_id="osm")) == {TileIndex(x=1, y=3, z=10)}
+
+    def test_downloader_resume_skips_refused_tiles(self):
+
+        self.setup_mock_response()
+        refused = MagicMock()
+        refused.status_code = 404
+        refused.raise_for_status.side_effect = HTTPError("404", response=refused)
+        self.mock_get.side_effect = lambda url, **kwargs: refused if "/10/1/2." in url else self.response
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)]
+        with TemporaryDirectory() as tmp:
+            for _ in range(2):
+                Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                           config=self.dl_cfg, tile_dir=Path(tmp)).run(parallel_download=False, show_progress=False)
+            assert self.mock_get.call_count == 2
+            assert ProgressStore(Path(tmp)).progress_by_tile(indices[0]).downloadStatus == DownloadStatus.CLIENT_ERROR
+
+            # --refresh asks again
+            Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                       config=self.dl_cfg, tile_dir=Path(tmp), resume=False).run(parallel_download=False, show_progress=False)
+            assert self.mock_get.call_count == 4
+
+    def test_downloader_resume_skips_saved_tiles(self):
+
+        self.setup_mock_response()
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10), TileIndex(x=1, y=4, z=10)]
+        with TemporaryDirectory() as tmp:
+            Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                       config=self.dl_cfg, tile_dir=Path(tmp)).run(parallel_download=False, show_progress=False)
+            assert self.mock_get.call_count == 3
+            (Path(tmp) / "10_1_4.png").unlink()
+
+            dl = Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                            config=self.dl_cfg, tile_dir=Path(tmp))
+            assert dl.plan_resume() == 2
+            assert dl.progress_store.progress_by_tile(indices[0]).downloadStatus == DownloadStatus.SUCCESS
+
+            assert len(dl.run(parallel_download=False, show_progress=False)) == 3
+            assert self.mock_get.call_count == 4
+
+    def test_downloader_refresh_tracks_changed_tiles(self):
+
+        self.setup_mock_response()
+        self.mock_get.return_value = self.response
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)]
+        with TemporaryDirectory() as tmp:
+            Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                       config=self.dl_cfg, tile_dir=Path(tmp)).run(parallel_download=False, show_progress=False)
+            first = ProgressStore(Path(tmp))
+            assert first.changed_since(0) == set(indices)
+            since = max(first.progress_by_tile(i).updatedAt for i in indices)
+
+            # the same bytes again do not count as a change, new bytes do
+            def get(url, **kwargs):
+                if "/10/1/3." in url:
+                    buf = BytesIO()
+                    Image.new("RGB", (256, 256), color="blue").save(buf, format="PNG")
+                    self.response.content = buf.getvalue()
+                return self.response
+
+            self.mock_get.side_effect = get
+            Downloader(tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                       config=self.dl_cfg, tile_dir=Path(tmp), resume=False).run(parallel_download=False, show_progress=False)
+            assert self.mock_get.call_count == 4
+            assert ProgressStore(Path(tmp)).changed_since(since) == {indices[1]}
+
+    def test_download_chunk_results_pickle(self):
+
+        self.setup_mock_response()
+
+        events = Queue()
+        with patch.object(runner, "_events", events), \
+                patch.object(runner, "_session", create_session(self.dl_cfg)):
+            assert _download_chunk([self.tile1, self.tile2], self.dl_cfg, 1, True) == 2
+        sent = [events.get_nowait() for _ in range(4)]
+        assert sent[0::2] == [runner._REQUEST_STARTED] * 2
+        results = pickle.loads(pickle.dumps(sent[1::2]))
+
+        assert [r.status for r in results] == [DownloadStatus.SUCCESS, DownloadStatus.SKIP]
+        assert results[0].tile == self.tile1
+        assert results[0].result.image.size == (256, 256)
+
+    def test_downloader_metrics(self):
+
+        self.setup_mock_response()
+        self.mock_get.side_effect = [RequestException("boom"), self.response, self.response]
+
+        tiles = TilesByIndex(
+            [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)], tile_source=OSM())
+        metrics = DownloadMetrics()
+        seen = []
+        metrics.subscribe(lambda result, m: seen.append(result.status))
+
+        with TemporaryDirectory() as tmp:
+            dl = Downloader(tile_collection=tiles, config=DownloadConfig(retry_delay=0),
+                            tile_dir=Path(tmp), metrics=metrics)
+            dl.run(parallel_download=False, show_progress=False)
+
+            snap = metrics.snapshot()
+            assert snap["status"]["SUCCESS"] == 2
+            assert snap["status"]["UNDEFINED"] == 1
+            assert snap["requeuesTotal"] == 1
+            assert snap["bytesTotal"] == 2 * len(self.response.content)
+            assert snap["inFlight"] == 0
+            assert sorted(seen) == [DownloadStatus.SUCCESS, DownloadStatus.SUCCESS, DownloadStatus.UNDEFINED]
+
+            prom = metrics.to_prometheus()
+            assert 'tilegrab_download_tiles_total{status="SUCCESS"} 2' in prom
+            assert 'tilegrab_download_latency_seconds_count{host="tile.openstreetmap.org"} 3' in prom
+
+    def test_downloader_metrics_process_mode(self):
+
+        buf = BytesIO()
+        Image.new("RGB", (256, 256), color="red").save(buf, format="PNG")
+        png = buf.getvalue()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(png)))
+                self.end_headers()
+                self.wfile.write(png)
+
+            def log_message(self, *args):
+                pass
+
+        # download processes are spawned, so they reach a real server rather than a patched session
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        source = OSM()
+        source.url_template = f"http://127.0.0.1:{httpd.server_port}/{{z}}/{{x}}/{{y}}.png"
+
+        tiles = TilesByIndex([TileIndex(x=1, y=y, z=10) for y in range(8)], tile_source=source)
+        metrics = DownloadMetrics()
+        with TemporaryDirectory() as tmp:
+            dl = Downloader(tile_collection=tiles, config=DownloadConfig(processes=2),
+                            tile_dir=Path(tmp), metrics=metrics)
+            images = dl.run(workers=1, show_progress=False)
+
+            assert len(images) == 8
+            snap = metrics.snapshot()
+            assert snap["status"]["SUCCESS"] == 8
+            assert snap["inFlight"] == 0
+            # one request at a time per download process, not the whole job at once
+            assert 1 <= snap["maxInFlight"] <= 2
+
+    def test_merge_shards(self):
+
+        with TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for i, tile in enumerate([self.tile1, self.tile2]):
+                d = shard_dir(root, i, 2)
+                d.mkdir()
+                Image.new("RGB", (256, 256), color="red").save(
+                    d / f"{tile.index.z}_{tile.index.x}_{tile.index.y}.png")
+                ProgressStore(d).upsert_by_tile_index(ProgressItem(
+                    tileIndex=tile.index,
+                    downloadStatus=DownloadStatus.SUCCESS,
+                    tileURL=tile.url,
+                    tileImagePath=d,
+                    tileSourceId="osm",
+                    saved=True))
+
+            manifest = merge_shards(root)
+            assert len(manifest) == 2
+            assert len(ProgressStore(root)) == 2
+
+            images = load_images_from_progress(manifest, [self.tile1, self.tile2])
+            assert {i.index for i in images} == {self.tile1.index, self.tile2.index}
+
+    def test_progress_store_journal(self):
+
+        def item(x, status=DownloadStatus.SUCCESS):
+            return ProgressItem(
+                tileIndex=TileIndex(x=x, y=1, z=10),
+                downloadStatus=status,
+                tileURL="",
+                tileImagePath=Path("."),
+                tileSourceId="osm",
+                saved=True)
+
+        with TemporaryDirectory() as tmp:
+            store = ProgressStore(Path(tmp))
+            for x in range(5):
+                store.upsert_by_tile_index(item(x, DownloadStatus.FAILED))
+            store.upsert_by_tile_index(item(2))
+            store.remove(0)
+
+            assert not store.path.exists()
+            assert len(store.journal_path.read_text().splitlines()) == 7
+
+            # a torn final write is ignored on replay
+            with open(store.journal_path, "a") as f:
+                f.write('{"tileIndex": [9, 1')
+
+            reloaded = ProgressStore(Path(tmp))
+            assert [p.tileIndex.x for p in reloaded] == [1, 2, 3, 4]
+            assert reloaded[1].downloadStatus == DownloadStatus.SUCCESS
+            reloaded.upsert_by_tile_index(item(5))
+            assert len(ProgressStore(Path(tmp))) == 5
+
+            reloaded.compact()
+            assert not reloaded.journal_path.exists()
+            assert len(ProgressStore(Path(tmp))) == 5
+
+    def test_progress_store_group_commit(self):
+
+        with TemporaryDirectory() as tmp:
+            store = ProgressStore(Path(tmp))
+            store.start_writer(interval=60, max_pending=3)
+            for x in range(2):
+                store.upsert_by_tile_index(ProgressItem(
+                    tileIndex=TileIndex(x=x, y=1, z=10),
+                    downloadStatus=DownloadStatus.SUCCESS,
+                    tileURL="",
+                    tileImagePath=Path("."),
+                    tileSourceId="osm",
+                    saved=True))
+
+            # queued in memory only, below the batch size and interval
+            assert len(store) == 2
+            assert not store.journal_path.exists()
+
+            store.stop_writer()
+            assert len(store.journal_path.read_text().splitlines()) == 2
+            assert len(ProgressStore(Path(tmp))) == 2
+
 if __name__ == "__main__":
     unittest.main()
     
\ No newline at end of file
@@ -0,0 +1,357 @@
+import unittest
+from unittest.mock import patch
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import numpy as np
+from PIL import Image
+
+from tilegrab.images.decoder import DecodePool
+from tilegrab.images.image import TileImage
+from tilegrab.images.loader import index_tiles, load_images
+from tilegrab.sources import OSM
+from tilegrab.tiles import Tile, TileIndex
+
+
+def make_png(color="red", size=(256, 256), mode="RGB") -> bytes:
+    buf = BytesIO()
+    Image.new(mode, size, color=color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TileImageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tile = Tile(z=10, x=1, y=2, source=OSM())
+
+    def test_lazy_tile_image_keeps_bytes(self):
+        data = make_png()
+        img = TileImage(self.tile, data, lazy=True)
+        assert img.data == data
+        assert img.image.size == (256, 256)
+
+    def test_decode_pool_roundtrip(self):
+        img = TileImage(self.tile, make_png(color="blue"), lazy=True)
+        with DecodePool(workers=1) as pool:
+            future = pool.submit(img)
+            assert pool.attach(future, img)
+
+        assert img.image.getpixel((0, 0)) == (0, 0, 255)
+
+    def test_decode_pool_rejects_corrupt_tile(self):
+        img = TileImage(self.tile, make_png()[:64], lazy=True)
+        with DecodePool(workers=1) as pool:
+            future = pool.submit(img)
+            assert not pool.attach(future, img)
+
+    def test_decode_pool_frees_unattached_blocks(self):
+        from multiprocessing import shared_memory
+
+        img = TileImage(self.tile, make_png(), lazy=True)
+        with DecodePool(workers=1) as pool:
+            future = pool.submit(img)
+            future.result()
+            name = next(iter(pool._blocks.values())).name
+        assert not pool._blocks
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_file_backed_tile_image(self):
+        with TemporaryDirectory() as tmp:
+            pack = Path(tmp) / "tiles.pack"
+            red, blue = make_png(), make_png(color="blue")
+            pack.write_bytes(red + blue)
+
+            img = TileImage.from_file(self.tile, pack, offset=len(red), length=len(blue))
+            assert img.size == (256, 256)
+            assert not img.decoded
+            assert img.data == blue
+            assert img.image.getpixel((0, 0)) == (0, 0, 255)
+            assert img.decoded
+
+            # reading the header or the bytes keeps pixels decoded elsewhere
+            other = TileImage.from_file(self.tile, pack, offset=len(red), length=len(blue))
+            decoded = Image.new("RGB", (256, 256), "blue")
+            other.set_decoded(decoded)
+            assert other.data == blue and other._fp is None
+            assert other.decoded and other.image is decoded
+
+            img.release()
+            assert not img.decoded and img._fp is None
+            assert img.image.size == (256, 256)
+            img.release()
+
+    def test_mosaic_releases_tiles(self):
+        from tilegrab.images import TileImageCollection, mosaic
+
+        images = [TileImage(Tile(z=10, x=x, y=2, source=OSM()), make_png(), lazy=True) for x in (1, 2)]
+        out = mosaic(TileImageCollection(path=".", images=images))
+        assert out.size == (512, 256)
+        assert not any(i.decoded for i in images)
+
+    def test_mosaic_array(self):
+        import rasterio
+        from tilegrab.images import ExportType, TileImageCollection, export_image, group_image, mosaic, mosaic_array
+
+        colors = {(1, 2): "red", (2, 2): "blue", (1, 3): "green", (2, 3): "white"}
+        def collection():
+            return TileImageCollection(path=".", images=[
+                TileImage(Tile(z=10, x=x, y=y, source=OSM()), make_png(color=c), lazy=True)
+                for (x, y), c in colors.items()])
+
+        expected = np.asarray(mosaic(collection())).transpose(2, 0, 1)
+        for kwargs in ({"workers": 1}, {"workers": 4}, {"processes": 2}):
+            images = collection()
+            canvas = mosaic_array(images, **kwargs)
+            assert canvas.shape == (3, 512, 512) and canvas.dtype == np.uint8
+            assert (canvas == expected).all()
+            assert not any(i.decoded for i in images)
+
+        # file-backed tiles are read by the pool processes themselves
+        with TemporaryDirectory() as tmp:
+            pack, placed, offset = Path(tmp) / "tiles.pack", [], 0
+            with open(pack, "wb") as f:
+                for (x, y), c in colors.items():
+                    data = make_png(color=c)
+                    f.write(data)
+                    placed.append(TileImage.from_file(Tile(z=10, x=x, y=y, source=OSM()), pack, offset, len(data)))
+                    offset += len(data)
+            canvas = mosaic_array(TileImageCollection(path=".", images=placed), processes=1)
+            assert (canvas == expected).all()
+
+        groups = list(group_image(canvas, tile_w=256, tile_h=256, group_w=1, group_h=2))
+        assert [g.shape for g in groups] == [(3, 512, 256)] * 2
+        assert np.shares_memory(groups[0], canvas)
+
+        with TemporaryDirectory() as tmp:
+            export_image([canvas], Path(tmp), collection().bounds, [ExportType.TIFF, ExportType.PNG])
+            with rasterio.open(Path(tmp) / "mosaic.tiff") as src:
+                assert (src.read() == expected).all()
+            assert (np.asarray(Image.open(Path(tmp) / "mosaic.png")).transpose(2, 0, 1) == expected).all()
+
+            export_image(groups, Path(tmp) / "parts", collection().bounds, [ExportType.PNG])
+            assert sorted(p.name for p in (Path(tmp) / "parts").iterdir()) == ["1_mosaic.png", "2_mosaic.png"]
+
+    def test_export_groups(self):
+        import rasterio
+        from tilegrab.images import ExportType, TileImageCollection, export_groups, mosaic_array, plan_groups
+
+        # 5x3 tiles with the bottom-right 2x1 block missing
+        colors = ["red", "blue", "green", "white", "yellow"]
+        def collection():
+            return TileImageCollection(path=".", images=[
+                TileImage(Tile(z=10, x=x, y=y, source=OSM()), make_png(color=colors[(x + y) % 5]), lazy=True)
+                for x in range(10, 15) for y in range(20, 23) if not (x >= 13 and y == 22)])
+
+        groups = plan_groups(collection(), 2, 2)
+        assert [(g.minx, g.miny, g.maxx, g.maxy) for g in groups] == [
+            (10, 20, 11, 21), (12, 20, 13, 21), (14, 20, 14, 21), (10, 22, 11, 22), (12, 22, 13, 22)]
+        assert [len(g.images) for g in groups] == [4, 4, 2, 2, 1]
+
+        overlapping = plan_groups(collection(), 2, 2, overlap=True)
+        assert (overlapping[0].maxx, overlapping[0].maxy, len(overlapping[0].images)) == (12, 22, 9)
+        assert len(plan_groups(collection(), 10, 10)) == 1
+
+        images = collection()
+        canvas = mosaic_array(collection())
+        with TemporaryDirectory() as tmp:
+            assert export_groups(images, Path(tmp), 2, 2, [ExportType.TIFF], overlap=True) == 5
+            assert sorted(p.name for p in (Path(tmp) / "groups").iterdir()) == [
+                f"{n}_mosaic.tiff" for n in range(1, 6)]
+            with rasterio.open(Path(tmp) / "groups" / "2_mosaic.tiff") as src:
+                assert (src.width, src.height) == (768, 768)
+                b = overlapping[1].bounds(10)
+                assert np.allclose(tuple(src.bounds), (b.minx, b.miny, b.maxx, b.maxy))
+                assert (src.read() == canvas[:, :768, 512:1280]).all()
+        assert not any(i.decoded for i in images)
+
+    def test_export_pipeline(self):
+        import rasterio
+        from tilegrab.dataset import Coordinate
+        from tilegrab.images import ExportType
+        from tilegrab.images.encoder import ExportPipeline
+
+        rng = np.random.default_rng(0)
+        canvas = np.repeat(rng.integers(0, 255, (3, 64, 512), dtype=np.uint8), 8, axis=1)
+        bounds = Coordinate(0.0, 0.0, 512.0, 512.0)
+        formats = [ExportType.PNG, ExportType.JPG, ExportType.TIFF]
+
+        with TemporaryDirectory() as tmp:
+            for profile in ("fast", "small"):
+                out = Path(tmp) / profile
+                out.mkdir()
+                with ExportPipeline(formats, profile=profile, processes=2, max_pending_bytes=canvas.nbytes) as pipeline:
+                    for n in range(3):
+                        pipeline.submit(canvas, out, f"{n}_mosaic", bounds)
+                assert len(list(out.iterdir())) == 9
+
+            with rasterio.open(Path(tmp) / "small" / "2_mosaic.tiff") as src:
+                assert (src.read() == canvas).all()
+                assert src.bounds == (0.0, 0.0, 512.0, 512.0)
+            assert (np.asarray(Image.open(Path(tmp) / "fast" / "0_mosaic.png")).transpose(2, 0, 1) == canvas).all()
+            for ext in ("png", "jpg", "tiff"):
+                small = (Path(tmp) / "small" / f"0_mosaic.{ext}").stat().st_size
+                assert small < (Path(tmp) / "fast" / f"0_mosaic.{ext}").stat().st_size
+
+            with self.assertRaises(FileNotFoundError):
+                with ExportPipeline([ExportType.PNG], processes=2) as pipeline:
+                    pipeline.submit(canvas, Path(tmp) / "missing", "mosaic", bounds)
+            with self.assertRaises(ValueError):
+                ExportPipeline(formats, profile="tiny")
+
+            # a canvas mosaic_array placed in shared memory is encoded in place, not copied
+            from tilegrab.images import TileImageCollection, mosaic_array
+            import tilegrab.images.encoder as encoder
+            images = TileImageCollection(path=".", images=[
+                TileImage(Tile(z=10, x=x, y=2, source=OSM()), make_png(color=c), lazy=True)
+                for x, c in ((1, "red"), (2, "blue"))])
+            shared = mosaic_array(images, processes=1)
+            out = Path(tmp) / "shared"
+            out.mkdir()
+            with patch.object(encoder.shared_memory, "SharedMemory", wraps=encoder.shared_memory.SharedMemory) as shm:
+                with ExportPipeline(formats, processes=2) as pipeline:
+                    pipeline.submit(shared, out, "mosaic", bounds)
+                assert not any(call.kwargs.get("create") for call in shm.call_args_list)
+                assert pipeline._pending_bytes == 0
+            assert (np.asarray(Image.open(out / "mosaic.png")).transpose(2, 0, 1) == shared).all()
+
+    def test_512px_tiles(self):
+        from tilegrab.images import TileImageCollection, mosaic, mosaic_array
+
+        buf = BytesIO()
+        Image.new("RGB", (512, 512), color="blue").save(buf, format="PNG")
+        images = [TileImage(Tile(z=11, x=x, y=4, source=OSM()), buf.getvalue(), lazy=True) for x in (1, 2)]
+        assert (images[0].width, images[0].height) == (512, 512)
+        assert not images[0].decoded and images[0]._img is None
+
+        collection = TileImageCollection(path=".", images=images)
+        assert (collection.width, collection.height) == (1024, 512)
+        assert mosaic(collection).size == (1024, 512)
+        assert mosaic_array(collection).shape == (3, 512, 1024)
+
+    def test_write_geotiff_in_bands(self):
+        import rasterio
+        from tilegrab.images import TileImageCollection, mosaic, write_geotiff
+
+        colors = {(1, 2): "red", (2, 2): "blue", (1, 3): "green", (1, 4): "white"}
+        images = [TileImage(Tile(z=10, x=x, y=y, source=OSM()), make_png(color=c), lazy=True)
+                  for (x, y), c in colors.items()]
+        collection = TileImageCollection(path=".", images=images)
+
+        with TemporaryDirectory() as tmp:
+            out = write_geotiff(collection, Path(tmp) / "mosaic.tiff", band_size=2)
+            with rasterio.open(out) as src:
+                assert (src.width, src.height, src.count) == (512, 768, 3)
+                assert src.crs.to_epsg() == 3857
+                assert src.bounds.left == collection.bounds.minx
+                data = src.read()
+
+        expected = mosaic(collection)
+        assert (data.transpose(1, 2, 0) == np.asarray(expected)).all()
+        assert not any(i.decoded for i in images)
+
+    def test_write_cog(self):
+        import rasterio
+        from tilegrab.images import TileImageCollection, write_cog
+
+        images = [TileImage(Tile(z=10, x=x, y=y, source=OSM()), make_png(), lazy=True)
+                  for x in range(1, 5) for y in range(1, 5)]
+        collection = TileImageCollection(path=".", images=images)
+
+        with TemporaryDirectory() as tmp:
+            out = write_cog(collection, Path(tmp) / "mosaic.tif", compress="jpeg", workers=2)
+            with rasterio.open(out) as src:
+                assert src.profile["compress"] == "jpeg"
+                assert src.block_shapes[0] == (256, 256)
+                assert src.overviews(1) == [2, 4]
+            assert [p.name for p in Path(tmp).iterdir()] == ["mosaic.tif"]
+
+        with self.assertRaises(ValueError):
+            write_cog(collection, Path("x.tif"), compress="lzma")
+
+    def test_update_geotiff(self):
+        import rasterio
+        from tilegrab.images import TileImageCollection, update_geotiff, write_cog
+
+        def images(changed=None):
+            return [TileImage(Tile(z=10, x=x, y=y, source=OSM()), make_png("blue" if (x, y) == changed else "red"), lazy=True)
+                    for x in range(1, 5) for y in range(1, 5)]
+
+        with TemporaryDirectory() as tmp:
+            out = write_cog(TileImageCollection(path=".", images=images()), Path(tmp) / "mosaic.tif")
+            expected = write_cog(TileImageCollection(path=".", images=images((2, 3))), Path(tmp) / "full.tif")
+
+            update_geotiff([i for i in images((2, 3)) if (i.index.x, i.index.y) == (2, 3)], out)
+            for level in (None, 0, 1):
+                kwargs = {} if level is None else {"overview_level": level}
+                with rasterio.open(out, **kwargs) as a, rasterio.open(expected, **kwargs) as b:
+                    assert (a.read() == b.read()).all()
+
+            with self.assertRaises(ValueError):
+                update_geotiff([TileImage(Tile(z=10, x=9, y=1, source=OSM()), make_png(), lazy=True)], out)
+            with self.assertRaises(ValueError):
+                update_geotiff([TileImage(Tile(z=11, x=2, y=2, source=OSM()), make_png(), lazy=True)], out)
+
+    def test_write_vrt(self):
+        import rasterio
+        from tilegrab.images import TileImageCollection, write_vrt
+
+        tiles = {
+            (1, 2): Image.new("RGB", (256, 256), "red"),
+            (2, 2): Image.new("RGB", (256, 256), "blue").convert("P"),
+            (1, 3): Image.new("L", (256, 256), 128),
+        }
+        with TemporaryDirectory() as tmp:
+            tile_dir = Path(tmp) / "tiles"
+            tile_dir.mkdir()
+            for (x, y), img in tiles.items():
+                img.save(tile_dir / f"10_{x}_{y}.png")
+
+            images = load_images(tile_dir, [Tile(z=10, x=x, y=y, source=OSM()) for x, y in tiles])
+            collection = TileImageCollection(path=tile_dir, images=images)
+            out = write_vrt(collection, Path(tmp) / "out" / "mosaic.vrt", world_files=True)
+
+            with rasterio.open(out) as src:
+                assert src.crs.to_epsg() == 3857
+                assert src.bounds.left == collection.bounds.minx
+                data = src.read()
+            assert list(data[:, 0, 0]) == [255, 0, 0]
+            assert list(data[:, 0, 300]) == [0, 0, 255]
+            assert list(data[:, 300, 0]) == [128, 128, 128]
+            assert list(data[:, 300, 300]) == [0, 0, 0]
+
+            with rasterio.open(tile_dir / "10_1_2.png") as src:
+                assert src.transform.c == collection.bounds.minx
+
+            # world files next to the tiles are not indexed as tiles
+            assert (tile_dir / "10_1_2.pgw").is_file()
+            index = index_tiles(tile_dir)
+            assert {f.suffix for f in index.values()} == {".png"}
+            reloaded = load_images(tile_dir, [Tile(z=10, x=x, y=y, source=OSM()) for x, y in tiles], index=index)
+            assert [img.image.size for img in reloaded] == [(256, 256)] * 3
+
+
+class LoaderTest(unittest.TestCase):
+
+    def test_load_images_indexed(self):
+        with TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for name in ("10_1_2.png", "10_1_3.png", "notes.txt", "10_1_x.png"):
+                (root / name).write_bytes(make_png())
+
+            index = index_tiles(root)
+            assert set(index) == {TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)}
+
+            tiles = [Tile(z=10, x=1, y=y, source=OSM()) for y in (3, 2, 4)]
+            images = load_images(root, tiles)
+            assert [i.tile.index.y for i in images] == [3, 2]
+            assert not images[0].decoded
+            assert images[0].path == root
+            assert images[0].image.size == (256, 256)
+            images[0].save()
+            images[0].release()
+
+
+if __name__ == "__main__":
+    unittest.main()
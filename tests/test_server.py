@@ -0,0 +1,126 @@
+from pathlib import Path
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from tempfile import TemporaryDirectory
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from PIL import Image
+from io import BytesIO
+
+from requests import Session
+
+from tilegrab.server import SingleFlight, TileProxy, TileProxyServer
+
+
+def tile_response(fmt="PNG"):
+    buf = BytesIO()
+    Image.new("RGB", (256, 256), color="red").save(buf, format=fmt)
+    response = MagicMock()
+    response.headers = {"content-type": f"image/{fmt.lower()}"}
+    response.content = buf.getvalue()
+    return response
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_calls_coalesce(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return "tile"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False] + [True] * 7
+        assert all(r == "tile" for r, _ in results)
+
+    def test_exception_propagates(self):
+        flight = SingleFlight()
+
+        def fn():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("k", fn)
+        # the key is released after a failure
+        assert flight.do("k", lambda: 1) == (1, False)
+
+
+class TileProxyTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.tile_dir = Path(self._tmp.name)
+
+    def test_miss_then_hit(self):
+        with patch.object(Session, "get", return_value=tile_response()) as get:
+            proxy = TileProxy(self.tile_dir)
+            data, state = proxy.get("osm", 10, 1, 2)
+            assert state == "MISS" and data
+            data, state = proxy.get("osm", 10, 1, 2)
+            assert state == "HIT" and data
+
+        assert get.call_count == 1
+        assert (self.tile_dir / "osm" / "10_1_2.png").is_file()
+
+    def test_upstream_format_kept(self):
+        response = tile_response("JPEG")
+        with patch.object(Session, "get", return_value=response):
+            proxy = TileProxy(self.tile_dir)
+            data, state = proxy.get("esri_wi", 10, 1, 2)
+            assert data == response.content
+
+        assert (self.tile_dir / "esri_wi" / "10_1_2.jpg").read_bytes() == response.content
+        assert not (self.tile_dir / "esri_wi" / "10_1_2.png").exists()
+        assert TileProxy(self.tile_dir).get("esri_wi", 10, 1, 2) == (response.content, "HIT")
+
+    def test_http_routes(self):
+        with patch.object(Session, "get", return_value=tile_response()) as get:
+            server = TileProxyServer(("127.0.0.1", 0), TileProxy(self.tile_dir))
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+
+            with urlopen(f"{base}/osm/0/0/0.png") as resp:
+                assert resp.status == 200
+                assert resp.headers["content-type"] == "image/png"
+                assert resp.headers["X-Tilegrab-Cache"] == "MISS"
+                Image.open(BytesIO(resp.read())).verify()
+
+            with urlopen(f"{base}/osm/0/0/0") as resp:
+                assert resp.headers["X-Tilegrab-Cache"] == "HIT"
+
+            get.return_value = tile_response("JPEG")
+            with urlopen(f"{base}/osm/1/0/0") as resp:
+                assert resp.headers["content-type"] == "image/jpeg"
+
+            for path, status in (("/nope/1/0/0", 404), ("/osm/1/2/0", 400), ("/osm/x", 404)):
+                with self.assertRaises(HTTPError) as ctx:
+                    urlopen(base + path)
+                assert ctx.exception.code == status
+
+            with urlopen(f"{base}/metrics") as resp:
+                assert b'tilegrab_download_tiles_total{status="SUCCESS"} 2' in resp.read()
+
+        assert get.call_count == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
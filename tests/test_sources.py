@@ -32,5 +32,30 @@ class TileSourceTest(unittest.TestCase):
 
             assert url.count("/1/1/1") == 1 or url.count("&x=1&y=1&z=1") == 1, f"Invalid url generation {source.name}. {url}"
 
+    def test_high_dpi_tiles(self):
+        assert OSM().zoom_offset == 0 and OSM().tile_pixels == 256
+
+        google = GoogleSat(scale=2)
+        assert google.tile_pixels == 512 and google.zoom_offset == 1
+        assert google.get_url(1, 1, 1).endswith("&scale=2")
+        assert google.id == "gsat@2x" != GoogleSat().id
+
+        class Retina(TileSource):
+            name = "Retina"
+            uid = "retina"
+            url_template = "https://tiles.example.com/{z}/{x}/{y}{r}.png"
+            max_scale = 2
+
+        class Native512(TileSource):
+            uid = "native"
+            tile_size = 512
+
+        assert Retina().get_url(3, 1, 2) == "https://tiles.example.com/3/1/2.png"
+        assert Retina(scale=2).get_url(3, 1, 2) == "https://tiles.example.com/3/1/2@2x.png"
+        assert Native512().zoom_offset == 1 and Native512().id == "native"
+        with self.assertRaises(ValueError):
+            OSM(scale=2)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+from pathlib import Path
+import sqlite3
+import unittest
+from unittest.mock import MagicMock, patch
+from tempfile import TemporaryDirectory
+from PIL import Image
+from io import BytesIO
+
+from requests import Session
+
+import tilegrab.store.pmtiles as pmtiles
+from tilegrab.downloader import Downloader, DownloadConfig, ProgressStore
+from tilegrab.images import build_pyramid
+from tilegrab.images.loader import load_images_from_store
+from tilegrab.sources import OSM
+from tilegrab.images.loader import index_tiles
+from tilegrab.store import DirectoryTileStore, MBTilesStore, PMTilesStore, get_layout, tileid_to_zxy, zxy_to_tileid
+from tilegrab.tiles import Tile, TileIndex, TilesByIndex
+
+
+def make_png(color="red") -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (256, 256), color=color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TileStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.root = Path(self._tmp.name)
+
+    def test_tile_ids(self):
+        assert [zxy_to_tileid(*t) for t in [(0, 0, 0), (1, 0, 0), (1, 0, 1), (1, 1, 1), (1, 1, 0), (2, 0, 0)]] == [0, 1, 2, 3, 4, 5]
+        for z, x, y in [(12, 3423, 1763), (20, 1, 1048575), (5, 31, 0)]:
+            assert tileid_to_zxy(zxy_to_tileid(z, x, y)) == (z, x, y)
+
+    def test_directory_store(self):
+        store = DirectoryTileStore(self.root)
+        store.put(TileIndex(x=1, y=2, z=10), b"\xff\xd8\xff jpeg")
+        assert (self.root / "10_1_2.jpg").is_file()
+        assert TileIndex(x=1, y=2, z=10) in DirectoryTileStore(self.root)
+
+    def test_directory_layouts(self):
+        indices = [TileIndex(x=x, y=y, z=z) for z in (3, 12) for x in range(4) for y in range(3)]
+        for layout, expected in [("flat", "12_1_2.png"), ("zxy", "12/1/2.png"), ("hashed", "12_1_2.png")]:
+            root = self.root / layout
+            store = DirectoryTileStore(root, layout)
+            for index in indices:
+                store.put(index, make_png())
+
+            assert get_layout(layout).relpath(TileIndex(x=1, y=2, z=12), "png").endswith(expected)
+            # unrelated files and directories are not mistaken for tiles
+            (root / "shard-1-of-2").mkdir()
+            (root / "shard-1-of-2" / "12_0_0.png").write_bytes(b"")
+            (root / "notes.txt").write_text("")
+            world = root / get_layout(layout).relpath(TileIndex(x=1, y=2, z=12), "pgw")
+            world.write_text("")
+
+            index = index_tiles(root, layout)
+            assert set(index) == set(indices)
+            assert index[TileIndex(x=1, y=2, z=12)] == root / get_layout(layout).relpath(TileIndex(x=1, y=2, z=12), "png")
+
+        assert len({p.parent for p in index_tiles(self.root / "hashed", "hashed").values()}) > 1
+        with self.assertRaises(ValueError):
+            get_layout("nested")
+
+    def test_mbtiles_store(self):
+        path = self.root / "tiles.mbtiles"
+        store = MBTilesStore(path, batch_size=2)
+        store.put(TileIndex(x=1, y=0, z=2), make_png())
+        store.put(TileIndex(x=2, y=3, z=2), make_png("blue"))
+        store.put(TileIndex(x=0, y=0, z=0), make_png())
+        assert store.get(TileIndex(x=2, y=3, z=2)) == make_png("blue")
+        store.close()
+
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        # TMS rows: y=0 at z=2 is row 3
+        assert conn.execute("SELECT tile_row FROM tiles WHERE zoom_level=2 AND tile_column=1").fetchone() == (3,)
+        meta = dict(conn.execute("SELECT name, value FROM metadata"))
+        assert meta["format"] == "png" and meta["minzoom"] == "0" and meta["maxzoom"] == "2"
+
+        reopened = MBTilesStore(path)
+        assert set(reopened.indices()) == {TileIndex(1, 0, 2), TileIndex(2, 3, 2), TileIndex(0, 0, 0)}
+        reopened.close()
+
+    def test_pmtiles_store(self):
+        path = self.root / "tiles.pmtiles"
+        tiles = {TileIndex(x=x, y=y, z=6): make_png("red" if (x + y) % 2 else "blue")
+                 for x in range(10, 20) for y in range(5, 15)}
+
+        with patch.object(pmtiles, "ROOT_MAX_BYTES", 64):
+            store = PMTilesStore(path)
+            for index, data in tiles.items():
+                store.put(index, data)
+            store.close()
+
+            with open(path, "rb") as f:
+                header = pmtiles._HEADER.unpack(f.read(pmtiles.HEADER_SIZE))
+            assert header[0] == b"PMTiles\x03"
+            assert header[6] > 0  # leaf directories
+            assert header[9:12] == (100, 100, 2)  # addressed, entries, unique contents
+
+            store = PMTilesStore(path)
+            store.put(TileIndex(x=0, y=0, z=0), make_png("white"))
+            store.close()
+
+        store = PMTilesStore(path)
+        assert len(store) == 101
+        assert store.get(TileIndex(x=11, y=5, z=6)) == make_png("blue")
+        assert list(store.indices())[0] == TileIndex(x=0, y=0, z=0)
+
+        img = store.load(Tile(x=12, y=5, z=6, source=OSM()))
+        assert img.image.getpixel((0, 0)) == (255, 0, 0)
+        img.release()
+        assert not path.with_name(path.name + ".spool").exists()
+
+
+class PyramidTest(unittest.TestCase):
+
+    def test_build_pyramid(self):
+        with TemporaryDirectory() as tmp:
+            store = DirectoryTileStore(tmp)
+            colors = {(0, 0): (200, 0, 0), (1, 0): (0, 200, 0), (0, 1): (0, 0, 200), (1, 1): (100, 100, 100)}
+            for (x, y), color in colors.items():
+                store.put(TileIndex(x=x + 8, y=y + 4, z=12), make_png(color))
+            # a lone tile elsewhere leaves three of its parent's quarters empty
+            store.put(TileIndex(x=21, y=9, z=12), make_png())
+            store.put(TileIndex(x=5, y=2, z=11), make_png("white"))
+
+            progress = ProgressStore(tmp)
+            built = build_pyramid(store, min_zoom=10, progress_store=progress, source_id="osm")
+            assert built == 4
+
+            with Image.open(BytesIO(store.get(TileIndex(x=4, y=2, z=11)))) as parent:
+                assert parent.size == (256, 256)
+                assert parent.getpixel((10, 10))[:3] == (200, 0, 0)
+                assert parent.getpixel((200, 200))[:3] == (100, 100, 100)
+            with Image.open(BytesIO(store.get(TileIndex(x=10, y=4, z=11)))) as parent:
+                assert parent.getpixel((200, 200)) == (255, 0, 0, 255)
+                assert parent.getpixel((10, 10))[3] == 0
+            # existing parents are kept
+            with Image.open(BytesIO(store.get(TileIndex(x=5, y=2, z=11)))) as parent:
+                assert parent.getpixel((0, 0)) == (255, 255, 255)
+
+            assert {i.z for i in store.indices()} == {10, 11, 12}
+            progress = ProgressStore(tmp)
+            assert progress.progress_by_tile(TileIndex(x=2, y=1, z=10)).saved
+            with self.assertRaises(ValueError):
+                build_pyramid(store, min_zoom=12)
+
+
+class DownloaderStoreTest(unittest.TestCase):
+
+    def test_download_into_container_and_resume(self):
+        response = MagicMock()
+        response.headers = {"content-type": "image/png"}
+        response.content = make_png()
+
+        indices = [TileIndex(x=1, y=2, z=10), TileIndex(x=1, y=3, z=10)]
+        with TemporaryDirectory() as tmp, patch.object(Session, "get", return_value=response) as get:
+            for _ in range(2):
+                store = PMTilesStore(Path(tmp) / "tiles.pmtiles")
+                dl = Downloader(
+                    tile_collection=TilesByIndex(indices, tile_source=OSM()),
+                    config=DownloadConfig(),
+                    tile_dir=Path(tmp),
+                    store=store)
+                assert len(dl.run(parallel_download=False, show_progress=False)) == 2
+                store.close()
+
+            assert get.call_count == 2
+            assert not list(Path(tmp).glob("*.png"))
+
+            store = PMTilesStore(Path(tmp) / "tiles.pmtiles")
+            tiles = [Tile(x=i.x, y=i.y, z=i.z, source=OSM()) for i in indices]
+            assert len(load_images_from_store(store, tiles)) == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
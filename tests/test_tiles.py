@@ -49,6 +49,22 @@ class TileTest(unittest.TestCase):
         assert tiles.source_id == osm.id
         assert tiles.geo_dataset is self.mock_ds
 
+    def test_tiles_at_512px(self):
+        from tilegrab.sources import GoogleSat
+        from tilegrab.tiles import TilesByIndex
+
+        tiles_256 = TilesByBBox(geo_dataset=self.mock_ds, tile_source=OSM(), zoom=14, safe_limit=1000)
+        tiles_512 = TilesByBBox(geo_dataset=self.mock_ds, tile_source=GoogleSat(scale=2), zoom=14, safe_limit=1000)
+        assert tiles_512.zoom == 13
+        assert all(t.index.z == 13 for t in tiles_512)
+        assert len(tiles_512) < len(tiles_256) / 3
+
+        by_index = TilesByIndex([TileIndex(x=1, y=2, z=11)], tile_source=GoogleSat(scale=2))
+        assert by_index.zoom == 11 and by_index[0].index == TileIndex(x=1, y=2, z=11)
+
+        with self.assertRaises(ValueError):
+            TilesByBBox(geo_dataset=self.mock_ds, tile_source=GoogleSat(scale=2), zoom=0)
+
     def test_tiles_by_bbox_to_list(self):
         osm = OSM()
         tiles = TilesByBBox(
@@ -151,5 +167,26 @@ class TileTest(unittest.TestCase):
         for i, t in enumerate(tiles):
             assert t.need_download == False 
 
+    def test_shard_partitions_tiles(self):
+        full = TilesByBBox(
+            geo_dataset=self.mock_ds, 
+            tile_source=OSM(), 
+            zoom=12)
+        keys = {t.index for t in full}
+
+        seen = set()
+        for i in range(3):
+            shard = TilesByBBox(
+                geo_dataset=self.mock_ds, 
+                tile_source=OSM(), 
+                zoom=12)
+            shard.shard(i, 3)
+            shard_keys = {t.index for t in shard}
+            assert len(shard) == len(shard_keys)
+            assert not (seen & shard_keys)
+            seen |= shard_keys
+
+        assert seen == keys
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file